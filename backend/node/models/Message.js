@@ -57,6 +57,9 @@ const messageSchema = new mongoose.Schema(
   }
 );
 
+// Keyset scans in createdAt order, used by the Python rollup and search index jobs
+messageSchema.index({ createdAt: 1, _id: 1 }, { name: 'createdAt_id' });
+
 // Middleware to set fileUrl to null if messageType is text
 messageSchema.pre('save', function (next) {
   if (this.messageType === 'text') {
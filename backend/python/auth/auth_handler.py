@@ -1,7 +1,8 @@
 import os
 import time
 import jwt
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +10,10 @@ load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 
+# Verified tokens are cached so reconnecting clients skip signature checks
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+_token_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # token -> (user_id, expires)
+
 def token_response(token: str):
     return {
         "access_token": token,
@@ -43,4 +48,27 @@ def verify_token(token: str) -> Optional[str]:
     decoded_token = decode_jwt(token)
     if decoded_token:
         return decoded_token["user_id"]
-    return None 
\ No newline at end of file
+    return None
+
+def verify_token_cached(token: str) -> Optional[str]:
+    """
+    Verify a JWT token, reusing the result of an earlier verification
+    until the token expires
+    """
+    cached = _token_cache.get(token)
+    if cached:
+        user_id, expires = cached
+        if expires >= time.time():
+            _token_cache.move_to_end(token)
+            return user_id
+        del _token_cache[token]
+
+    decoded_token = decode_jwt(token)
+    if not decoded_token:
+        return None
+
+    user_id = decoded_token["user_id"]
+    _token_cache[token] = (user_id, decoded_token["expires"])
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return user_id
@@ -0,0 +1,142 @@
+"""
+Compare the batch AI endpoints with calling the per-item endpoints once per text.
+
+    python benchmarks/ai_batch.py --texts 50 --rounds 20
+    python benchmarks/ai_batch.py --mongomock
+    python benchmarks/ai_batch.py --url http://localhost:8000 --chat-id <id> --user-id <id>
+
+Smart replies are ranked against a chat: with --mongomock one is seeded and
+its reply index built, otherwise --chat-id and --user-id name a real chat
+and one of its members.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Tuple
+
+from common import ServerThread, environment, install_mongomock, load_app, report, summarize
+from seed_data import seed
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+SAMPLE_MESSAGES = [
+    "Hello! How are you doing today?",
+    "Thanks so much, that was an amazing presentation",
+    "Can we discuss the meeting notes tomorrow?",
+    "No, I think the numbers are wrong again",
+    "Congrats on the new job, let's celebrate with a party",
+    "I'm so tired, going to bed early tonight",
+    "That movie was terrible, worst film this year",
+    "Do you want to grab coffee after work?",
+    "lol that was funny haha",
+    "Sorry I'm late, traffic was horrible",
+]
+
+# (per-item path, query parameter, batch path, batch field)
+ENDPOINTS = {
+    "text_analysis": ("/api/ai/text-analysis", "text", "/api/ai/text-analysis/batch", "texts"),
+    "smart_reply": ("/api/ai/smart-reply", "message_content", "/api/ai/smart-reply/batch", "messages"),
+    "emoji_suggestion": ("/api/ai/emoji-suggestion", "text", "/api/ai/emoji-suggestion/batch", "texts"),
+}
+
+def make_texts(count: int, rng: random.Random) -> List[str]:
+    texts = []
+    for _ in range(count):
+        words = " ".join(rng.choice(SAMPLE_MESSAGES) for _ in range(rng.randint(1, 3)))
+        texts.append(words)
+    return texts
+
+async def measure(http, headers, texts: List[str], rounds: int, chat_id: str) -> Dict[str, Dict]:
+    results = {}
+    for name, (item_path, param, batch_path, field) in ENDPOINTS.items():
+        item_times, batch_times = [], []
+        for _ in range(rounds):
+            extra = {"chat_id": chat_id} if name == "smart_reply" else {}
+
+            started = time.perf_counter()
+            for text in texts:
+                response = await http.post(item_path, params={param: text, **extra}, headers=headers)
+                response.raise_for_status()
+            item_times.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            response = await http.post(batch_path, json={field: texts, **extra}, headers=headers)
+            response.raise_for_status()
+            batch_times.append((time.perf_counter() - started) * 1000)
+
+        item_summary, batch_summary = summarize(item_times), summarize(batch_times)
+        results[name] = {
+            "per_item_ms": item_summary,
+            "batch_ms": batch_summary,
+            "speedup_p50": round(item_summary["p50"] / batch_summary["p50"], 1) if batch_summary["p50"] else None
+        }
+    return results
+
+def seed_chat(args) -> Tuple[str, str]:
+    """
+    Seed an in-memory database and build the reply index of its busiest chat.
+    Returns that chat's ID and one of its members.
+    """
+    from services.reply_ranker import reply_ranker
+
+    ids = seed(install_mongomock(), users=50, chats=20, messages=args.messages, calls=0, logins=0, seed_value=args.seed, verbose=False)
+    # Seeded traffic is skewed towards the first chats
+    chat_id = ids["chat_ids"][0]
+    reply_ranker.build(chat_id, full=True)
+    return chat_id, ids["chat_members"][chat_id][0]
+
+async def run(args, base_url: str, chat_id: str, user_id: str) -> Dict:
+    import httpx
+    from auth.auth_handler import sign_jwt
+
+    headers = {"Authorization": f"Bearer {sign_jwt(user_id)['access_token']}"}
+    texts = make_texts(args.texts, random.Random(args.seed))
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        metrics = await measure(http, headers, texts, args.rounds, chat_id)
+    return {
+        "benchmark": "ai_batch",
+        "environment": environment(),
+        "parameters": {"texts": args.texts, "rounds": args.rounds, "seed": args.seed, "mongomock": args.mongomock},
+        "metrics": metrics
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch vs per-item AI endpoint benchmark")
+    parser.add_argument("--texts", type=int, default=50, help="Texts per batch")
+    parser.add_argument("--rounds", type=int, default=20, help="Repetitions per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory database with a seeded chat (in-process only)")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages seeded with --mongomock")
+    parser.add_argument("--chat-id", default="benchmark", help="Chat for smart replies without --mongomock")
+    parser.add_argument("--user-id", default="benchmark-user", help="Member of --chat-id the requests are made as")
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the in-process server")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/ai_batch-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    chat_id, user_id = args.chat_id, args.user_id
+    if args.mongomock:
+        if args.url:
+            raise SystemExit("--mongomock serves in-process and cannot be combined with --url")
+        chat_id, user_id = seed_chat(args)
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        server = ServerThread(load_app(), port=args.port)
+        server.start()
+        base_url = server.url
+
+    try:
+        results = asyncio.run(run(args, base_url, chat_id, user_id))
+    finally:
+        if server:
+            server.stop()
+    report("ai_batch", results, args.output, args.baseline)
+
+if __name__ == "__main__":
+    main()
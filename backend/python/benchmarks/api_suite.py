@@ -0,0 +1,172 @@
+"""
+End-to-end API benchmark: seed synthetic data, then drive each router's
+workloads (see workloads.py) at a fixed concurrency and report throughput,
+latency percentiles, errors and memory per workload.
+
+    python benchmarks/api_suite.py --mongomock --users 500 --messages 20000
+    python benchmarks/api_suite.py --mongo-uri mongodb://localhost:27017 --seed-data --drop --messages 2000000
+    python benchmarks/api_suite.py --mongo-uri mongodb://localhost:27017 --routers analytics,calls --baseline results/api_suite-base.json
+    python benchmarks/api_suite.py --url http://localhost:8000 --mongo-uri mongodb://localhost:27017 --pid 1234
+
+Against --url the server must share this process's JWT_SECRET and read the
+database given by --mongo-uri; --pid reports that server's memory.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from common import ServerThread, environment, install_mongomock, load_app, peak_rss_bytes, raise_open_file_limit, report, rss_bytes, summarize
+from seed_data import check_local, sample_ids, seed
+from workloads import Workload, select
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+async def run_workload(http, workload: Workload, ids: Dict[str, Any], tokens: Dict[str, str], requests: int, concurrency: int, warmup: int, rng: random.Random) -> Dict[str, Any]:
+    from auth.auth_handler import sign_jwt
+
+    def headers(user_id: str) -> Dict[str, str]:
+        if user_id not in tokens:
+            tokens[user_id] = sign_jwt(user_id)["access_token"]
+        return {"Authorization": f"Bearer {tokens[user_id]}"}
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def drive(planned, record: bool):
+        # Clients share one iterator, so at most concurrency requests are in flight
+        queue = iter(planned)
+
+        async def client():
+            for user_id, path, params in queue:
+                started = time.perf_counter()
+                try:
+                    response = await http.request(workload.method, path, params=params, headers=headers(user_id))
+                    status = str(response.status_code)
+                except Exception as e:
+                    status = type(e).__name__
+                if record:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    # Built up front so the random choices are not timed
+    await drive([workload.make(rng, ids) for _ in range(warmup)], False)
+    planned = [workload.make(rng, ids) for _ in range(requests)]
+    started = time.perf_counter()
+    await drive(planned, True)
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "errors": errors,
+        "statuses": statuses
+    }
+
+async def run(args, base_url: str, ids: Dict[str, Any], workloads: List[Workload]) -> Dict[str, Any]:
+    import httpx
+
+    rng = random.Random(args.seed)
+    tokens: Dict[str, str] = {}
+    metrics: Dict[str, Any] = {"workloads": {}}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as http:
+        for workload in workloads:
+            result = await run_workload(http, workload, ids, tokens, args.requests, args.concurrency, args.warmup, rng)
+            result["rss_mb"] = round(rss_bytes(args.pid) / (1024 * 1024), 1)
+            metrics["workloads"][workload.name] = result
+            print(f"{workload.name}: {result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']} ms, p99 {result['latency_ms']['p99']} ms, {result['errors']} errors")
+    if args.pid is None:
+        # The server runs in this process
+        metrics["peak_rss_mb"] = round(peak_rss_bytes() / (1024 * 1024), 1)
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end API benchmark over seeded data")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--mongomock", action="store_true", help="Seed and serve an in-memory database")
+    source.add_argument("--mongo-uri", help="Local MongoDB server holding (or to hold) the seeded data")
+    parser.add_argument("--seed-data", action="store_true", help="Seed --mongo-uri before the run (always done with --mongomock)")
+    parser.add_argument("--drop", action="store_true", help="Replace existing data when seeding")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a non-local --mongo-uri")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=5_000)
+    parser.add_argument("--logins", type=int, default=5_000)
+    parser.add_argument("--routers", default="", help="Comma-separated routers to exercise (default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per workload")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per workload first")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--pid", type=int, help="Process ID of the --url server, for its memory")
+    parser.add_argument("--port", type=int, default=8768, help="Port for the in-process server")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/api_suite-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    workloads = select([name.strip() for name in args.routers.split(",") if name.strip()])
+    raise_open_file_limit()
+
+    if args.mongomock:
+        if args.url:
+            raise SystemExit("--mongomock serves in-process and cannot be combined with --url")
+        database = install_mongomock()
+    else:
+        check_local(args.mongo_uri, args.allow_remote)
+        # Read by db/mongodb.py when the app is imported
+        os.environ["MONGO_URI"] = args.mongo_uri
+        from pymongo import MongoClient
+        database = MongoClient(args.mongo_uri)["chatware"]
+
+    seeded: Optional[Dict[str, Any]] = None
+    if args.mongomock or args.seed_data:
+        seeded = seed(
+            database, users=args.users, chats=args.chats, messages=args.messages, calls=args.calls,
+            logins=args.logins, seed_value=args.seed, drop=args.drop or args.mongomock
+        )
+        ids = seeded
+    else:
+        ids = sample_ids(database)
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        # With --mongomock the database was installed before seeding, so the app is loaded as is
+        server = ServerThread(load_app(), port=args.port)
+        server.start()
+        base_url = server.url
+
+    try:
+        metrics = asyncio.run(run(args, base_url, ids, workloads))
+    finally:
+        if server:
+            server.stop()
+
+    results = {
+        "benchmark": "api_suite",
+        "environment": environment(),
+        "parameters": {
+            "database": "mongomock" if args.mongomock else "mongodb",
+            "dataset": seeded["counts"] if seeded else None,
+            "seed_seconds": seeded["seconds"] if seeded else None,
+            "workloads": [workload.name for workload in workloads],
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed
+        },
+        "metrics": metrics
+    }
+    report("api_suite", results, args.output, args.baseline)
+
+if __name__ == "__main__":
+    main()
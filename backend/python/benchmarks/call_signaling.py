@@ -0,0 +1,220 @@
+"""
+Load test for the call signaling service (routers/call_service.py).
+
+Simulated clients open WebSockets, create calls in groups, join them,
+relay signaling messages around each group and leave. The run reports
+relay latency percentiles, messages/sec, memory per connection and
+server event-loop lag, and saves everything as JSON.
+
+In-process (server on its own thread, in-memory database):
+    python benchmarks/call_signaling.py --mongomock --clients 2000 --group-size 4
+
+Against a running server (JWT_SECRET must match the server's):
+    python benchmarks/call_signaling.py --url http://localhost:8000 --server-pid 1234
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from common import (
+    LoopLagMonitor, ServerThread, environment, load_app, raise_open_file_limit,
+    report, rss_bytes, summarize
+)
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+class SimulatedClient:
+    """
+    One signaling client: a WebSocket plus a reader task that records relay latency
+    """
+
+    def __init__(self, index: int):
+        from auth.auth_handler import sign_jwt
+
+        self.user_id = f"bench-user-{index}"
+        self.token = sign_jwt(self.user_id)["access_token"]
+        self.websocket = None
+        self.latencies: List[float] = []
+        self.received = 0
+        self.events = 0
+        self._reader = None
+
+    async def connect(self, ws_url: str):
+        import websockets
+
+        self.websocket = await websockets.connect(
+            f"{ws_url}/api/calls/ws/{self.user_id}?token={self.token}",
+            max_queue=None
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for data in self.websocket:
+                message = json.loads(data)
+                if message["type"] == "signal":
+                    self.latencies.append((time.perf_counter() - message["sent"]) * 1000)
+                    self.received += 1
+                else:
+                    self.events += 1
+        except Exception:
+            pass
+
+    async def send(self, message: Dict):
+        await self.websocket.send(json.dumps(message))
+
+    async def close(self):
+        if self.websocket:
+            await self.websocket.close()
+        if self._reader:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+async def _bounded(coroutines, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+async def run_benchmark(args, base_url: str, server: Optional[ServerThread]) -> Dict:
+    import httpx
+
+    ws_url = base_url.replace("http", "ws", 1)
+    server_pid = args.server_pid or (os.getpid() if server else None)
+    lag_monitor = LoopLagMonitor()
+    if server:
+        await server.call(_start_monitor(lag_monitor))
+
+    clients = [SimulatedClient(index) for index in range(args.clients)]
+    groups = [clients[i:i + args.group_size] for i in range(0, len(clients), args.group_size)]
+    groups = [group for group in groups if len(group) > 1]
+
+    # Connect phase
+    rss_before = rss_bytes(server_pid) if server_pid else None
+    started = time.perf_counter()
+    await _bounded((client.connect(ws_url) for client in clients), args.connect_concurrency)
+    connect_seconds = time.perf_counter() - started
+    rss_after = rss_bytes(server_pid) if server_pid else None
+
+    # Create and join calls
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+        async def create(group):
+            initiator = group[0]
+            response = await http.post(
+                "/api/calls/create",
+                params={"call_type": "audio"},
+                json=[member.user_id for member in group[1:]],
+                headers={"Authorization": f"Bearer {initiator.token}"}
+            )
+            response.raise_for_status()
+            return response.json()["call_id"]
+
+        started = time.perf_counter()
+        call_ids = await _bounded((create(group) for group in groups), args.connect_concurrency)
+        create_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        member.send({"type": "join_call", "call_id": call_id})
+        for group, call_id in zip(groups, call_ids)
+        for member in group
+    ))
+    join_seconds = time.perf_counter() - started
+
+    # Signaling phase: every member signals the next one in its group
+    async def signal_loop(group: List[SimulatedClient], position: int):
+        sender = group[position]
+        target = group[(position + 1) % len(group)]
+        for _ in range(args.signals):
+            await sender.send({"type": "signal", "target": target.user_id, "sent": time.perf_counter()})
+            if args.interval:
+                await asyncio.sleep(args.interval)
+
+    expected = sum(len(group) for group in groups) * args.signals
+    started = time.perf_counter()
+    await asyncio.gather(*(signal_loop(group, position) for group in groups for position in range(len(group))))
+    deadline = time.monotonic() + args.timeout
+    while sum(client.received for client in clients) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    signal_seconds = time.perf_counter() - started
+    received = sum(client.received for client in clients)
+
+    # Leave and disconnect
+    await asyncio.gather(*(
+        member.send({"type": "leave_call", "call_id": call_id})
+        for group, call_id in zip(groups, call_ids)
+        for member in group
+    ))
+    await _bounded((client.close() for client in clients), args.connect_concurrency)
+
+    loop_lag = await server.call(lag_monitor.stop()) if server else None
+    latencies = [latency for client in clients for latency in client.latencies]
+
+    return {
+        "benchmark": "call_signaling",
+        "environment": environment(),
+        "parameters": {
+            "clients": args.clients,
+            "group_size": args.group_size,
+            "signals_per_client": args.signals,
+            "interval": args.interval,
+            "mode": "url" if args.url else "in-process"
+        },
+        "metrics": {
+            "connect_seconds": round(connect_seconds, 3),
+            "connections_per_sec": round(len(clients) / connect_seconds, 1),
+            "calls_created": len(call_ids),
+            "create_calls_per_sec": round(len(call_ids) / create_seconds, 1) if create_seconds else None,
+            "join_seconds": round(join_seconds, 3),
+            "signals_expected": expected,
+            "signals_received": received,
+            "messages_per_sec": round(received / signal_seconds, 1) if signal_seconds else None,
+            "relay_latency_ms": summarize(latencies),
+            # In-process mode measures the whole process, so this includes client-side sockets
+            "memory_per_connection_kb": round((rss_after - rss_before) / len(clients) / 1024, 2) if server_pid else None,
+            "event_loop_lag_ms": loop_lag
+        }
+    }
+
+async def _start_monitor(monitor: LoopLagMonitor):
+    monitor.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Call signaling load test")
+    parser.add_argument("--clients", type=int, default=1000, help="Number of simulated WebSocket clients")
+    parser.add_argument("--group-size", type=int, default=2, help="Participants per call")
+    parser.add_argument("--signals", type=int, default=20, help="Signaling messages sent by each client")
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between a client's signals")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="Concurrent handshakes/requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for outstanding signals")
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for memory readings")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process server")
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory database (in-process only)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/call_signaling-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        server = ServerThread(load_app(args.mongomock), port=args.port)
+        server.start()
+        base_url = server.url
+
+    try:
+        results = asyncio.run(run_benchmark(args, base_url, server))
+    finally:
+        if server:
+            server.stop()
+    report("call_signaling", results, args.output, args.baseline)
+
+if __name__ == "__main__":
+    main()
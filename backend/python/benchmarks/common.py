@@ -0,0 +1,229 @@
+"""
+Shared helpers for the benchmark scripts: percentiles, memory readings,
+event-loop lag sampling and JSON result files that can be compared
+against a stored baseline.
+"""
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Make the API modules importable when a benchmark is run as a script
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def install_mongomock():
+    """
+    Point db.mongodb at an in-memory mongomock database.
+    Must run before the routers are imported, they bind get_collection at import time.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("mongomock is required for --mongomock (pip install mongomock)")
+    import db.mongodb
+
+    database = mongomock.MongoClient()["chatware"]
+    db.mongodb.get_db_connection = lambda: database
+    db.mongodb.get_collection = lambda collection_name: database[collection_name]
+    return database
+
+def load_app(use_mongomock: bool = False):
+    """
+    Import the FastAPI app the same way run.py serves it
+    """
+    os.chdir(BACKEND_DIR)
+    os.makedirs("uploads", exist_ok=True)
+    if use_mongomock:
+        install_mongomock()
+    import main
+    return main.app
+
+class ServerThread:
+    """
+    Run uvicorn on its own thread and event loop inside this process,
+    so benchmark clients on the main loop do not share the server's loop
+    """
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 8765):
+        import uvicorn
+
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def call(self, coroutine):
+        """
+        Await a coroutine on the server loop from another thread
+        """
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+def percentiles(samples: List[float], points=(50, 95, 99)) -> Dict[str, Optional[float]]:
+    """
+    Nearest-rank percentiles of a list of samples
+    """
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[index], 3)
+    return result
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """
+    Count, mean, max and p50/p95/p99 of a list of samples
+    """
+    summary = {"count": len(samples)}
+    summary["mean"] = round(sum(samples) / len(samples), 3) if samples else None
+    summary["max"] = round(max(samples), 3) if samples else None
+    summary.update(percentiles(samples))
+    return summary
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """
+    Current resident set size of a process (this one by default)
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak RSS of this process
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def raise_open_file_limit():
+    """
+    Allow as many sockets as the hard limit permits
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop wakes up a task that sleeps for a fixed interval
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append((loop.time() - started - self.interval) * 1000)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return summarize(self.samples)
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def save_results(name: str, results: Dict[str, Any], output: Optional[str] = None) -> str:
+    """
+    Write results as JSON, by default to benchmarks/results/<name>-<timestamp>.json
+    """
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    return output
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare_results(current: Dict[str, Any], baseline_path: str, tolerance: float = 0.10) -> List[str]:
+    """
+    Compare the metrics of a run against a baseline file.
+    Returns a line per metric that changed by more than the tolerance.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    current_metrics = _flatten(current.get("metrics", {}))
+    baseline_metrics = _flatten(baseline.get("metrics", {}))
+
+    changes = []
+    for key, old in sorted(baseline_metrics.items()):
+        new = current_metrics.get(key)
+        if new is None or not old:
+            continue
+        delta = (new - old) / abs(old)
+        if abs(delta) > tolerance:
+            changes.append(f"{key}: {old} -> {new} ({delta:+.1%})")
+    return changes
+
+def report(name: str, results: Dict[str, Any], output: Optional[str] = None, baseline: Optional[str] = None):
+    """
+    Print results, save them, and print differences against a baseline if given
+    """
+    print(json.dumps(results["metrics"], indent=2))
+    path = save_results(name, results, output)
+    print(f"Results written to {path}")
+    if baseline:
+        changes = compare_results(results, baseline)
+        if changes:
+            print(f"Changes beyond tolerance versus {baseline}:")
+            for change in changes:
+                print(f"  {change}")
+        else:
+            print(f"No changes beyond tolerance versus {baseline}")
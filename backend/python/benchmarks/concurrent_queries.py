@@ -0,0 +1,159 @@
+"""
+Latency of the endpoints whose independent queries run through
+db.concurrency.gather_queries, one query at a time (QUERY_CONCURRENCY=1)
+versus concurrently. Runs on seeded mongomock data with a fixed delay added
+to every database operation to stand in for the server round trip. The
+dataset is small by default: mongomock runs aggregations in this process
+while holding the GIL, which a real server would not, and that would hide
+the overlap being measured.
+
+    python benchmarks/concurrent_queries.py --latency-ms 5 --requests 50
+    python benchmarks/concurrent_queries.py --latency-ms 20 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+from common import ServerThread, environment, install_mongomock, load_app, report, summarize
+from seed_data import seed
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+# Operations delayed by --latency-ms when called; find is delayed when its
+# cursor is first read, as pymongo only sends it then
+DELAYED_OPERATIONS = {
+    "find_one", "count_documents", "distinct", "aggregate", "insert_one", "insert_many",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many", "bulk_write", "find_one_and_update"
+}
+
+class DelayedCursor:
+    """
+    Cursor proxy sleeping once before the first document, for one round trip
+    """
+
+    def __init__(self, cursor, latency: float):
+        self._cursor = cursor
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return call
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        return iter(self._cursor)
+
+class DelayedCollection:
+    """
+    Collection proxy sleeping before each operation, as a remote server would
+    keep the calling thread waiting
+    """
+
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def find(self, *args, **kwargs):
+        return DelayedCursor(self._collection.find(*args, **kwargs), self._latency)
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in DELAYED_OPERATIONS:
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+async def measure(http, ids: Dict[str, Any], requests: int, rng: random.Random) -> Dict[str, List[float]]:
+    from auth.auth_handler import sign_jwt
+
+    admin = {"Authorization": f"Bearer {sign_jwt(ids['admin_id'])['access_token']}"}
+    endpoints = {
+        "chat_statistics": lambda: ("/api/analytics/chat-statistics", admin),
+        "user_activity": lambda: ("/api/analytics/user-activity", admin),
+        # A different user each time, so the call count cache rarely answers
+        "call_history": lambda: ("/api/calls/call-history", {"Authorization": f"Bearer {sign_jwt(rng.choice(ids['user_ids']))['access_token']}"})
+    }
+    latencies = {}
+    for name, make in endpoints.items():
+        samples = []
+        for _ in range(requests):
+            path, headers = make()
+            started = time.perf_counter()
+            response = await http.get(path, headers=headers)
+            samples.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+        latencies[name] = samples
+    return latencies
+
+async def run(args, base_url: str, ids: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+    import db.concurrency
+
+    rng = random.Random(args.seed)
+    metrics = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        # Read by gather_queries on every call
+        db.concurrency.QUERY_CONCURRENCY = 1
+        sequential = await measure(http, ids, args.requests, rng)
+        db.concurrency.QUERY_CONCURRENCY = args.concurrency
+        concurrent = await measure(http, ids, args.requests, rng)
+    for name in sequential:
+        before, after = summarize(sequential[name]), summarize(concurrent[name])
+        metrics[name] = {
+            "sequential_ms": before,
+            "concurrent_ms": after,
+            "speedup_p50": round(before["p50"] / after["p50"], 2) if after["p50"] else None
+        }
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs concurrent independent queries per request")
+    parser.add_argument("--latency-ms", type=float, default=5, help="Delay added to every database operation")
+    parser.add_argument("--concurrency", type=int, default=4, help="QUERY_CONCURRENCY for the concurrent run")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and mode")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8769, help="Port for the in-process server")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/concurrent_queries-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    database = install_mongomock()
+    ids = seed(database, users=args.users, chats=args.users * 2, messages=args.messages, calls=args.users * 10, logins=args.users * 10, seed_value=args.seed, verbose=False)
+    import db.mongodb
+    from db.query_budget import budgeted
+    db.mongodb.get_collection = lambda collection_name: budgeted(DelayedCollection(database[collection_name], args.latency_ms / 1000))
+
+    server = ServerThread(load_app(), port=args.port)
+    server.start()
+    try:
+        metrics = asyncio.run(run(args, server.url, ids))
+    finally:
+        server.stop()
+
+    results = {
+        "benchmark": "concurrent_queries",
+        "environment": environment(),
+        "parameters": {
+            "latency_ms": args.latency_ms, "concurrency": args.concurrency, "requests": args.requests,
+            "users": args.users, "messages": args.messages, "seed": args.seed
+        },
+        "metrics": metrics
+    }
+    report("concurrent_queries", results, args.output, args.baseline)
+
+if __name__ == "__main__":
+    main()
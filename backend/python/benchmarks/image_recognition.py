@@ -0,0 +1,154 @@
+"""
+Latency and memory of image analysis for /api/ai/image-recognition.
+
+Compares the original full-resolution analysis with the reduced decoding
+used by the worker pool, each in a fresh process so peak RSS is comparable,
+then optionally fires concurrent uploads at the endpoint and records
+event-loop lag.
+
+    python benchmarks/image_recognition.py --megapixels 24 --iterations 5
+    python benchmarks/image_recognition.py --endpoint --concurrency 16
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List
+
+from common import (
+    LoopLagMonitor, ServerThread, environment, load_app, peak_rss_bytes, report, summarize
+)
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+def make_image(megapixels: float, image_format: str = "JPEG") -> bytes:
+    """
+    A noisy gradient so the encoder cannot compress it to nothing
+    """
+    import numpy as np
+    from PIL import Image
+
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    for channel in range(3):
+        noise = rng.integers(0, 40, size=(height, width), dtype=np.uint8)
+        pixels[..., channel] = (gradient[None, :] * (channel + 1) / 3).astype(np.uint8) + noise
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+def legacy_analyze(data: bytes) -> Dict:
+    """
+    The original recognize_image analysis: full decode and full-size array
+    """
+    import numpy as np
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+    img_array = np.array(img)
+    avg_color = img_array.mean(axis=(0, 1)).astype(int)
+    brightness = np.mean(img_array) / 255
+    return {"avg_color": avg_color.tolist(), "tone": "light" if brightness > 0.5 else "dark"}
+
+def _run_variant(variant: str, data: bytes, iterations: int):
+    import numpy
+    import PIL.Image
+    from services.image_analysis import analyze_image
+
+    analyze = legacy_analyze if variant == "legacy" else analyze_image
+    # Peak RSS after imports, so only the analysis itself is counted
+    start_peak = peak_rss_bytes()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        analyze(data)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, peak_rss_bytes() - start_peak
+
+def measure_variant(variant: str, data: bytes, iterations: int) -> Dict:
+    # A fresh process per variant keeps memory readings independent
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        latencies, rss_growth = executor.submit(_run_variant, variant, data, iterations).result()
+    return {"latency_ms": summarize(latencies), "peak_rss_growth_mb": round(rss_growth / 1024 / 1024, 1)}
+
+async def measure_endpoint(server: ServerThread, data: bytes, requests: int, concurrency: int) -> Dict:
+    import httpx
+    from auth.auth_handler import sign_jwt
+
+    headers = {"Authorization": f"Bearer {sign_jwt('benchmark-user')['access_token']}"}
+    monitor = LoopLagMonitor()
+    await server.call(_start_monitor(monitor))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=120) as http:
+        async def upload():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await http.post(
+                    "/api/ai/image-recognition",
+                    files={"file": ("bench.jpg", data, "image/jpeg")},
+                    headers=headers
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(upload() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "latency_ms": summarize(latencies),
+        "requests_per_sec": round(requests / elapsed, 2),
+        "status_codes": {str(code): count for code, count in statuses.items()},
+        "event_loop_lag_ms": await server.call(monitor.stop())
+    }
+
+async def _start_monitor(monitor: LoopLagMonitor):
+    monitor.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Image analysis latency and memory benchmark")
+    parser.add_argument("--megapixels", type=float, default=24, help="Size of the synthetic test image")
+    parser.add_argument("--iterations", type=int, default=5, help="Analyses per variant")
+    parser.add_argument("--endpoint", action="store_true", help="Also load the HTTP endpoint")
+    parser.add_argument("--requests", type=int, default=32, help="Uploads for --endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent uploads for --endpoint")
+    parser.add_argument("--port", type=int, default=8767, help="Port for the in-process server")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/image_recognition-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    data = make_image(args.megapixels)
+    metrics = {
+        "image_kb": round(len(data) / 1024, 1),
+        "legacy": measure_variant("legacy", data, args.iterations),
+        "reduced": measure_variant("reduced", data, args.iterations)
+    }
+
+    if args.endpoint:
+        server = ServerThread(load_app(), port=args.port)
+        server.start()
+        try:
+            metrics["endpoint"] = asyncio.run(measure_endpoint(server, data, args.requests, args.concurrency))
+        finally:
+            server.stop()
+
+    results = {
+        "benchmark": "image_recognition",
+        "environment": environment(),
+        "parameters": {"megapixels": args.megapixels, "iterations": args.iterations},
+        "metrics": metrics
+    }
+    report("image_recognition", results, args.output, args.baseline)
+
+if __name__ == "__main__":
+    main()
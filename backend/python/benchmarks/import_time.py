@@ -0,0 +1,117 @@
+"""
+Startup import cost of the API per router profile, from `python -X importtime`.
+
+Each profile imports main in a fresh interpreter with ENABLED_ROUTERS set,
+several times, and reports the median cumulative import time, the slowest
+modules and which heavy dependencies were loaded. Exits non-zero when a
+profile loads a dependency it must not (see FORBIDDEN) or exceeds --max-ms,
+so it can guard against regressions in CI.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --profiles calls,ai --runs 9 --max-ms 1500
+    python benchmarks/import_time.py --baseline benchmarks/results/import_time-<time>.json
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from common import BACKEND_DIR, environment, report
+
+# "" is every router, as deployed by default
+DEFAULT_PROFILES = ["", "calls", "ai", "analytics", "users", "search"]
+HEAVY_MODULES = ["numpy", "PIL", "pandas"]
+# Dependencies a profile must not load at startup
+FORBIDDEN = {profile: HEAVY_MODULES for profile in DEFAULT_PROFILES}
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def import_once(profile: str) -> Tuple[float, float, Dict[str, Tuple[int, int]]]:
+    """
+    (wall ms, cumulative import ms of main, module -> (self us, cumulative us))
+    """
+    env = dict(os.environ, ENABLED_ROUTERS=profile, PYTHONDONTWRITEBYTECODE="1")
+    env.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing main failed for profile {profile!r}:\n{completed.stderr[-2000:]}")
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us))
+    return wall, modules.get("main", (0, 0))[1] / 1000, modules
+
+def measure_profile(profile: str, runs: int, top: int) -> Dict:
+    walls: List[float] = []
+    totals: List[float] = []
+    modules: Dict[str, Tuple[int, int]] = {}
+    for _ in range(runs):
+        wall, total, modules = import_once(profile)
+        walls.append(wall)
+        totals.append(total)
+
+    # Top-level packages by cumulative time, from the last run
+    top_level = {name: times[1] for name, times in modules.items() if "." not in name and name != "main"}
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "import_ms": round(statistics.median(totals), 1),
+        "process_ms": round(statistics.median(walls), 1),
+        "modules": len(modules),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in modules],
+        "slowest": {name: round(us / 1000, 1) for name, us in slowest}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="API import time per router profile")
+    parser.add_argument("--profiles", help="Comma-separated ENABLED_ROUTERS values; 'all' for every router")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreter starts per profile (median is reported)")
+    parser.add_argument("--top", type=int, default=8, help="Slowest top-level packages listed per profile")
+    parser.add_argument("--max-ms", type=float, help="Fail when a profile's median import time exceeds this")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/import_time-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    profiles = DEFAULT_PROFILES
+    if args.profiles:
+        profiles = ["" if name == "all" else name for name in args.profiles.split(",")]
+
+    metrics = {}
+    failures = []
+    for profile in profiles:
+        label = profile or "all"
+        result = measure_profile(profile, args.runs, args.top)
+        metrics[label] = result
+        loaded = set(result["heavy_modules"]) & set(FORBIDDEN.get(profile, []))
+        if loaded:
+            failures.append(f"{label}: loads {', '.join(sorted(loaded))} at startup")
+        if args.max_ms is not None and result["import_ms"] > args.max_ms:
+            failures.append(f"{label}: {result['import_ms']} ms exceeds {args.max_ms} ms")
+
+    results = {
+        "benchmark": "import_time",
+        "environment": environment(),
+        "parameters": {"runs": args.runs, "profiles": [profile or "all" for profile in profiles]},
+        "metrics": metrics
+    }
+    report("import_time", results, args.output, args.baseline)
+
+    if failures:
+        print("Import regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
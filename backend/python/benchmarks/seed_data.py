@@ -0,0 +1,293 @@
+"""
+Seed a database with synthetic users, chats, messages, calls and login logs
+shaped like the documents of backend/node (see seed.js and models/), for the
+API benchmarks. Documents are generated and inserted in batches, so memory
+stays flat at millions of messages. The same seed and --now give the same
+data, IDs included; --now defaults to midnight today, since the analytics
+endpoints look back from the current day.
+
+    python benchmarks/seed_data.py --mongo-uri mongodb://localhost:27017 --users 10000 --messages 2000000
+    python benchmarks/seed_data.py --mongo-uri mongodb://localhost:27017 --drop
+    python benchmarks/seed_data.py --mongo-uri mongodb://localhost:27017 --drop --now 2026-01-01
+
+Only local servers are seeded unless --allow-remote is given; MONGO_URI is
+never read, so the configured database cannot be written to by accident.
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from bson import ObjectId
+
+# The super-admin of seed.js, with an ObjectId _id like every Node user
+ADMIN_ID = ObjectId("65a000000000000000000001")
+ADMIN_EMAIL = "admin@chatware.com"
+# A bcrypt hash, never checked by the Python API
+PASSWORD_HASH = "$2a$10$CwTycUXWue0Thq9StjUM0uJ8.Hr2rZ2N1rL1j1Z9c8aQ7d0hE3o5K"
+
+COLLECTIONS = ["users", "chats", "messages", "calls", "logs"]
+
+FIRST_NAMES = ["Ada", "Ben", "Chloe", "Dev", "Elif", "Farah", "Gus", "Hana", "Ivan", "Jade", "Kofi", "Lena", "Mateo", "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sami", "Tara"]
+LAST_NAMES = ["Ng", "Okafor", "Silva", "Kowalski", "Haddad", "Berg", "Tanaka", "Moreau", "Patel", "Reyes", "Fischer", "Costa"]
+WORDS = (
+    "hello thanks meeting tomorrow today great good bad late coffee lunch project deadline report call "
+    "review awesome terrible happy sad tired party weekend movie game team plan idea update question "
+    "answer sorry congrats birthday travel train traffic weather sunny rain code deploy bug fix release "
+    "budget numbers design client launch sprint notes slides doc link photo video music dinner home"
+).split()
+SENTENCES = [
+    "Hello! How are you doing today?",
+    "Thanks so much, that was an amazing presentation",
+    "Can we discuss the meeting notes tomorrow?",
+    "No, I think the numbers are wrong again",
+    "Congrats on the new job, let's celebrate with a party",
+    "Sorry I'm late, traffic was horrible",
+    "Do you want to grab coffee after work?",
+    "lol that was funny haha",
+]
+MESSAGE_TYPES = ["text"] * 92 + ["image"] * 5 + ["file"] * 2 + ["gif"]
+
+def _skewed(rng: random.Random, count: int, skew: float = 1.2) -> int:
+    """
+    An index in [0, count) where low indexes are much more likely, so a few
+    chats and users carry most of the traffic as in a real deployment
+    """
+    return min(count - 1, int(count * rng.random() ** (skew + 1)))
+
+def _object_id(rng: random.Random, created: datetime) -> ObjectId:
+    """
+    An ObjectId for a document created at created, drawn from rng so the same
+    seed gives the same IDs. The timestamp part keeps _id in createdAt order.
+    """
+    return ObjectId(int(created.timestamp()).to_bytes(4, "big") + rng.getrandbits(64).to_bytes(8, "big"))
+
+def generate_users(rng: random.Random, count: int, now: datetime, online_ratio: float) -> Iterator[Dict[str, Any]]:
+    yield {
+        "_id": ADMIN_ID, "name": "Admin", "email": ADMIN_EMAIL, "password": PASSWORD_HASH,
+        "passwordChangeRequired": True, "profilePic": "default-profile.png", "role": "super-admin",
+        "status": "online", "lastSeen": now, "location": None, "locationHistory": [], "isActive": True,
+        "createdAt": now - timedelta(days=365), "updatedAt": now
+    }
+    for index in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        created = now - timedelta(days=rng.uniform(1, 365))
+        yield {
+            "_id": _object_id(rng, created),
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}.{index}@example.com",
+            "password": PASSWORD_HASH,
+            "passwordChangeRequired": False,
+            "profilePic": "default-profile.png",
+            "role": "admin" if index % 500 == 0 else "user",
+            "status": "online" if rng.random() < online_ratio else rng.choice(["offline", "offline", "away"]),
+            "bio": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+            "lastSeen": now - timedelta(minutes=rng.uniform(0, 60 * 24 * 7)),
+            "location": None,
+            "locationHistory": [],
+            "isActive": True,
+            "createdAt": created,
+            "updatedAt": created
+        }
+
+def generate_chats(rng: random.Random, count: int, user_ids: List[ObjectId], now: datetime, group_ratio: float) -> Iterator[Dict[str, Any]]:
+    for index in range(count):
+        group = rng.random() < group_ratio and len(user_ids) > 2
+        size = rng.randint(3, min(20, len(user_ids))) if group else 2
+        members = rng.sample(user_ids, size)
+        created = now - timedelta(days=rng.uniform(1, 365))
+        chat = {
+            "_id": _object_id(rng, created),
+            "chatName": f"Group {index}" if group else "sender",
+            "isGroupChat": group,
+            "users": members,
+            "groupPic": "default-group.png",
+            "description": "",
+            "isActive": True,
+            "createdAt": created,
+            "updatedAt": created
+        }
+        if group:
+            chat["groupAdmin"] = members[0]
+        yield chat
+
+def generate_messages(rng: random.Random, count: int, chats: List[Dict[str, Any]], now: datetime, days: int) -> Iterator[Dict[str, Any]]:
+    span = days * 24 * 3600
+    for _ in range(count):
+        chat = chats[_skewed(rng, len(chats))]
+        message_type = rng.choice(MESSAGE_TYPES)
+        created = now - timedelta(seconds=rng.uniform(0, span))
+        if message_type == "text":
+            if rng.random() < 0.3:
+                content = rng.choice(SENTENCES)
+            else:
+                content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 14)))
+        else:
+            content = ""
+        message = {
+            "_id": _object_id(rng, created),
+            "sender": rng.choice(chat["users"]),
+            "content": content,
+            "chat": chat["_id"],
+            "readBy": [],
+            "messageType": message_type,
+            "isDeleted": rng.random() < 0.01,
+            "reactions": [],
+            "createdAt": created,
+            "updatedAt": created
+        }
+        if message_type != "text":
+            message["fileUrl"] = f"/uploads/{uuid.UUID(int=rng.getrandbits(128))}.bin"
+            message["fileSize"] = rng.randint(10_000, 5_000_000)
+        yield message
+
+def generate_calls(rng: random.Random, count: int, user_ids: List[str], now: datetime, days: int) -> Iterator[Dict[str, Any]]:
+    # Written by routers/call_service.py, which stores participants as strings
+    span = days * 24 * 3600
+    for _ in range(count):
+        participants = rng.sample(user_ids, rng.choice([2, 2, 2, 3, 4]))
+        start = now - timedelta(seconds=rng.uniform(0, span))
+        duration = rng.uniform(5, 3600)
+        yield {
+            "call_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "participants": participants,
+            "start_time": start,
+            "call_type": rng.choice(["audio", "video"]),
+            "initiator": participants[0],
+            "status": "ended",
+            "end_time": start + timedelta(seconds=duration),
+            "duration": duration
+        }
+
+def generate_logs(rng: random.Random, count: int, user_ids: List[str], now: datetime, days: int) -> Iterator[Dict[str, Any]]:
+    span = days * 24 * 3600
+    for _ in range(count):
+        yield {"action": "login", "user": rng.choice(user_ids), "timestamp": now - timedelta(seconds=rng.uniform(0, span))}
+
+def insert_batched(collection, documents: Iterator[Dict[str, Any]], batch_size: int) -> int:
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+def seed(
+    database,
+    users: int = 1000,
+    chats: int = 2000,
+    messages: int = 100_000,
+    calls: int = 10_000,
+    logins: int = 20_000,
+    days: int = 60,
+    online_ratio: float = 0.1,
+    group_ratio: float = 0.3,
+    seed_value: int = 42,
+    now: Optional[datetime] = None,
+    batch_size: int = 10_000,
+    drop: bool = False,
+    verbose: bool = True
+) -> Dict[str, Any]:
+    """
+    Fill database with synthetic data dated up to now (midnight today by
+    default). Returns the counts, the IDs the workloads need and how long
+    each collection took.
+    """
+    if drop:
+        for name in COLLECTIONS:
+            database[name].drop()
+    elif database["users"].estimated_document_count():
+        raise SystemExit("The database already has users; pass --drop to replace them")
+
+    rng = random.Random(seed_value)
+    now = now or datetime.combine(date.today(), datetime.min.time())
+    timings = {}
+
+    def run(name: str, documents: Iterator[Dict[str, Any]]) -> int:
+        started = time.perf_counter()
+        inserted = insert_batched(database[name], documents, batch_size)
+        timings[name] = round(time.perf_counter() - started, 2)
+        if verbose:
+            print(f"Seeded {inserted} {name} in {timings[name]}s")
+        return inserted
+
+    user_documents = list(generate_users(rng, users, now, online_ratio))
+    run("users", iter(user_documents))
+    user_ids = [user["_id"] for user in user_documents[1:]]
+    # Chats are far fewer than messages, the generator needs their members
+    chat_documents = list(generate_chats(rng, chats, user_ids, now, group_ratio))
+    run("chats", iter(chat_documents))
+    run("messages", generate_messages(rng, messages, chat_documents, now, days))
+    string_ids = [str(user_id) for user_id in user_ids]
+    run("calls", generate_calls(rng, calls, string_ids, now, days))
+    run("logs", generate_logs(rng, logins, string_ids + [str(ADMIN_ID)], now, days))
+
+    # The indexes the Node models declare, plus those the Python API relies on
+    database["users"].create_index("email", unique=True)
+    database["messages"].create_index([("chat", 1), ("createdAt", -1)])
+    database["messages"].create_index([("createdAt", 1), ("_id", 1)])
+    database["calls"].create_index([("participants", 1), ("start_time", -1), ("_id", -1)])
+
+    return {
+        "counts": {"users": users + 1, "chats": chats, "messages": messages, "calls": calls, "logs": logins},
+        "seconds": timings,
+        **sample_ids(database)
+    }
+
+def sample_ids(database, limit: int = 1000) -> Dict[str, Any]:
+    """
+    IDs for the workloads to request, read back so an earlier seed can be reused
+    """
+    admin = database["users"].find_one({"email": ADMIN_EMAIL}, {"_id": 1})
+    user_ids = [str(user["_id"]) for user in database["users"].find({"email": {"$ne": ADMIN_EMAIL}}, {"_id": 1}).limit(limit)]
+    chats = list(database["chats"].find({}, {"users": 1}).limit(limit))
+    if admin is None or not user_ids or not chats:
+        raise SystemExit("The database has no seeded users or chats; run benchmarks/seed_data.py first")
+    return {
+        "admin_id": str(admin["_id"]),
+        "user_ids": user_ids,
+        "chat_ids": [str(chat["_id"]) for chat in chats],
+        "chat_members": {str(chat["_id"]): [str(user) for user in chat.get("users", [])] for chat in chats}
+    }
+
+def check_local(uri: str, allow_remote: bool):
+    host = urlparse(uri).hostname or ""
+    if not allow_remote and (uri.startswith("mongodb+srv://") or host not in ("localhost", "127.0.0.1", "::1")):
+        raise SystemExit(f"Refusing to seed {host or uri}; pass --allow-remote to seed a non-local server")
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic Chatware data for benchmarks")
+    parser.add_argument("--mongo-uri", required=True, help="Server to seed, e.g. mongodb://localhost:27017")
+    parser.add_argument("--database", default="chatware", help="Database name (the API reads chatware)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--logins", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=60, help="Messages, calls and logins are spread over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--now", type=datetime.fromisoformat, help="Date the data ends at, e.g. 2026-01-01 (default: midnight today)")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--drop", action="store_true", help="Drop the seeded collections first")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow seeding a non-local server")
+    args = parser.parse_args()
+
+    check_local(args.mongo_uri, args.allow_remote)
+    from pymongo import MongoClient
+    database = MongoClient(args.mongo_uri)[args.database]
+    seed(
+        database, users=args.users, chats=args.chats, messages=args.messages, calls=args.calls,
+        logins=args.logins, days=args.days, seed_value=args.seed, now=args.now, batch_size=args.batch_size, drop=args.drop
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Request mixes for benchmarks/api_suite.py, one list per router. Each
+workload builds its next request from the IDs returned by
+seed_data.seed() or seed_data.sample_ids(), so requests spread over the
+seeded users and chats instead of repeating one cached response.
+"""
+import random
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from seed_data import SENTENCES, WORDS
+
+# (user the request is sent as, path, query parameters)
+Request = Tuple[str, str, Dict[str, Any]]
+
+class Workload(NamedTuple):
+    name: str
+    router: str
+    method: str
+    make: Callable[[random.Random, Dict[str, Any]], Request]
+
+def _text(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return rng.choice(SENTENCES)
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+
+def _admin(path: str, params: Callable[[random.Random, Dict[str, Any]], Dict[str, Any]] = lambda rng, ids: {}):
+    # The analytics routes are admin-only
+    return lambda rng, ids: (ids["admin_id"], path, params(rng, ids))
+
+def _user(path: str, params: Callable[[random.Random, Dict[str, Any]], Dict[str, Any]] = lambda rng, ids: {}):
+    return lambda rng, ids: (rng.choice(ids["user_ids"]), path, params(rng, ids))
+
+def _smart_reply(rng: random.Random, ids: Dict[str, Any]) -> Request:
+    # Sent by a member of the chat, as the chat client would
+    chat_id = rng.choice(ids["chat_ids"])
+    members = ids["chat_members"].get(chat_id) or ids["user_ids"]
+    return rng.choice(members), "/api/ai/smart-reply", {"message_content": _text(rng), "chat_id": chat_id}
+
+def _user_statistics(rng: random.Random, ids: Dict[str, Any]) -> Request:
+    return ids["admin_id"], f"/api/analytics/user-statistics/{rng.choice(ids['user_ids'])}", {}
+
+WORKLOADS: List[Workload] = [
+    Workload("user_activity", "analytics", "GET", _admin("/api/analytics/user-activity")),
+    Workload("chat_statistics", "analytics", "GET", _admin("/api/analytics/chat-statistics")),
+    Workload("user_statistics", "analytics", "GET", _user_statistics),
+    Workload("message_trends", "analytics", "GET", _admin("/api/analytics/message-trends", lambda rng, ids: {"chat_id": rng.choice(ids["chat_ids"])})),
+
+    Workload("search_users", "users", "GET", _user("/api/users/search", lambda rng, ids: {"query": rng.choice(["a", "an", "pri", "mat", "okafor", "chloe"])})),
+    Workload("online_users", "users", "GET", _user("/api/users/online")),
+
+    Workload("call_history", "calls", "GET", _user("/api/calls/call-history", lambda rng, ids: {"limit": 20})),
+    Workload("call_summary", "calls", "GET", _user("/api/calls/summary")),
+
+    Workload("text_analysis", "ai", "POST", _user("/api/ai/text-analysis", lambda rng, ids: {"text": _text(rng)})),
+    Workload("smart_reply", "ai", "POST", _smart_reply),
+    Workload("emoji_suggestion", "ai", "POST", _user("/api/ai/emoji-suggestion", lambda rng, ids: {"text": _text(rng)})),
+
+    Workload("search_messages", "search", "GET", _user("/api/search/messages", lambda rng, ids: {"q": " ".join(rng.sample(WORDS, rng.randint(1, 2)))})),
+]
+
+def select(routers: List[str]) -> List[Workload]:
+    """
+    The workloads of the given routers, all of them when none are given
+    """
+    unknown = set(routers) - {workload.router for workload in WORKLOADS}
+    if unknown:
+        raise SystemExit(f"Unknown routers: {', '.join(sorted(unknown))}")
+    return [workload for workload in WORKLOADS if not routers or workload.router in routers]
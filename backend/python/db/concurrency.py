@@ -0,0 +1,79 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import pymongo
+from pymongo.errors import ExecutionTimeout, NetworkTimeout
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Queries of one request run at the same time, 1 runs them one after another
+QUERY_CONCURRENCY = int(os.getenv("QUERY_CONCURRENCY", 4))
+# Threads running queries for all requests of this worker
+QUERY_THREADS = int(os.getenv("QUERY_THREADS", 16))
+# Seconds one query may take
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 10))
+
+# Separate from the default executor, so slow queries cannot hold up
+# compression, health pings or write-behind flushes
+query_executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix="query")
+
+class QueryTimeout(Exception):
+    pass
+
+def _run_with_timeout(query: Callable[[], Any], timeout: float) -> Any:
+    # pymongo applies the deadline to every operation in the block and the
+    # server stops the work (maxTimeMS), so the thread is freed as well
+    with pymongo.timeout(timeout):
+        return query()
+
+async def gather_queries(queries: Dict[str, Callable[[], Any]], max_concurrency: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run independent blocking queries in threads, at most max_concurrency at a
+    time, and return their results by name. The first failure or timeout
+    cancels the queries still waiting and is raised; a timeout is raised as
+    QueryTimeout. Queries run in a copy of the caller's context, so they
+    still count towards the request's query budget and timings.
+    """
+    max_concurrency = max_concurrency or QUERY_CONCURRENCY
+    timeout = timeout or QUERY_TIMEOUT
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    failed = False
+
+    async def run(name: str, query: Callable[[], Any]) -> Any:
+        nonlocal failed
+        async with semaphore:
+            # A query that failed released the semaphore before the others are cancelled
+            if failed:
+                raise asyncio.CancelledError()
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(query_executor, context.run, _run_with_timeout, query, timeout)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except (asyncio.TimeoutError, ExecutionTimeout, NetworkTimeout) as e:
+                failed = True
+                raise QueryTimeout(f"Query {name} took longer than {timeout:g}s") from e
+            except Exception:
+                failed = True
+                raise
+
+    tasks = {name: asyncio.ensure_future(run(name, query)) for name, query in queries.items()}
+    try:
+        done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    except asyncio.CancelledError:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    # Every failure is retrieved, the first one in query order is raised
+    errors = [task.exception() for task in tasks.values() if task in done and not task.cancelled() and task.exception() is not None]
+    if errors:
+        raise errors[0]
+    return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,294 @@
+import functools
+import os
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+from services.metrics import registry
+
+# Load environment variables
+load_dotenv()
+
+# "warn" logs requests over budget, "raise" fails them (for tests and CI),
+# "off" hands out plain collections
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn")
+# Database operations one request may run
+QUERY_BUDGET_OPERATIONS = int(os.getenv("QUERY_BUDGET_OPERATIONS", 25))
+# Documents one request may read, count or modify
+QUERY_BUDGET_DOCUMENTS = int(os.getenv("QUERY_BUDGET_DOCUMENTS", 50000))
+# Runs of one query shape with different values before it is reported as an N+1
+QUERY_BUDGET_REPEATS = int(os.getenv("QUERY_BUDGET_REPEATS", 5))
+
+query_budget_violations = registry.counter("query_budget_violations", "Requests over their query budget by kind", ("kind",))
+
+# Operations that take a filter or pipeline first, and so have a shape
+QUERY_OPERATIONS = {
+    "find", "find_one", "count_documents", "distinct", "aggregate",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete"
+}
+# Operations counted without a shape: they take no filter (inserts, bulk
+# writes and the metadata count)
+UNSHAPED_OPERATIONS = {"insert_one", "insert_many", "bulk_write", "estimated_document_count"}
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def query_shape(query: Any) -> Any:
+    """
+    A query with its values replaced by "?", so queries differing only in
+    their values (one per loop iteration) have the same shape
+    """
+    if isinstance(query, dict):
+        return {key: query_shape(value) for key, value in query.items()}
+    if isinstance(query, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in query):
+            return "[?]"
+        return [query_shape(item) for item in query]
+    return "?"
+
+def _documents(operation: str, result: Any) -> int:
+    # Documents an operation touched, from its result
+    if operation == "count_documents":
+        return result
+    if operation == "distinct":
+        return len(result)
+    if operation.startswith("find_one"):
+        return 1 if result is not None else 0
+    if operation == "insert_one":
+        return 1
+    if operation == "insert_many":
+        return len(result.inserted_ids)
+    if operation in ("update_one", "update_many", "replace_one"):
+        return result.matched_count + (1 if result.upserted_id is not None else 0)
+    if operation in ("delete_one", "delete_many"):
+        return result.deleted_count
+    if operation == "bulk_write":
+        return result.matched_count + result.inserted_count + result.upserted_count + result.deleted_count
+    return 0
+
+class QueryStats:
+    """
+    The database work of one request: operations, documents read or written,
+    and how often each query shape and each exact query ran
+    """
+
+    def __init__(self):
+        self.operations = 0
+        self.documents = 0
+        self.shapes: Counter = Counter()
+        self.queries: Counter = Counter()
+        # A request's queries may run in executor threads
+        self._lock = threading.Lock()
+
+    def add(self, collection: str, operation: str, query: Any = None, documents: int = 0):
+        with self._lock:
+            self.operations += 1
+            self.documents += documents
+            if operation in QUERY_OPERATIONS:
+                self.shapes[f"{collection}.{operation} {query_shape(query or {})}"] += 1
+                self.queries[f"{collection}.{operation} {query!r}"] += 1
+
+    def add_documents(self, documents: int):
+        with self._lock:
+            self.documents += documents
+
+    def repeated(self, threshold: int = QUERY_BUDGET_REPEATS) -> Dict[str, int]:
+        """
+        Query shapes run more than threshold times, the N+1 pattern
+        """
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+    def duplicates(self) -> Dict[str, int]:
+        """
+        Exact queries run more than once, which a request could have reused
+        """
+        return {query: count for query, count in self.queries.items() if count > 1}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operations": self.operations,
+            "documents": self.documents,
+            "repeated": self.repeated(),
+            "duplicates": self.duplicates()
+        }
+
+# Stats of the request being handled; None outside a request
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+class _CountingCursor:
+    """
+    Cursor proxy adding the documents it yields to the request's stats.
+    Chained calls (sort, limit, ...) keep returning the proxy.
+    """
+
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return call
+
+    def __iter__(self):
+        count = 0
+        try:
+            for document in self._cursor:
+                count += 1
+                yield document
+        finally:
+            self._stats.add_documents(count)
+
+    def __next__(self):
+        document = next(self._cursor)
+        self._stats.add_documents(1)
+        return document
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+class BudgetedCollection:
+    """
+    Collection proxy counting the operations run through it against the
+    current request's stats. Outside a request it only passes calls on.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in QUERY_OPERATIONS and name not in UNSHAPED_OPERATIONS:
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            stats = current_queries.get()
+            if stats is None:
+                return attr(*args, **kwargs)
+            result = attr(*args, **kwargs)
+            query = args[0] if args else kwargs.get("filter", kwargs.get("pipeline"))
+            if name in ("find", "aggregate"):
+                stats.add(self._collection.name, name, query)
+                return _CountingCursor(result, stats)
+            stats.add(self._collection.name, name, query, _documents(name, result))
+            return result
+        return call
+
+def budgeted(collection):
+    """
+    Wrap a collection for query accounting, unless it is turned off
+    """
+    if QUERY_BUDGET_MODE == "off":
+        return collection
+    return BudgetedCollection(collection)
+
+class RecordedRequest(NamedTuple):
+    method: str
+    path: str
+    stats: QueryStats
+    problems: List[str]
+
+class QueryRecorder:
+    """
+    Collects the stats of every request while registered in recorders, as the
+    query_budget fixture of tests/conftest.py does. When strict, a request
+    over budget raises QueryBudgetExceeded whatever QUERY_BUDGET_MODE is.
+    """
+
+    def __init__(self, strict: bool = True):
+        self.strict = strict
+        self.requests: List[RecordedRequest] = []
+
+    @property
+    def last(self) -> RecordedRequest:
+        if not self.requests:
+            raise AssertionError("No request was recorded")
+        return self.requests[-1]
+
+    def assert_queries(self, max_operations: Optional[int] = None, max_documents: Optional[int] = None, path: Optional[str] = None, allow_repeats: bool = False, min_operations: int = 1):
+        """
+        Assert that every recorded request (to path, when given) stayed within
+        the given operation and document counts and had no N+1 shapes. A
+        request must also have run min_operations, so collections that bypass
+        the accounting fail instead of passing with nothing counted.
+        """
+        requests = [request for request in self.requests if path is None or request.path == path]
+        if not requests:
+            raise AssertionError(f"No request to {path or 'any path'} was recorded")
+        for request in requests:
+            stats = request.stats
+            label = f"{request.method} {request.path}"
+            if stats.operations < min_operations:
+                raise AssertionError(f"{label} ran {stats.operations} counted operations, expected at least {min_operations}; is get_collection budgeted?")
+            if max_operations is not None and stats.operations > max_operations:
+                raise AssertionError(f"{label} ran {stats.operations} operations, expected at most {max_operations}: {dict(stats.shapes)}")
+            if max_documents is not None and stats.documents > max_documents:
+                raise AssertionError(f"{label} touched {stats.documents} documents, expected at most {max_documents}")
+            if not allow_repeats and stats.repeated():
+                raise AssertionError(f"{label} repeated queries: {stats.repeated()}")
+
+# Registered by the query_budget fixture of tests/conftest.py
+recorders: List[QueryRecorder] = []
+
+def budget_problems(stats: QueryStats, max_operations: int = QUERY_BUDGET_OPERATIONS, max_documents: int = QUERY_BUDGET_DOCUMENTS, max_repeats: int = QUERY_BUDGET_REPEATS) -> List[str]:
+    """
+    Why a request's stats are over budget, empty when they are not
+    """
+    problems = []
+    if stats.operations > max_operations:
+        query_budget_violations.inc("operations")
+        problems.append(f"{stats.operations} operations (budget {max_operations})")
+    if stats.documents > max_documents:
+        query_budget_violations.inc("documents")
+        problems.append(f"{stats.documents} documents (budget {max_documents})")
+    for shape, count in stats.repeated(max_repeats).items():
+        query_budget_violations.inc("repeated")
+        problems.append(f"{count}x {shape}")
+    return problems
+
+class QueryBudgetMiddleware:
+    """
+    Pure ASGI middleware giving each request its own QueryStats and checking
+    them once it completes: logged in warn mode, raised in raise mode
+    """
+
+    def __init__(self, app, mode: str = QUERY_BUDGET_MODE, max_operations: int = QUERY_BUDGET_OPERATIONS, max_documents: int = QUERY_BUDGET_DOCUMENTS, max_repeats: int = QUERY_BUDGET_REPEATS, exclude=("/metrics",)):
+        self.app = app
+        self.mode = mode
+        self.max_operations = max_operations
+        self.max_documents = max_documents
+        self.max_repeats = max_repeats
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.mode == "off" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        reset_token = current_queries.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_queries.reset(reset_token)
+
+        problems = budget_problems(stats, self.max_operations, self.max_documents, self.max_repeats)
+        for recorder in recorders:
+            recorder.requests.append(RecordedRequest(scope["method"], scope["path"], stats, problems))
+        if problems:
+            message = f"Query budget exceeded by {scope['method']} {scope['path']}: {'; '.join(problems)}"
+            if self.mode == "raise" or any(recorder.strict for recorder in recorders):
+                raise QueryBudgetExceeded(message)
+            print(message)
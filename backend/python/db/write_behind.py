@@ -0,0 +1,77 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, List
+from dotenv import load_dotenv
+from db.mongodb import get_collection
+
+# Load environment variables
+load_dotenv()
+
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 5))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 1000))
+
+class WriteBehindQueue:
+    """
+    Buffer write operations per collection and apply them with bulk_write,
+    either periodically or as soon as a collection's batch is full
+    """
+
+    def __init__(self, flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL, max_batch: int = WRITE_BEHIND_MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: Dict[str, List] = defaultdict(list)
+        self._full = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(operations) for operations in self._pending.values())
+
+    def enqueue(self, collection_name: str, operation):
+        """
+        Queue a pymongo write model (UpdateOne, InsertOne, ...) for a collection
+        """
+        operations = self._pending[collection_name]
+        operations.append(operation)
+        if len(operations) >= self.max_batch:
+            self._full.set()
+
+    def _take(self) -> Dict[str, List]:
+        pending, self._pending = self._pending, defaultdict(list)
+        self._full.clear()
+        return pending
+
+    def _write(self, pending: Dict[str, List]) -> int:
+        written = 0
+        for collection_name, operations in pending.items():
+            for start in range(0, len(operations), self.max_batch):
+                batch = operations[start:start + self.max_batch]
+                try:
+                    get_collection(collection_name).bulk_write(batch, ordered=False)
+                    written += len(batch)
+                except Exception as e:
+                    print(f"Failed to flush {len(batch)} writes to {collection_name}: {e}")
+        return written
+
+    def flush(self) -> int:
+        """
+        Write everything queued so far. Returns the number of operations written.
+        """
+        return self._write(self._take())
+
+    async def run(self):
+        """
+        Flush periodically; the writes run in a worker thread so the event loop is not blocked
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self.depth:
+                # Swap the buffers on the loop thread, then write them off-loop
+                await loop.run_in_executor(None, self._write, self._take())
+
+# Shared queue for the whole process
+write_behind = WriteBehindQueue()
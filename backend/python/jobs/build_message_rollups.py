@@ -0,0 +1,40 @@
+"""
+Roll up daily message sentiment and top keywords per chat into
+message_rollups, served by /api/analytics/message-trends. Runs resume from
+the last checkpoint; the API also runs this every ROLLUP_INTERVAL seconds.
+
+    python jobs/build_message_rollups.py               # messages since the checkpoint
+    python jobs/build_message_rollups.py --reset       # start over from the first message
+    python jobs/build_message_rollups.py --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.message_rollups import MessageRollups, ROLLUP_CHUNK_SIZE, ROLLUP_WORKERS
+
+def main():
+    parser = argparse.ArgumentParser(description="Build message_rollups from the messages collection")
+    parser.add_argument("--reset", action="store_true", help="Drop existing rollups and the checkpoint first")
+    parser.add_argument("--workers", type=int, default=ROLLUP_WORKERS, help="Analysis processes")
+    parser.add_argument("--chunk-size", type=int, default=ROLLUP_CHUNK_SIZE, help="Messages per chunk")
+    parser.add_argument("--max-chunks", type=int, help="Stop after this many chunks (resume later)")
+    args = parser.parse_args()
+
+    rollups = MessageRollups(chunk_size=args.chunk_size, workers=args.workers)
+    if args.reset:
+        rollups.reset()
+
+    started = time.perf_counter()
+    processed = rollups.process(args.max_chunks)
+    if processed < 0:
+        print("Another rollup run is in progress")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    print(f"{processed} messages in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.0f}/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Mine message -> response pairs per chat into chat_reply_index, used to rank
+learned suggestions in /api/ai/smart-reply. Builds are incremental: each run
+only reads messages sent since the previous one.
+
+    python jobs/build_reply_index.py                # every chat
+    python jobs/build_reply_index.py --chat <id>    # a single chat
+    python jobs/build_reply_index.py --full         # rebuild from scratch
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.mongodb import get_collection
+from services.reply_ranker import reply_ranker
+
+def main():
+    parser = argparse.ArgumentParser(description="Build chat_reply_index from the messages collection")
+    parser.add_argument("--chat", action="append", help="Chat ID to process (repeatable, default: all chats)")
+    parser.add_argument("--full", action="store_true", help="Rebuild instead of adding new messages")
+    args = parser.parse_args()
+
+    chat_ids = args.chat or [str(chat["_id"]) for chat in get_collection("chats").find({}, {"_id": 1})]
+    for chat_id in chat_ids:
+        messages = reply_ranker.build(chat_id, full=args.full)
+        print(f"{chat_id}: {messages} new messages")
+
+if __name__ == "__main__":
+    main()
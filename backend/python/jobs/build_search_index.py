@@ -0,0 +1,32 @@
+"""
+Add messages sent since the last run to the search index used by
+/api/search/messages. The API also does this every SEARCH_INDEX_INTERVAL
+seconds; run this for the initial build or after changing the tokenizer.
+
+    python jobs/build_search_index.py             # new messages only
+    python jobs/build_search_index.py --rebuild   # index everything again
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.search_index import SearchIndexer, SEARCH_INDEX_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the message search index")
+    parser.add_argument("--rebuild", action="store_true", help="Replace the index instead of adding to it")
+    parser.add_argument("--directory", default=SEARCH_INDEX_DIR, help="Index directory")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    added = SearchIndexer(args.directory).build(rebuild=args.rebuild)
+    if added < 0:
+        print("Another build is in progress")
+        sys.exit(1)
+    print(f"Indexed {added} messages in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
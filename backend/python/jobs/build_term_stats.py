@@ -0,0 +1,29 @@
+"""
+Precompute per-chat document frequencies used for TF-IDF keyword ranking
+in /api/ai/text-analysis.
+
+    python jobs/build_term_stats.py              # every chat
+    python jobs/build_term_stats.py --chat <id>  # a single chat
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.mongodb import get_collection
+from services.text_analysis import text_analyzer, TERM_STATS_MAX_TERMS
+
+def main():
+    parser = argparse.ArgumentParser(description="Build chat_term_stats from the messages collection")
+    parser.add_argument("--chat", action="append", help="Chat ID to process (repeatable, default: all chats)")
+    parser.add_argument("--max-terms", type=int, default=TERM_STATS_MAX_TERMS, help="Terms kept per chat")
+    args = parser.parse_args()
+
+    chat_ids = args.chat or [str(chat["_id"]) for chat in get_collection("chats").find({}, {"_id": 1})]
+    for chat_id in chat_ids:
+        documents = text_analyzer.term_stats.build(chat_id, args.max_terms)
+        print(f"{chat_id}: {documents} messages")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,51 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
 import json
+import asyncio
+import importlib
 import pymongo
 from dotenv import load_dotenv
 import uvicorn
 from auth.auth_handler import verify_token
 from auth.auth_bearer import JWTBearer
 from db.mongodb import get_db_connection
+from db.write_behind import write_behind
 from models.user import UserInDB
-from routers import analytics, call_service, ai_features, users
+from services.uploads import UploadLimitMiddleware, IMAGE_MAX_BYTES, AVATAR_MAX_BYTES
+from services.metrics import MetricsMiddleware, monitor_loop_lag, registry
+from services.profiler import ProfilingMiddleware, slow_requests
+from services.health import health_checker, PASS, FAIL
+from services.compression import CompressionMiddleware
+from db.query_budget import QueryBudgetMiddleware
+from routers import diagnostics
 
 # Load environment variables
 load_dotenv()
 
+# Bearer token required by /metrics when set; unset leaves it open to the scraper's network
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Routers by name: (module, prefix, tag). Only the routers in ENABLED_ROUTERS
+# are imported, so a worker pool can skip the dependencies of the others,
+# e.g. ENABLED_ROUTERS=calls for signaling-only workers. Unset enables all.
+ROUTERS = {
+    "analytics": ("routers.analytics", "/api/analytics", "Analytics"),
+    "calls": ("routers.call_service", "/api/calls", "Call Service"),
+    "ai": ("routers.ai_features", "/api/ai", "AI Features"),
+    "users": ("routers.users", "/api/users", "Users"),
+    "search": ("routers.search", "/api/search", "Search")
+}
+ENABLED_ROUTERS = [name.strip() for name in (os.getenv("ENABLED_ROUTERS") or ",".join(ROUTERS)).split(",") if name.strip()]
+unknown_routers = set(ENABLED_ROUTERS) - set(ROUTERS)
+if unknown_routers:
+    raise RuntimeError(f"Unknown ENABLED_ROUTERS: {', '.join(sorted(unknown_routers))}")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Chatware Python API",
@@ -26,6 +53,16 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized uploads before their bodies are parsed;
+# added first so CORS headers are still applied to the 413
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/ai/image-recognition": IMAGE_MAX_BYTES,
+        "/api/users/avatar": AVATAR_MAX_BYTES
+    }
+)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -35,14 +72,97 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# ETags, 304s for unchanged GETs, and gzip or brotli for larger bodies
+app.add_middleware(CompressionMiddleware)
+
+# Operations, documents and repeated queries per request, see db/query_budget.py
+app.add_middleware(QueryBudgetMiddleware)
+
+# Slow request capture and the Server-Timing header, see services/profiler.py;
+# a profile always takes its requested duration, so it is never a slow request
+app.add_middleware(ProfilingMiddleware, slow_log=slow_requests, exclude=("/metrics", "/api/diagnostics/profile"))
+
+# Outermost, so request timings include the other middleware and rejected uploads
+app.add_middleware(MetricsMiddleware, prefixes=[prefix for _, prefix, _ in ROUTERS.values()] + ["/api/diagnostics"])
+
+registry.callback("write_behind_depth", "Writes queued for the next bulk flush", (), lambda: [((), write_behind.depth)])
+
 # Mount static files directory for uploads
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# Include routers
-app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
-app.include_router(call_service.router, prefix="/api/calls", tags=["Call Service"])
-app.include_router(ai_features.router, prefix="/api/ai", tags=["AI Features"])
-app.include_router(users.router, prefix="/api/users", tags=["Users"])
+# Include the enabled routers
+for router_name in ENABLED_ROUTERS:
+    module_name, prefix, tag = ROUTERS[router_name]
+    app.include_router(importlib.import_module(module_name).router, prefix=prefix, tags=[tag])
+
+if "calls" in ENABLED_ROUTERS:
+    from routers.call_service import connected_clients
+    # Report signaling sockets; a draining worker refuses new ones
+    health_checker.add_check("websockets", lambda: {
+        "status": FAIL if connected_clients.draining else PASS,
+        "connections": connected_clients.connection_count,
+        "users": connected_clients.user_count
+    })
+
+# Admin profiling of this worker, served whichever routers are enabled
+app.include_router(diagnostics.router, prefix="/api/diagnostics", tags=["Diagnostics"])
+
+# Background tasks started with the app
+background_tasks = []
+
+def preload():
+    """
+    Run once by the production launcher before workers start. Importing this
+    module has already compiled the rule tables and loaded the lexicon; a bad
+    configuration or unreachable database fails here instead of in every worker.
+    """
+    get_db_connection().command("ping")
+
+async def drain():
+    """
+    Stop WebSocket traffic before the server shuts down: sockets are closed
+    with 1001 so clients reconnect to another worker, and calls in progress end
+    """
+    health_checker.shutting_down = True
+    if "calls" in ENABLED_ROUTERS:
+        from routers import call_service
+        await call_service.drain()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(write_behind.run()))
+    background_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    # Follow the Node backend's writes once the enabled services have subscribed
+    from services.events import event_bus
+    if event_bus.subscribed:
+        from services.change_feed import change_feed
+        background_tasks.append(asyncio.create_task(change_feed.run()))
+    # Services are imported here, after their routers, so disabled ones stay unloaded
+    if "calls" in ENABLED_ROUTERS:
+        from services.call_telemetry import call_telemetry
+        background_tasks.append(asyncio.create_task(call_telemetry.run()))
+    if "analytics" in ENABLED_ROUTERS:
+        from services.message_rollups import message_rollups
+        background_tasks.append(asyncio.create_task(message_rollups.run()))
+    if "search" in ENABLED_ROUTERS:
+        from services.search_index import search_index, search_indexer
+        # Map the segments now rather than on the first query
+        search_index.reload_if_changed()
+        background_tasks.append(asyncio.create_task(search_indexer.run()))
+
+@app.on_event("shutdown")
+async def flush_background_writes():
+    # Already done by run.py's production server, a no-op then
+    await drain()
+    for task in background_tasks:
+        task.cancel()
+    if "calls" in ENABLED_ROUTERS:
+        from services.call_telemetry import call_telemetry
+        call_telemetry.flush_all()
+    write_behind.flush()
+    if "ai" in ENABLED_ROUTERS:
+        from services.image_analysis import image_pool
+        image_pool.shutdown()
 
 @app.get("/")
 async def read_root():
@@ -57,5 +177,27 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness: the worker's event loop is serving requests, no dependencies are checked"""
+    return {"status": "alive", "pid": os.getpid(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """
+    Readiness: database latency, event loop lag, queued writes, WebSockets and
+    disk space, cached for HEALTH_CACHE_TTL. 503 when any check fails.
+    """
+    report = await health_checker.readiness()
+    return JSONResponse(status_code=503 if report["status"] == FAIL else 200, content=report)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Metrics of this worker in the Prometheus text format"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # run.py is the launcher; this keeps `python main.py` working without the reloader
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000))) 
\ No newline at end of file
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of texts accepted by the batch AI endpoints
+AI_BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", 100))
+
+class BatchTextRequest(BaseModel):
+    """Texts for a batch text-analysis or emoji-suggestion request"""
+    texts: List[str] = Field(..., min_length=1, max_length=AI_BATCH_MAX_ITEMS)
+    chat_id: Optional[str] = None
+
+class BatchSmartReplyRequest(BaseModel):
+    """Messages for a batch smart-reply request"""
+    messages: List[str] = Field(..., min_length=1, max_length=AI_BATCH_MAX_ITEMS)
+    chat_id: Optional[str] = None
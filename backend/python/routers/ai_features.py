@@ -2,16 +2,23 @@ from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File,
 from fastapi.responses import JSONResponse
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-import numpy as np
-from io import BytesIO
-from PIL import Image
-import re
 from auth.auth_bearer import JWTBearer
 from auth.auth_handler import verify_token
-from db.mongodb import get_collection
+from db.mongodb import get_collection, id_filter
+from services.keyword_matcher import RuleTable
+from services.image_analysis import image_pool, ImageTooLargeError, ImagePoolBusyError
+from services.text_analysis import analyze_text as run_text_analysis, analyze_batch
+from services.result_cache import cache_stats
+from services.uploads import ingest_upload, UploadTooLargeError, UnsupportedUploadError, IMAGE_MAX_BYTES
+from services.reply_ranker import reply_ranker
+from models.ai import BatchTextRequest, BatchSmartReplyRequest
 
 router = APIRouter()
 
+# Rule tables are compiled once and reloaded when their files change
+smart_reply_rules = RuleTable("smart_replies.json")
+emoji_rules = RuleTable("emoji_rules.json")
+
 @router.post("/smart-reply", dependencies=[Depends(JWTBearer())])
 async def get_smart_reply(
     message_content: str,
@@ -25,43 +32,42 @@ async def get_smart_reply(
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
-    # Simple dictionary of smart replies based on message patterns
-    # In a production environment, this would use a more sophisticated model
-    smart_replies = {
-        r"(?i)hello|hi|hey": ["Hello!", "Hi there!", "Hey, how are you?"],
-        r"(?i)how are you": ["I'm good, thanks!", "Doing well, how about you?", "Great, thanks for asking!"],
-        r"(?i)thank|thanks": ["You're welcome!", "No problem!", "Anytime!"],
-        r"(?i)bye|goodbye": ["Goodbye!", "See you later!", "Take care!"],
-        r"(?i)meeting|discuss": ["Let's schedule a call", "I'm available to discuss", "When are you free?"],
-        r"(?i)help|support": ["How can I help?", "I'm here to assist", "Let me know what you need"],
-        r"(?i)agree|yes": ["Great!", "Perfect!", "Sounds good!"],
-        r"(?i)disagree|no": ["I understand", "Let's find an alternative", "No problem"],
-        r"(?i)sorry|apologize": ["No worries!", "It's alright", "No problem at all"],
-        r"(?i)congratulations|congrats": ["Thank you!", "Appreciate it!", "Thanks!"],
-    }
+    # Replies learned from the chat's history (jobs/build_reply_index.py),
+    # topped up from the keyword rules in config/smart_replies.json
+    suggestions, source = reply_ranker.suggest(message_content, chat_id, user_id, smart_reply_rules)
     
-    # Find matching replies
-    suggestions = []
-    for pattern, replies in smart_replies.items():
-        if re.search(pattern, message_content):
-            suggestions.extend(replies)
-    
-    # If no matches, provide generic replies
-    if not suggestions:
-        suggestions = ["OK", "Thanks", "I'll get back to you", "Sounds good", "Let me check"]
+    return {
+        "success": True,
+        "suggestions": suggestions,
+        "source": source
+    }
+
+@router.post("/smart-reply/batch", dependencies=[Depends(JWTBearer())])
+async def get_smart_reply_batch(
+    request: BatchSmartReplyRequest,
+    token: str = Depends(JWTBearer())
+):
+    """
+    Generate smart reply suggestions for many messages in one request
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
     
-    # Limit to 3 suggestions
-    if len(suggestions) > 3:
-        suggestions = suggestions[:3]
+    results: Dict[str, List[str]] = {}
+    for message in request.messages:
+        if message not in results:
+            results[message] = reply_ranker.suggest(message, request.chat_id, user_id, smart_reply_rules)[0]
     
     return {
         "success": True,
-        "suggestions": suggestions
+        "results": [results[message] for message in request.messages]
     }
 
 @router.post("/text-analysis", dependencies=[Depends(JWTBearer())])
 async def analyze_text(
     text: str,
+    chat_id: Optional[str] = Query(None, description="Rank keywords by TF-IDF against this chat's history"),
     token: str = Depends(JWTBearer())
 ):
     """
@@ -71,50 +77,26 @@ async def analyze_text(
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
-    # Simple sentiment analysis based on keywords
-    # In a production environment, this would use a proper NLP model
-    positive_words = ["good", "great", "excellent", "amazing", "wonderful", "happy", "love", "like", "best", "perfect"]
-    negative_words = ["bad", "terrible", "awful", "horrible", "worst", "hate", "dislike", "poor", "annoying", "wrong"]
-    
-    text_lower = text.lower()
-    words = re.findall(r'\b\w+\b', text_lower)
-    
-    # Count positive and negative words
-    positive_count = sum(1 for word in words if word in positive_words)
-    negative_count = sum(1 for word in words if word in negative_words)
-    
-    # Determine sentiment
-    if positive_count > negative_count:
-        sentiment = "positive"
-    elif negative_count > positive_count:
-        sentiment = "negative"
-    else:
-        sentiment = "neutral"
-    
-    # Extract potential keywords (words longer than 4 letters, excluding common words)
-    common_words = ["about", "above", "after", "again", "against", "their", "them", "then", "there", "these", "they", "think", "this", "those", "thought", "through", "thus", "today", "together", "tomorrow", "tonight", "toward", "towards", "under", "until", "upon", "would", "your"]
-    keywords = [word for word in words if len(word) > 4 and word not in common_words]
-    
-    # Count frequency of each keyword
-    keyword_freq = {}
-    for word in keywords:
-        if word in keyword_freq:
-            keyword_freq[word] += 1
-        else:
-            keyword_freq[word] = 1
-    
-    # Sort keywords by frequency
-    sorted_keywords = sorted(keyword_freq.items(), key=lambda x: x[1], reverse=True)
-    top_keywords = [keyword for keyword, freq in sorted_keywords[:5]]
+    return {
+        "success": True,
+        "analysis": run_text_analysis(text, chat_id)
+    }
+
+@router.post("/text-analysis/batch", dependencies=[Depends(JWTBearer())])
+async def analyze_text_batch(
+    request: BatchTextRequest,
+    token: str = Depends(JWTBearer())
+):
+    """
+    Analyze many texts in one request
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
     
     return {
         "success": True,
-        "analysis": {
-            "sentiment": sentiment,
-            "keywords": top_keywords,
-            "word_count": len(words),
-            "character_count": len(text)
-        }
+        "results": analyze_batch(request.texts, request.chat_id)
     }
 
 @router.post("/image-recognition", dependencies=[Depends(JWTBearer())])
@@ -129,78 +111,37 @@ async def recognize_image(
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
-    # Check if file is an image
-    content_type = file.content_type
-    if not content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Read image file
-    contents = await file.read()
+    # Stream the upload into a spooled file, refusing it as soon as it passes the limit;
+    # the image type comes from its magic bytes, not the client's content type
+    try:
+        upload = await ingest_upload(file, IMAGE_MAX_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        # Open image with PIL
-        img = Image.open(BytesIO(contents))
-        
-        # Get basic image info
-        width, height = img.size
-        format_type = img.format
-        mode = img.mode
-        
-        # Analyze image color
+        # Decode and analyze in a worker process at reduced resolution
         # In a production environment, this would use a proper image recognition model
-        img_array = np.array(img)
-        
-        # Get average color if RGB
-        if mode == "RGB":
-            avg_color = img_array.mean(axis=(0, 1)).astype(int)
-            avg_color_hex = f"#{avg_color[0]:02x}{avg_color[1]:02x}{avg_color[2]:02x}"
-            
-            # Determine dominant color range
-            color_names = {
-                "red": [255, 0, 0],
-                "green": [0, 255, 0],
-                "blue": [0, 0, 255],
-                "yellow": [255, 255, 0],
-                "cyan": [0, 255, 255],
-                "magenta": [255, 0, 255],
-                "white": [255, 255, 255],
-                "black": [0, 0, 0],
-                "gray": [128, 128, 128]
-            }
-            
-            # Calculate color distances
-            color_distances = {}
-            for color_name, color_value in color_names.items():
-                distance = np.sqrt(np.sum((avg_color - color_value) ** 2))
-                color_distances[color_name] = distance
-            
-            # Find closest color
-            dominant_color = min(color_distances.items(), key=lambda x: x[1])[0]
-        else:
-            avg_color_hex = "N/A"
-            dominant_color = "N/A"
-        
-        # Estimate if image is light or dark
-        brightness = np.mean(img_array) / 255
-        tone = "light" if brightness > 0.5 else "dark"
-        
-        return {
-            "success": True,
-            "image_info": {
-                "filename": file.filename,
-                "format": format_type,
-                "width": width,
-                "height": height,
-                "mode": mode,
-                "avg_color": avg_color_hex,
-                "dominant_color": dominant_color,
-                "tone": tone,
-                "file_size_kb": len(contents) / 1024
-            }
-        }
-    
+        image_info = await image_pool.analyze(upload)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImagePoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    finally:
+        upload.close()
+    
+    return {
+        "success": True,
+        "image_info": {
+            "filename": file.filename,
+            **image_info,
+            "content_type": upload.media_type,
+            "file_size_kb": upload.size / 1024
+        }
+    }
 
 @router.post("/emoji-suggestion", dependencies=[Depends(JWTBearer())])
 async def suggest_emojis(
@@ -214,54 +155,47 @@ async def suggest_emojis(
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
-    # Simple emoji suggestions based on keywords
+    # Keyword rules live in config/emoji_rules.json
     # In a production environment, this would use a more sophisticated model
-    emoji_mappings = {
-        r"(?i)happy|joy|glad|smile": ["😊", "😄", "😁"],
-        r"(?i)sad|unhappy|upset": ["😔", "😢", "☹️"],
-        r"(?i)laugh|lol|haha|funny": ["😂", "🤣", "😆"],
-        r"(?i)love|heart|adore": ["❤️", "😍", "🥰"],
-        r"(?i)angry|mad|frustrated": ["😠", "😡", "🤬"],
-        r"(?i)surprise|wow|whoa": ["😮", "😲", "😯"],
-        r"(?i)food|eat|hungry": ["🍔", "🍕", "🍽️"],
-        r"(?i)drink|coffee|tea": ["☕", "🍺", "🥤"],
-        r"(?i)work|job|office|meeting": ["💼", "👔", "📊"],
-        r"(?i)home|house": ["🏠", "🏡", "🛋️"],
-        r"(?i)travel|trip|vacation": ["✈️", "🚗", "🏖️"],
-        r"(?i)music|song|sing": ["🎵", "🎶", "🎤"],
-        r"(?i)movie|film|watch": ["🎬", "🍿", "📺"],
-        r"(?i)book|read|study": ["📚", "📖", "✏️"],
-        r"(?i)sleep|tired|bed": ["😴", "💤", "🛌"],
-        r"(?i)celebration|party|birthday": ["🎉", "🎊", "🎂"],
-        r"(?i)thank|thanks|appreciate": ["🙏", "👍", "👏"],
-        r"(?i)phone|call": ["📱", "📞", "☎️"],
-        r"(?i)time|clock|late|soon": ["⏰", "⌚", "⏳"],
-        r"(?i)money|cash|pay": ["💰", "💵", "💸"],
-        r"(?i)idea|think|smart": ["💡", "🧠", "🤔"],
-        r"(?i)good|great|excellent": ["👍", "👌", "🔥"],
-        r"(?i)bad|wrong|terrible": ["👎", "❌", "🙈"],
-        r"(?i)ok|okay|alright": ["👌", "🆗", "👍"],
-        r"(?i)hello|hi|hey": ["👋", "🙋", "🤗"],
-        r"(?i)bye|goodbye|cya": ["👋", "✌️", "💛"],
-        r"(?i)question|help|confused": ["❓", "🤔", "🆘"],
-        r"(?i)yes|agree": ["✅", "👍", "🙌"],
-        r"(?i)no|disagree": ["❌", "👎", "🙅"],
-    }
-    
-    # Find matching emojis
-    suggested_emojis = []
-    for pattern, emojis in emoji_mappings.items():
-        if re.search(pattern, text):
-            suggested_emojis.extend(emojis)
-    
-    # If no matches, provide generic emoji suggestions
-    if not suggested_emojis:
-        suggested_emojis = ["👍", "❤️", "😊", "🙂", "👌"]
-    
-    # Remove duplicates and limit to 5 suggestions
-    suggested_emojis = list(dict.fromkeys(suggested_emojis))[:5]
+    suggested_emojis = emoji_rules.suggest(text)
     
     return {
         "success": True,
         "emojis": suggested_emojis
-    } 
\ No newline at end of file
+    } 
+
+@router.post("/emoji-suggestion/batch", dependencies=[Depends(JWTBearer())])
+async def suggest_emojis_batch(
+    request: BatchTextRequest,
+    token: str = Depends(JWTBearer())
+):
+    """
+    Suggest emojis for many texts in one request
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    
+    return {
+        "success": True,
+        "results": emoji_rules.suggest_batch(request.texts)
+    }
+
+@router.get("/cache-stats", dependencies=[Depends(JWTBearer())])
+async def get_cache_stats(token: str = Depends(JWTBearer())):
+    """
+    Hit rates and sizes of the AI result caches
+    Only available to admin and super-admin users
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+    # Verify admin privileges
+    users_collection = get_collection("users")
+    user = users_collection.find_one({"_id": id_filter(user_id)})
+
+    if not user or user.get("role") not in ["admin", "super-admin"]:
+        raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
+
+    return {"caches": cache_stats()}
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
-import pandas as pd
 from auth.auth_bearer import JWTBearer
 from auth.auth_handler import verify_token
-from db.mongodb import get_collection
+from db.mongodb import get_collection, id_filter, id_variants
+from db.concurrency import gather_queries, QueryTimeout
+from services.message_rollups import query_trends
+from services.compression import version_etag, etag_matches
 
 router = APIRouter()
 
@@ -25,7 +27,7 @@ async def get_user_activity(
     
     # Verify admin privileges
     users_collection = get_collection("users")
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one({"_id": id_filter(user_id)})
     
     if not user or user.get("role") not in ["admin", "super-admin"]:
         raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
@@ -55,16 +57,6 @@ async def get_user_activity(
         "createdAt": {"$gte": start, "$lt": end}
     }
     
-    # Calculate daily message counts
-    daily_messages = list(messages_collection.aggregate([
-        {"$match": message_query},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
-    ]))
-    
     # Get user login stats
     # Note: This assumes you have a log collection tracking user logins
     logs_collection = get_collection("logs")
@@ -73,30 +65,49 @@ async def get_user_activity(
         "timestamp": {"$gte": start, "$lt": end}
     }
     
-    daily_logins = list(logs_collection.aggregate([
-        {"$match": login_query},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
-    ]))
-    
-    # Get active user count (users who sent at least one message)
-    active_users = list(messages_collection.aggregate([
-        {"$match": message_query},
-        {"$group": {
-            "_id": "$sender",
-            "messageCount": {"$sum": 1}
-        }},
-        {"$count": "activeUsers"}
-    ]))
+    # The aggregations are independent, so they run at the same time
+    try:
+        results = await gather_queries({
+            # Daily message counts
+            "daily_messages": lambda: list(messages_collection.aggregate([
+                {"$match": message_query},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}},
+                    "count": {"$sum": 1}
+                }},
+                {"$sort": {"_id": 1}}
+            ])),
+            # Daily user logins
+            "daily_logins": lambda: list(logs_collection.aggregate([
+                {"$match": login_query},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                    "count": {"$sum": 1}
+                }},
+                {"$sort": {"_id": 1}}
+            ])),
+            # Active user count (users who sent at least one message)
+            "active_users": lambda: list(messages_collection.aggregate([
+                {"$match": message_query},
+                {"$group": {
+                    "_id": "$sender",
+                    "messageCount": {"$sum": 1}
+                }},
+                {"$count": "activeUsers"}
+            ])),
+            "total_users": lambda: users_collection.count_documents({})
+        })
+    except QueryTimeout as e:
+        print(f"Failed to get user activity: {e}")
+        raise HTTPException(status_code=504, detail="User activity took too long to compute")
+    
+    daily_messages = results["daily_messages"]
+    daily_logins = results["daily_logins"]
+    active_users = results["active_users"]
+    total_users = results["total_users"]
     
     active_user_count = active_users[0]["activeUsers"] if active_users else 0
     
-    # Get total user count
-    total_users = users_collection.count_documents({})
-    
     return {
         "totalUsers": total_users,
         "activeUsers": active_user_count,
@@ -120,7 +131,7 @@ async def get_chat_statistics(token: str = Depends(JWTBearer())):
     
     # Verify admin privileges
     users_collection = get_collection("users")
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one({"_id": id_filter(user_id)})
     
     if not user or user.get("role") not in ["admin", "super-admin"]:
         raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
@@ -128,49 +139,61 @@ async def get_chat_statistics(token: str = Depends(JWTBearer())):
     # Get chat stats
     chats_collection = get_collection("chats")
     
-    # Count of group vs direct chats
-    group_chat_count = chats_collection.count_documents({"isGroupChat": True})
-    direct_chat_count = chats_collection.count_documents({"isGroupChat": False})
-    
-    # Get average users per group chat
-    group_stats = list(chats_collection.aggregate([
-        {"$match": {"isGroupChat": True}},
-        {"$project": {
-            "_id": 1,
-            "userCount": {"$size": "$users"}
-        }},
-        {"$group": {
-            "_id": None,
-            "avgUsers": {"$avg": "$userCount"},
-            "maxUsers": {"$max": "$userCount"},
-            "minUsers": {"$min": "$userCount"}
-        }}
-    ]))
+    messages_collection = get_collection("messages")
     
+    # The counts and aggregations are independent, so they run at the same time
+    try:
+        results = await gather_queries({
+            # Count of group vs direct chats
+            "group_chat_count": lambda: chats_collection.count_documents({"isGroupChat": True}),
+            "direct_chat_count": lambda: chats_collection.count_documents({"isGroupChat": False}),
+            # Average users per group chat
+            "group_stats": lambda: list(chats_collection.aggregate([
+                {"$match": {"isGroupChat": True}},
+                {"$project": {
+                    "_id": 1,
+                    "userCount": {"$size": "$users"}
+                }},
+                {"$group": {
+                    "_id": None,
+                    "avgUsers": {"$avg": "$userCount"},
+                    "maxUsers": {"$max": "$userCount"},
+                    "minUsers": {"$min": "$userCount"}
+                }}
+            ])),
+            # Most active chats
+            "active_chats": lambda: list(messages_collection.aggregate([
+                {"$group": {
+                    "_id": "$chat",
+                    "messageCount": {"$sum": 1}
+                }},
+                {"$sort": {"messageCount": -1}},
+                {"$limit": 5},
+                {"$lookup": {
+                    "from": "chats",
+                    "localField": "_id",
+                    "foreignField": "_id",
+                    "as": "chatInfo"
+                }},
+                {"$unwind": "$chatInfo"},
+                {"$project": {
+                    "chatName": "$chatInfo.chatName",
+                    "isGroupChat": "$chatInfo.isGroupChat",
+                    "messageCount": 1
+                }}
+            ]))
+        })
+    except QueryTimeout as e:
+        print(f"Failed to get chat statistics: {e}")
+        raise HTTPException(status_code=504, detail="Chat statistics took too long to compute")
+    
+    group_chat_count = results["group_chat_count"]
+    direct_chat_count = results["direct_chat_count"]
+    group_stats = results["group_stats"]
     avg_users_per_group = group_stats[0]["avgUsers"] if group_stats else 0
-    
-    # Get most active chats
-    messages_collection = get_collection("messages")
-    active_chats = list(messages_collection.aggregate([
-        {"$group": {
-            "_id": "$chat",
-            "messageCount": {"$sum": 1}
-        }},
-        {"$sort": {"messageCount": -1}},
-        {"$limit": 5},
-        {"$lookup": {
-            "from": "chats",
-            "localField": "_id",
-            "foreignField": "_id",
-            "as": "chatInfo"
-        }},
-        {"$unwind": "$chatInfo"},
-        {"$project": {
-            "chatName": "$chatInfo.chatName",
-            "isGroupChat": "$chatInfo.isGroupChat",
-            "messageCount": 1
-        }}
-    ]))
+    active_chats = results["active_chats"]
+    for chat in active_chats:
+        chat["_id"] = str(chat["_id"])
     
     return {
         "groupChatCount": group_chat_count,
@@ -195,7 +218,7 @@ async def get_user_statistics(
     
     # Check permissions
     users_collection = get_collection("users")
-    user = users_collection.find_one({"_id": token_user_id})
+    user = users_collection.find_one({"_id": id_filter(token_user_id)})
     
     is_admin = user and user.get("role") in ["admin", "super-admin"]
     is_self = token_user_id == user_id
@@ -204,25 +227,26 @@ async def get_user_statistics(
         raise HTTPException(status_code=403, detail="Access denied: Not authorized to view this user's statistics")
     
     # Target user exists?
-    target_user = users_collection.find_one({"_id": user_id})
+    user_ids = id_variants(user_id)
+    target_user = users_collection.find_one({"_id": {"$in": user_ids}})
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Message stats
     messages_collection = get_collection("messages")
-    message_count = messages_collection.count_documents({"sender": user_id})
+    message_count = messages_collection.count_documents({"sender": {"$in": user_ids}})
     
     # Chat participation
     chats_collection = get_collection("chats")
-    participating_chats = chats_collection.count_documents({"users": user_id})
+    participating_chats = chats_collection.count_documents({"users": {"$in": user_ids}})
     
     # Group vs direct chats
-    group_chats = chats_collection.count_documents({"users": user_id, "isGroupChat": True})
-    direct_chats = chats_collection.count_documents({"users": user_id, "isGroupChat": False})
+    group_chats = chats_collection.count_documents({"users": {"$in": user_ids}, "isGroupChat": True})
+    direct_chats = chats_collection.count_documents({"users": {"$in": user_ids}, "isGroupChat": False})
     
     # Message activity by time
     activity_by_hour = list(messages_collection.aggregate([
-        {"$match": {"sender": user_id}},
+        {"$match": {"sender": {"$in": user_ids}}},
         {"$project": {
             "hour": {"$hour": "$createdAt"}
         }},
@@ -242,7 +266,7 @@ async def get_user_statistics(
     
     return {
         "user": {
-            "id": target_user["_id"],
+            "id": str(target_user["_id"]),
             "name": target_user["name"],
             "email": target_user["email"],
             "role": target_user["role"],
@@ -257,4 +281,66 @@ async def get_user_statistics(
             "directChats": direct_chats
         },
         "activityByHour": activity_hours
-    } 
\ No newline at end of file
+    } 
+
+@router.get("/message-trends", dependencies=[Depends(JWTBearer())])
+async def get_message_trends(
+    request: Request,
+    chat_id: Optional[str] = Query(None, description="Chat to report on (default: all chats)"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    top_k: int = Query(10, ge=1, le=50, description="Keywords per day"),
+    token: str = Depends(JWTBearer())
+):
+    """
+    Daily message sentiment and keyword trends from the rollups built by
+    jobs/build_message_rollups.py. Rollups only change when the checkpoint
+    moves, so a poll with a current If-None-Match is answered with 304.
+    Only available to admin and super-admin users
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    
+    # Verify admin privileges
+    users_collection = get_collection("users")
+    user = users_collection.find_one({"_id": id_filter(user_id)})
+    
+    if not user or user.get("role") not in ["admin", "super-admin"]:
+        raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
+    
+    # Parse dates
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else today - timedelta(days=30)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start_date format. Use YYYY-MM-DD")
+    
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) if end_date else today + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid end_date format. Use YYYY-MM-DD")
+    
+    if end <= start or end - start > timedelta(days=366):
+        raise HTTPException(status_code=400, detail="Date range must be between 1 and 366 days")
+    
+    checkpoint = get_collection("analytics_checkpoints").find_one({"_id": "message_rollups"}) or {}
+    
+    # The checkpoint is the data version: check it before reading any rollups
+    etag = version_etag("message-trends", checkpoint.get("updatedAt"), chat_id, start.date(), end.date(), top_k)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    return JSONResponse(
+        content={
+            "chatId": chat_id,
+            "trends": query_trends(chat_id, start, end, top_k),
+            "updatedAt": checkpoint.get("updatedAt"),
+            "dateRange": {
+                "start": start.strftime("%Y-%m-%d"),
+                "end": (end - timedelta(days=1)).strftime("%Y-%m-%d")
+            }
+        },
+        headers={"ETag": etag}
+    )
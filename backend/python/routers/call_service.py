@@ -2,16 +2,136 @@ from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSock
 from fastapi.responses import JSONResponse
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+import base64
 import json
+import os
+import time
+from bson import ObjectId
+from pymongo import UpdateOne
 from auth.auth_bearer import JWTBearer
-from auth.auth_handler import verify_token
+from auth.auth_handler import verify_token, verify_token_cached
 from db.mongodb import get_collection
+from db.concurrency import gather_queries
+from services.connection_manager import ConnectionManager, CLOSE_POLICY_VIOLATION
+from services.call_telemetry import call_telemetry
+from services.metrics import registry, websocket_messages_received
+from services.rooms import Room, RoomFullError, ROLE_HOST
 
 router = APIRouter()
 
 # Store for active calls and connected clients
-active_calls = {}  # call_id -> {participants: [user_ids], start_time, call_type}
-connected_clients = {}  # user_id -> WebSocket
+active_calls = {}  # call_id -> {room: Room, members: {user_ids}, start_time, call_type}
+connected_clients = ConnectionManager()  # user_id -> set of WebSockets
+
+# Signaling message types, anything else is counted as "other"
+MESSAGE_TYPES = {"signal", "join_call", "resync", "set_role", "stats", "leave_call"}
+
+registry.callback("websocket_open_connections", "Open signaling WebSockets", (), lambda: [((), connected_clients.connection_count)])
+registry.callback("active_calls", "Calls in progress in this worker", (), lambda: [((), len(active_calls))])
+
+# How long a user's total call count is reused across history pages
+CALL_COUNT_CACHE_TTL = int(os.getenv("CALL_COUNT_CACHE_TTL", 60))
+_call_count_cache = {}  # user_id -> (total, cached_at)
+
+# Serves the history filter and its (start_time, _id) sort from the index alone
+CALL_HISTORY_INDEX = [("participants", 1), ("start_time", -1), ("_id", -1)]
+_indexes_created = False
+
+def _ensure_indexes(calls_collection):
+    """
+    Create the call history index on first use
+    """
+    global _indexes_created
+    if not _indexes_created:
+        calls_collection.create_index(CALL_HISTORY_INDEX, name="participants_start_time_id")
+        _indexes_created = True
+
+def _encode_cursor(call: Dict[str, Any]) -> str:
+    payload = json.dumps({"t": call["start_time"].isoformat(), "id": str(call["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _invalidate_call_counts(user_ids):
+    for participant_id in user_ids:
+        _call_count_cache.pop(participant_id, None)
+
+def _count_user_calls(calls_collection, user_id: str) -> int:
+    cached = _call_count_cache.get(user_id)
+    if cached and time.time() - cached[1] < CALL_COUNT_CACHE_TTL:
+        return cached[0]
+    total = calls_collection.count_documents({"participants": user_id})
+    _call_count_cache[user_id] = (total, time.time())
+    return total
+
+def _summary_updates(call_data: Dict[str, Any], end_time: datetime, duration: float) -> List[UpdateOne]:
+    """
+    Build the per-user summary increments for a finished call
+    """
+    minutes = duration / 60
+    day = call_data["start_time"].strftime("%Y-%m-%d")
+    return [
+        UpdateOne(
+            {"_id": member_id},
+            {
+                "$inc": {
+                    "total_calls": 1,
+                    "total_minutes": minutes,
+                    f"minutes_by_type.{call_data['call_type']}": minutes,
+                    f"calls_by_day.{day}": 1
+                },
+                "$set": {"updated_at": end_time}
+            },
+            upsert=True
+        )
+        for member_id in call_data["members"]
+    ]
+
+def _finalize_call(call_id: str, call_data: Dict[str, Any]) -> float:
+    """
+    Mark a call as ended, fold it into the participants' summaries and
+    remove it from active calls. Returns the call duration in seconds.
+    """
+    # Calculate call duration
+    start_time = call_data["start_time"]
+    end_time = datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    
+    # Update call log
+    try:
+        calls_collection = get_collection("calls")
+        calls_collection.update_one(
+            {"call_id": call_id},
+            {
+                "$set": {
+                    "status": "ended",
+                    "end_time": end_time,
+                    "duration": duration
+                }
+            }
+        )
+    except Exception as e:
+        print(f"Failed to update call log: {e}")
+    
+    # Write out the call's remaining quality windows
+    call_telemetry.finish_call(call_id)
+    
+    # Maintain per-user aggregates incrementally
+    try:
+        summaries_collection = get_collection("call_summaries")
+        summaries_collection.bulk_write(_summary_updates(call_data, end_time, duration), ordered=False)
+    except Exception as e:
+        print(f"Failed to update call summaries: {e}")
+    
+    # Remove call from active calls
+    call_data["room"].close()
+    active_calls.pop(call_id, None)
+    return duration
 
 @router.post("/create", dependencies=[Depends(JWTBearer())])
 async def create_call(
@@ -42,9 +162,19 @@ async def create_call(
     import uuid
     call_id = str(uuid.uuid4())
     
+    # Set up the call room, the caller hosts it
+    room = Room(call_id, connected_clients.send_to_users)
+    try:
+        room.add(user_id, ROLE_HOST)
+        for participant_id in participants:
+            room.add(participant_id)
+    except RoomFullError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # Store call data
     active_calls[call_id] = {
-        "participants": participants,
+        "room": room,
+        "members": set(participants),
         "start_time": datetime.now(),
         "call_type": call_type,
         "initiator": user_id
@@ -64,6 +194,7 @@ async def create_call(
             "duration": None
         }
         calls_collection.insert_one(call_log)
+        _invalidate_call_counts(participants)
     except Exception as e:
         print(f"Failed to log call creation: {e}")
     
@@ -92,32 +223,10 @@ async def end_call(
     
     # Check if user is a participant
     call_data = active_calls[call_id]
-    if user_id not in call_data["participants"]:
+    if user_id not in call_data["room"]:
         raise HTTPException(status_code=403, detail="You are not a participant in this call")
     
-    # Calculate call duration
-    start_time = call_data["start_time"]
-    end_time = datetime.now()
-    duration = (end_time - start_time).total_seconds()
-    
-    # Update call log
-    try:
-        calls_collection = get_collection("calls")
-        calls_collection.update_one(
-            {"call_id": call_id},
-            {
-                "$set": {
-                    "status": "ended",
-                    "end_time": end_time,
-                    "duration": duration
-                }
-            }
-        )
-    except Exception as e:
-        print(f"Failed to update call log: {e}")
-    
-    # Remove call from active calls
-    del active_calls[call_id]
+    duration = _finalize_call(call_id, call_data)
     
     return {
         "success": True,
@@ -137,10 +246,10 @@ async def get_active_calls(token: str = Depends(JWTBearer())):
     # Find calls where user is a participant
     user_calls = []
     for call_id, call_data in active_calls.items():
-        if user_id in call_data["participants"]:
+        if user_id in call_data["room"]:
             user_calls.append({
                 "call_id": call_id,
-                "participants": call_data["participants"],
+                "participants": call_data["room"].participants,
                 "call_type": call_data["call_type"],
                 "start_time": call_data["start_time"].isoformat(),
                 "duration": (datetime.now() - call_data["start_time"]).total_seconds()
@@ -153,64 +262,165 @@ async def get_active_calls(token: str = Depends(JWTBearer())):
 
 @router.get("/call-history", dependencies=[Depends(JWTBearer())])
 async def get_call_history(
-    limit: int = Query(10, description="Number of records to return"),
-    offset: int = Query(0, description="Number of records to skip"),
+    limit: int = Query(10, ge=1, le=100, description="Number of records to return"),
+    offset: int = Query(0, ge=0, description="Number of records to skip (ignored when cursor is given)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_total: bool = Query(True, description="Include the total number of calls"),
     token: str = Depends(JWTBearer())
 ):
     """
     Get call history for the authenticated user
+    Pages are fetched by keyset on (start_time, _id); pass next_cursor to continue
     """
     user_id = verify_token(token)
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
+    query = {"participants": user_id}
+    if cursor:
+        cursor_time, cursor_id = _decode_cursor(cursor)
+        query["$or"] = [
+            {"start_time": {"$lt": cursor_time}},
+            {"start_time": cursor_time, "_id": {"$lt": cursor_id}}
+        ]
+    
     try:
         calls_collection = get_collection("calls")
-        call_history = list(calls_collection.find(
-            {"participants": user_id},
-            {"_id": 0}  # Exclude MongoDB ID
-        ).sort("start_time", -1).skip(offset).limit(limit))
+        _ensure_indexes(calls_collection)
+        
+        # Fetch one extra record to know whether another page exists
+        history_cursor = calls_collection.find(query).sort([("start_time", -1), ("_id", -1)])
+        if not cursor and offset:
+            history_cursor = history_cursor.skip(offset)
+        queries = {"history": lambda: list(history_cursor.limit(limit + 1))}
+        if include_total:
+            # Independent of the page, so counted at the same time
+            queries["total"] = lambda: _count_user_calls(calls_collection, user_id)
+        results = await gather_queries(queries)
+        call_history = results["history"]
         
-        # Format datetime objects
+        has_more = len(call_history) > limit
+        call_history = call_history[:limit]
+        next_cursor = _encode_cursor(call_history[-1]) if has_more else None
+        
+        # Format datetime objects and drop the MongoDB ID
         for call in call_history:
+            del call["_id"]
             call["start_time"] = call["start_time"].isoformat()
             if call["end_time"]:
                 call["end_time"] = call["end_time"].isoformat()
         
-        total_calls = calls_collection.count_documents({"participants": user_id})
-        
-        return {
+        response = {
             "success": True,
             "call_history": call_history,
-            "total": total_calls,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": next_cursor,
+            "has_more": has_more
         }
+        if include_total:
+            response["total"] = results["total"]
+        return response
     except Exception as e:
         print(f"Failed to get call history: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve call history")
 
+@router.get("/summary", dependencies=[Depends(JWTBearer())])
+async def get_call_summary(
+    days: int = Query(30, ge=1, le=366, description="Number of days of per-day counts to return"),
+    token: str = Depends(JWTBearer())
+):
+    """
+    Get aggregate call statistics for the authenticated user
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    
+    try:
+        summaries_collection = get_collection("call_summaries")
+        summary = summaries_collection.find_one({"_id": user_id}) or {}
+    except Exception as e:
+        print(f"Failed to get call summary: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve call summary")
+    
+    # Keep only the requested window of per-day counts
+    first_day = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    calls_by_day = summary.get("calls_by_day", {})
+    daily_calls = [
+        {"date": day, "count": calls_by_day[day]}
+        for day in sorted(calls_by_day)
+        if day >= first_day
+    ]
+    
+    return {
+        "success": True,
+        "summary": {
+            "total_calls": summary.get("total_calls", 0),
+            "total_minutes": round(summary.get("total_minutes", 0), 2),
+            "minutes_by_type": {
+                call_type: round(minutes, 2)
+                for call_type, minutes in summary.get("minutes_by_type", {}).items()
+            },
+            "daily_calls": daily_calls,
+            "updated_at": summary["updated_at"].isoformat() if summary.get("updated_at") else None
+        }
+    }
+
+def _websocket_token(websocket: WebSocket) -> Optional[str]:
+    """
+    Extract the JWT from the handshake, either the `token` query parameter
+    (browsers cannot set headers on WebSockets) or an Authorization header
+    """
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, credentials = authorization.partition(" ")
+    if scheme == "Bearer" and credentials:
+        return credentials
+    return None
+
+async def drain():
+    """
+    Close every signaling socket with 1001 so clients reconnect to another
+    worker, then end the calls still in progress
+    """
+    closed = await connected_clients.close_all()
+    for call_id, call_data in list(active_calls.items()):
+        _finalize_call(call_id, call_data)
+    if closed:
+        print(f"Closed {closed} WebSocket connections for shutdown")
+
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
     """
     WebSocket endpoint for call signaling
     """
-    await websocket.accept()
+    # Authenticate once during the handshake
+    token = _websocket_token(websocket)
+    token_user_id = verify_token_cached(token) if token else None
+    if not token_user_id or token_user_id != user_id:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
     
-    # Store the WebSocket connection
-    connected_clients[user_id] = websocket
+    # Store the WebSocket connection alongside the user's other devices
+    if not await connected_clients.connect(user_id, websocket):
+        return
     
     try:
         while True:
             data = await websocket.receive_text()
             message = json.loads(data)
+            message_type = message.get("type")
+            websocket_messages_received.inc(message_type if message_type in MESSAGE_TYPES else "other")
             
             # Handle different message types
             if message["type"] == "signal":
-                # Forward signaling data to target user
+                # Forward signaling data to every device of the target user
                 target_user_id = message["target"]
                 if target_user_id in connected_clients:
-                    await connected_clients[target_user_id].send_text(data)
+                    await connected_clients.send_to_user(target_user_id, data)
                 else:
                     # Target user not connected
                     await websocket.send_text(json.dumps({
@@ -223,18 +433,19 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 # User is joining a call
                 call_id = message["call_id"]
                 if call_id in active_calls:
-                    # Add user to call participants if not already there
-                    if user_id not in active_calls[call_id]["participants"]:
-                        active_calls[call_id]["participants"].append(user_id)
-                    
-                    # Notify all participants that a user joined
-                    for participant_id in active_calls[call_id]["participants"]:
-                        if participant_id in connected_clients and participant_id != user_id:
-                            await connected_clients[participant_id].send_text(json.dumps({
-                                "type": "user_joined",
-                                "call_id": call_id,
-                                "user_id": user_id
-                            }))
+                    room = active_calls[call_id]["room"]
+                    try:
+                        # Participants are notified in batches by the room
+                        room.join(user_id)
+                    except RoomFullError as e:
+                        await websocket.send_text(json.dumps({
+                            "type": "error",
+                            "message": str(e),
+                            "call_id": call_id
+                        }))
+                    else:
+                        active_calls[call_id]["members"].add(user_id)
+                        await websocket.send_text(json.dumps(room.snapshot()))
                 else:
                     # Call doesn't exist
                     await websocket.send_text(json.dumps({
@@ -243,95 +454,74 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                         "call_id": call_id
                     }))
             
+            elif message["type"] == "resync":
+                # Client noticed a gap in room event sequence numbers
+                call_id = message.get("call_id")
+                if call_id in active_calls and user_id in active_calls[call_id]["room"]:
+                    room = active_calls[call_id]["room"]
+                    events = room.events_since(int(message.get("seq", 0)))
+                    if events is None:
+                        # Too far behind, send the full state instead
+                        await websocket.send_text(json.dumps(room.snapshot()))
+                    else:
+                        await websocket.send_text(room.events_message(events))
+                else:
+                    await websocket.send_text(json.dumps({
+                        "type": "error",
+                        "message": "Call not found",
+                        "call_id": call_id
+                    }))
+            
+            elif message["type"] == "set_role":
+                # The host promotes or demotes a participant
+                call_id = message.get("call_id")
+                room = active_calls[call_id]["room"] if call_id in active_calls else None
+                try:
+                    if not room or room.role_of(user_id) != ROLE_HOST:
+                        raise ValueError("Only the host can change roles")
+                    room.set_role(message.get("user_id"), message.get("role"))
+                except (ValueError, RoomFullError) as e:
+                    await websocket.send_text(json.dumps({
+                        "type": "error",
+                        "message": str(e),
+                        "call_id": call_id
+                    }))
+            
+            elif message["type"] == "stats":
+                # Call quality sample (rtt, jitter, packet_loss, bitrate), aggregated in memory
+                call_id = message.get("call_id")
+                row = call_telemetry.parse_sample(message)
+                if call_id in active_calls and user_id in active_calls[call_id]["room"] and row:
+                    call_telemetry.add_sample(call_id, row)
+                else:
+                    await websocket.send_text(json.dumps({
+                        "type": "error",
+                        "message": "Invalid stats message",
+                        "call_id": call_id
+                    }))
+            
             elif message["type"] == "leave_call":
                 # User is leaving a call
                 call_id = message["call_id"]
-                if call_id in active_calls and user_id in active_calls[call_id]["participants"]:
-                    # Remove user from call participants
-                    active_calls[call_id]["participants"].remove(user_id)
-                    
+                if call_id in active_calls and active_calls[call_id]["room"].leave(user_id):
                     # If no participants left, end the call
-                    if not active_calls[call_id]["participants"]:
-                        # Calculate call duration
-                        start_time = active_calls[call_id]["start_time"]
-                        end_time = datetime.now()
-                        duration = (end_time - start_time).total_seconds()
-                        
-                        # Update call log
-                        try:
-                            calls_collection = get_collection("calls")
-                            calls_collection.update_one(
-                                {"call_id": call_id},
-                                {
-                                    "$set": {
-                                        "status": "ended",
-                                        "end_time": end_time,
-                                        "duration": duration
-                                    }
-                                }
-                            )
-                        except Exception as e:
-                            print(f"Failed to update call log: {e}")
-                        
-                        # Remove call from active calls
-                        del active_calls[call_id]
-                    else:
-                        # Notify remaining participants that a user left
-                        for participant_id in active_calls[call_id]["participants"]:
-                            if participant_id in connected_clients:
-                                await connected_clients[participant_id].send_text(json.dumps({
-                                    "type": "user_left",
-                                    "call_id": call_id,
-                                    "user_id": user_id
-                                }))
+                    if not len(active_calls[call_id]["room"]):
+                        _finalize_call(call_id, active_calls[call_id])
     
     except WebSocketDisconnect:
-        # Remove the WebSocket connection
-        if user_id in connected_clients:
-            del connected_clients[user_id]
+        # Remove the WebSocket connection; the user only leaves their calls
+        # once their last device is gone
+        if not connected_clients.disconnect(user_id, websocket):
+            return
         
         # Remove user from any active calls
         for call_id, call_data in list(active_calls.items()):
-            if user_id in call_data["participants"]:
-                call_data["participants"].remove(user_id)
-                
+            if call_data["room"].leave(user_id, "user_disconnected"):
                 # If no participants left, end the call
-                if not call_data["participants"]:
-                    # Calculate call duration
-                    start_time = call_data["start_time"]
-                    end_time = datetime.now()
-                    duration = (end_time - start_time).total_seconds()
-                    
-                    # Update call log
-                    try:
-                        calls_collection = get_collection("calls")
-                        calls_collection.update_one(
-                            {"call_id": call_id},
-                            {
-                                "$set": {
-                                    "status": "ended",
-                                    "end_time": end_time,
-                                    "duration": duration
-                                }
-                            }
-                        )
-                    except Exception as e:
-                        print(f"Failed to update call log: {e}")
-                    
-                    # Remove call from active calls
-                    del active_calls[call_id]
-                else:
-                    # Notify remaining participants that a user disconnected
-                    for participant_id in call_data["participants"]:
-                        if participant_id in connected_clients:
-                            await connected_clients[participant_id].send_text(json.dumps({
-                                "type": "user_disconnected",
-                                "call_id": call_id,
-                                "user_id": user_id
-                            }))
+                if not len(call_data["room"]):
+                    _finalize_call(call_id, call_data)
     
     except Exception as e:
         print(f"WebSocket error: {e}")
         # Clean up if something goes wrong
-        if user_id in connected_clients:
-            del connected_clients[user_id] 
\ No newline at end of file
+        connected_clients.disconnect(user_id, websocket)
\ No newline at end of file
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+import asyncio
+import os
+from auth.auth_bearer import JWTBearer
+from auth.auth_handler import verify_token
+from db.mongodb import get_collection, id_filter
+from services.profiler import stack_sampler, slow_requests, PROFILE_MAX_SECONDS, PROFILE_INTERVAL_MS, SLOW_REQUEST_MS
+
+router = APIRouter()
+
+@router.get("/profile", dependencies=[Depends(JWTBearer())])
+async def profile_worker(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(PROFILE_INTERVAL_MS, ge=1, le=1000),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+    token: str = Depends(JWTBearer())
+):
+    """
+    Sample the stacks of every thread of the worker that serves this request
+    for the given seconds. The collapsed output feeds flamegraph.pl or
+    speedscope directly; the event loop is the MainThread stacks.
+    Only available to admin and super-admin users
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+    # Verify admin privileges
+    users_collection = get_collection("users")
+    user = users_collection.find_one({"_id": id_filter(user_id)})
+
+    if not user or user.get("role") not in ["admin", "super-admin"]:
+        raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
+
+    if seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {PROFILE_MAX_SECONDS:g}")
+    if stack_sampler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+
+    # Sample from a thread so the event loop keeps serving, and is profiled
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, stack_sampler.sample, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "json":
+        return {
+            "pid": os.getpid(),
+            "samples": result["samples"],
+            "seconds": result["seconds"],
+            "interval_ms": result["interval_ms"],
+            "stacks": dict(result["stacks"].most_common())
+        }
+    return PlainTextResponse(
+        stack_sampler.collapsed(result),
+        headers={"X-Profile-Pid": str(os.getpid()), "X-Profile-Samples": str(result["samples"])}
+    )
+
+@router.get("/slow-requests", dependencies=[Depends(JWTBearer())])
+async def get_slow_requests(
+    limit: int = Query(50, ge=1, le=1000),
+    token: str = Depends(JWTBearer())
+):
+    """
+    Most recent requests of this worker slower than SLOW_REQUEST_MS, newest
+    first, with their database time per operation and where they waited
+    Only available to admin and super-admin users
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+    # Verify admin privileges
+    users_collection = get_collection("users")
+    user = users_collection.find_one({"_id": id_filter(user_id)})
+
+    if not user or user.get("role") not in ["admin", "super-admin"]:
+        raise HTTPException(status_code=403, detail="Access denied: Admin privileges required")
+
+    return {
+        "pid": os.getpid(),
+        "threshold_ms": SLOW_REQUEST_MS,
+        "requests": slow_requests.recent(limit)
+    }
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+import base64
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from auth.auth_bearer import JWTBearer
+from auth.auth_handler import verify_token
+from db.mongodb import get_collection
+from services.search_index import search_index
+
+router = APIRouter()
+
+def _encode_cursor(created_at: int, message_id: ObjectId) -> str:
+    payload = json.dumps({"t": created_at, "id": str(message_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(payload["t"]), ObjectId(payload["id"]).binary
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _member_chat_ids(user_id: str) -> List[ObjectId]:
+    # chats.users holds ObjectIds written by the Node backend
+    members = [user_id]
+    try:
+        members.append(ObjectId(user_id))
+    except (InvalidId, TypeError):
+        pass
+    chats_collection = get_collection("chats")
+    return [chat["_id"] for chat in chats_collection.find({"users": {"$in": members}}, {"_id": 1})]
+
+@router.get("/messages", dependencies=[Depends(JWTBearer())])
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200, description='Words, "exact phrases" and prefix* terms, all required'),
+    chat_id: Optional[str] = Query(None, description="Only search this chat"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    token: str = Depends(JWTBearer())
+):
+    """
+    Search the text messages of the chats the current user belongs to, newest first
+    """
+    user_id = verify_token(token)
+    if not user_id:
+        raise HTTPException(status_code=403, detail="Invalid token")
+    
+    chats = {chat.binary for chat in _member_chat_ids(user_id) if isinstance(chat, ObjectId)}
+    if chat_id:
+        try:
+            requested = ObjectId(chat_id).binary
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid chat_id")
+        if requested not in chats:
+            raise HTTPException(status_code=403, detail="Access denied: Not a member of this chat")
+        chats = {requested}
+    
+    before = _decode_cursor(cursor) if cursor else None
+    
+    # Fetch one extra hit to know whether another page exists
+    hits = search_index.search(q, chats, limit + 1, before)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    
+    # Messages deleted since they were indexed are left out
+    messages_collection = get_collection("messages")
+    messages = {
+        message["_id"]: message
+        for message in messages_collection.find(
+            {"_id": {"$in": [hit.message_id for hit in hits]}, "isDeleted": {"$ne": True}},
+            {"sender": 1, "chat": 1, "content": 1, "createdAt": 1}
+        )
+    }
+    
+    results = []
+    for hit in hits:
+        message = messages.get(hit.message_id)
+        if message:
+            results.append({
+                "id": str(message["_id"]),
+                "chat": str(message["chat"]),
+                "sender": str(message.get("sender")),
+                "content": message.get("content"),
+                "createdAt": message.get("createdAt")
+            })
+    
+    return {
+        "success": True,
+        "results": results,
+        "next_cursor": _encode_cursor(hits[-1].created_at, hits[-1].message_id) if has_more else None,
+        "has_more": has_more
+    }
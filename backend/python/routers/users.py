@@ -4,14 +4,30 @@ from typing import List, Dict, Any, Optional
 from pymongo import ReturnDocument
 from datetime import datetime, timedelta
 import os
+import time
 import uuid
 from auth.auth_bearer import JWTBearer
 from auth.auth_handler import verify_token
-from db.mongodb import get_collection
+from db.mongodb import get_collection, id_filter
 from models.user import User, UserBase, Status
+from services.uploads import ingest_upload, UploadTooLargeError, UnsupportedUploadError, AVATAR_MAX_BYTES
+from services.change_feed import change_feed
+from services.events import UserUpdated, event_bus
 
 router = APIRouter()
 
+# The online list is reused until the change feed reports a status change,
+# and at most this many seconds; without the feed it is read every time
+ONLINE_USERS_CACHE_TTL = int(os.getenv("ONLINE_USERS_CACHE_TTL", 30))
+_online_users_cache = None  # (cached_at, formatted users)
+
+def _invalidate_online_users(event: Optional[UserUpdated] = None):
+    global _online_users_cache
+    if event is None or event.deleted or event.fields is None or "status" in event.fields:
+        _online_users_cache = None
+
+event_bus.subscribe(UserUpdated, _invalidate_online_users)
+
 @router.get("/sync", dependencies=[Depends(JWTBearer())])
 async def sync_users_from_node(token: str = Depends(JWTBearer())):
     """
@@ -24,7 +40,7 @@ async def sync_users_from_node(token: str = Depends(JWTBearer())):
     
     # Verify super-admin privileges
     users_collection = get_collection("users")
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one({"_id": id_filter(user_id)})
     
     if not user or user.get("role") != "super-admin":
         raise HTTPException(status_code=403, detail="Access denied: Super-admin privileges required")
@@ -62,6 +78,15 @@ async def get_online_users(token: str = Depends(JWTBearer())):
     if not user_id:
         raise HTTPException(status_code=403, detail="Invalid token")
     
+    global _online_users_cache
+    if change_feed.running and _online_users_cache and time.time() - _online_users_cache[0] < ONLINE_USERS_CACHE_TTL:
+        formatted_users = _online_users_cache[1]
+        return {
+            "success": True,
+            "count": len(formatted_users),
+            "users": formatted_users
+        }
+    
     # Get online users from MongoDB
     users_collection = get_collection("users")
     online_users = list(users_collection.find({"status": "online"}, {
@@ -76,6 +101,7 @@ async def get_online_users(token: str = Depends(JWTBearer())):
         user["id"] = str(user["_id"])
         del user["_id"]
         formatted_users.append(user)
+    _online_users_cache = (time.time(), formatted_users)
     
     return {
         "success": True,
@@ -98,7 +124,7 @@ async def update_user_status(
     # Update user status in MongoDB
     users_collection = get_collection("users")
     updated_user = users_collection.find_one_and_update(
-        {"_id": user_id},
+        {"_id": id_filter(user_id)},
         {
             "$set": {
                 "status": status,
@@ -115,6 +141,7 @@ async def update_user_status(
     
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
+    _invalidate_online_users()
     
     # Format user data
     updated_user["id"] = str(updated_user["_id"])
@@ -140,34 +167,33 @@ async def upload_avatar(
     
     # Verify user exists
     users_collection = get_collection("users")
-    user = users_collection.find_one({"_id": user_id})
+    user = users_collection.find_one({"_id": id_filter(user_id)})
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Validate file is an image
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Get file extension
-    file_ext = os.path.splitext(file.filename)[1]
-    if not file_ext:
-        file_ext = ".jpg"  # Default to jpg if no extension
+    # Stream the upload with a size cap and check it really is an image
+    try:
+        upload = await ingest_upload(file, AVATAR_MAX_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Create unique filename
-    filename = f"avatar_{user_id}_{uuid.uuid4().hex}{file_ext}"
+    # The extension follows the sniffed type, not the client's filename
+    filename = f"avatar_{user_id}_{uuid.uuid4().hex}{upload.extension}"
     file_path = f"uploads/avatars/{filename}"
     
     # Create directory if it doesn't exist
     os.makedirs("uploads/avatars", exist_ok=True)
     
     # Save the file
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    with upload:
+        upload.save(file_path)
     
     # Update user profile in MongoDB
     updated_user = users_collection.find_one_and_update(
-        {"_id": user_id},
+        {"_id": id_filter(user_id)},
         {"$set": {"profilePic": filename}},
         return_document=ReturnDocument.AFTER,
         projection={
@@ -1,5 +1,10 @@
-import uvicorn
+import asyncio
+import argparse
+import importlib.util
+import inspect
 import os
+import sys
+import uvicorn
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -7,14 +12,104 @@ load_dotenv()
 
 # Get port from environment variables or use default
 PORT = int(os.getenv("PORT", 8000))
+HOST = os.getenv("HOST", "0.0.0.0")
 DEBUG = os.getenv("DEBUG", "True").lower() in ["true", "1", "t", "yes"]
+# "production" runs the multi-worker server below instead of the reloader
+SERVER_MODE = os.getenv("SERVER_MODE", "development")
 
-if __name__ == "__main__":
-    print(f"Starting Chatware Python API on port {PORT}")
-    print(f"Debug mode: {'Enabled' if DEBUG else 'Disabled'}")
-    uvicorn.run(
+# Production tuning
+WORKERS = int(os.getenv("WORKERS") or os.getenv("WEB_CONCURRENCY") or 0)
+# Longer than the load balancer's idle timeout, so it closes idle connections first
+KEEP_ALIVE_TIMEOUT = int(os.getenv("KEEP_ALIVE_TIMEOUT", 75))
+BACKLOG = int(os.getenv("BACKLOG", 2048))
+# Seconds in-flight requests get to finish after SIGTERM, and WebSockets to close
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 5))
+PRELOAD_APP = os.getenv("PRELOAD_APP", "True").lower() in ["true", "1", "t", "yes"]
+
+def cpu_count() -> int:
+    # CPUs this process may run on, which respects container CPU sets
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def worker_count() -> int:
+    if WORKERS > 0:
+        return WORKERS
+    enabled = os.getenv("ENABLED_ROUTERS") or ""
+    if not enabled or "calls" in enabled.split(","):
+        # Call rooms and signaling sockets live in process memory; two users of
+        # one call must reach the same worker, so the calls router runs as a
+        # single worker unless WORKERS says otherwise (e.g. with sticky routing)
+        return 1
+    return cpu_count()
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that lets the app close its WebSockets cleanly on SIGTERM,
+    before uvicorn drops the remaining connections and runs the shutdown hooks
+    that flush pending writes
+    """
+
+    async def shutdown(self, sockets=None):
+        app_module = sys.modules.get("main")
+        if app_module is not None:
+            try:
+                await asyncio.wait_for(app_module.drain(), DRAIN_TIMEOUT)
+            except Exception as e:
+                print(f"Failed to drain connections: {e!r}")
+        await super().shutdown(sockets)
+
+def run_production():
+    workers = worker_count()
+    config = uvicorn.Config(
         "main:app",
-        host="0.0.0.0",
+        host=HOST,
         port=PORT,
-        reload=DEBUG
-    ) 
\ No newline at end of file
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        backlog=BACKLOG,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        access_log=False
+    )
+    print(f"Starting Chatware Python API on port {PORT} with {workers} worker(s), loop={config.loop}, http={config.http}")
+
+    if PRELOAD_APP:
+        # Load configuration and check the database once, before any worker starts
+        import main
+        main.preload()
+
+    server = DrainingServer(config)
+    if workers == 1:
+        server.run()
+        return
+
+    from uvicorn.supervisors import Multiprocess
+    sock = config.bind_socket()
+    if "target" in inspect.signature(Multiprocess).parameters:
+        Multiprocess(config, server.run, [sock]).run()
+    else:
+        # Newer uvicorn runs its own Server in each worker; the app's shutdown
+        # hook still drains, after uvicorn has closed the sockets itself
+        Multiprocess(config, [sock]).run()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Chatware Python API")
+    parser.add_argument("--production", action="store_true", help="Same as SERVER_MODE=production")
+    args = parser.parse_args()
+
+    if args.production or SERVER_MODE == "production":
+        run_production()
+    else:
+        print(f"Starting Chatware Python API on port {PORT}")
+        print(f"Debug mode: {'Enabled' if DEBUG else 'Disabled'}")
+        uvicorn.run(
+            "main:app",
+            host=HOST,
+            port=PORT,
+            reload=DEBUG
+        )
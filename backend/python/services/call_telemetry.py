@@ -0,0 +1,138 @@
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+from db.write_behind import write_behind
+
+# Load environment variables
+load_dotenv()
+
+# Quality metrics clients may report in a "stats" message
+QUALITY_METRICS = ("rtt", "jitter", "packet_loss", "bitrate")
+
+TELEMETRY_WINDOW_SECONDS = int(os.getenv("TELEMETRY_WINDOW_SECONDS", 10))
+# Samples kept per call and window; extra samples in the same window are dropped
+TELEMETRY_MAX_SAMPLES_PER_WINDOW = int(os.getenv("TELEMETRY_MAX_SAMPLES_PER_WINDOW", 1000))
+# Window summaries kept on each call document
+TELEMETRY_MAX_WINDOWS_PER_CALL = int(os.getenv("TELEMETRY_MAX_WINDOWS_PER_CALL", 360))
+
+def summarize_window(samples: List[List[float]]) -> Dict[str, Any]:
+    """
+    Mean and p95 of each metric over one window of samples.
+    Missing values are NaN and ignored per metric.
+    """
+    # Imported on first use so signaling workers start without NumPy
+    import numpy as np
+
+    values = np.asarray(samples, dtype=np.float64)
+    present = ~np.isnan(values)
+    counts = present.sum(axis=0)
+
+    summary = {"samples": len(samples)}
+    for index, metric in enumerate(QUALITY_METRICS):
+        if not counts[index]:
+            continue
+        column = values[present[:, index], index]
+        summary[metric] = {
+            "mean": round(float(column.mean()), 3),
+            "p95": round(float(np.percentile(column, 95)), 3)
+        }
+    return summary
+
+class CallTelemetry:
+    """
+    Buffer per-call quality samples in memory and turn them into fixed time
+    window summaries. Only the summaries are written to the calls collection.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int = TELEMETRY_WINDOW_SECONDS,
+        max_samples_per_window: int = TELEMETRY_MAX_SAMPLES_PER_WINDOW,
+        max_windows_per_call: int = TELEMETRY_MAX_WINDOWS_PER_CALL
+    ):
+        self.window_seconds = window_seconds
+        self.max_samples_per_window = max_samples_per_window
+        self.max_windows_per_call = max_windows_per_call
+        # call_id -> window start (epoch seconds) -> rows of QUALITY_METRICS values
+        self._buffers: Dict[str, Dict[int, List[List[float]]]] = defaultdict(dict)
+        self.dropped_samples = 0
+
+    @staticmethod
+    def parse_sample(message: Dict[str, Any]) -> Optional[List[float]]:
+        """
+        Extract the metrics from a stats message, or None if it carries no valid metric
+        """
+        row = []
+        for metric in QUALITY_METRICS:
+            value = message.get(metric)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0:
+                row.append(float(value))
+            else:
+                row.append(math.nan)
+        if all(math.isnan(value) for value in row):
+            return None
+        return row
+
+    def add_sample(self, call_id: str, row: List[float], now: Optional[float] = None):
+        window_start = int((now or time.time()) // self.window_seconds) * self.window_seconds
+        window = self._buffers[call_id].setdefault(window_start, [])
+        if len(window) >= self.max_samples_per_window:
+            self.dropped_samples += 1
+            return
+        window.append(row)
+
+    def _queue_summaries(self, call_id: str, windows: Dict[int, List[List[float]]]):
+        summaries = []
+        for window_start in sorted(windows):
+            summary = summarize_window(windows[window_start])
+            summary["window_start"] = datetime.fromtimestamp(window_start)
+            summaries.append(summary)
+        if not summaries:
+            return
+        write_behind.enqueue("calls", UpdateOne(
+            {"call_id": call_id},
+            {
+                "$push": {"quality.windows": {"$each": summaries, "$slice": -self.max_windows_per_call}},
+                "$inc": {"quality.samples": sum(summary["samples"] for summary in summaries)},
+                "$set": {"quality.window_seconds": self.window_seconds}
+            }
+        ))
+
+    def flush_closed_windows(self, now: Optional[float] = None):
+        """
+        Summarize every window that has ended
+        """
+        current_window = int((now or time.time()) // self.window_seconds) * self.window_seconds
+        for call_id in list(self._buffers):
+            windows = self._buffers[call_id]
+            closed = {start: windows.pop(start) for start in list(windows) if start < current_window}
+            if not windows:
+                del self._buffers[call_id]
+            self._queue_summaries(call_id, closed)
+
+    def finish_call(self, call_id: str):
+        """
+        Summarize whatever is buffered for a call that just ended
+        """
+        self._queue_summaries(call_id, self._buffers.pop(call_id, {}))
+
+    def flush_all(self):
+        for call_id in list(self._buffers):
+            self.finish_call(call_id)
+
+    async def run(self):
+        """
+        Close windows as time passes
+        """
+        while True:
+            await asyncio.sleep(self.window_seconds)
+            self.flush_closed_windows()
+
+# Shared aggregator for the signaling service
+call_telemetry = CallTelemetry()
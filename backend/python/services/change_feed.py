@@ -0,0 +1,274 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from pymongo.errors import OperationFailure, PyMongoError
+from db.mongodb import get_collection, get_db_connection
+from services.events import ChatMembershipChanged, EventBus, MessageCreated, UserUpdated, event_bus
+from services.metrics import registry
+
+# Load environment variables
+load_dotenv()
+
+# "auto" uses a change stream and falls back to polling when the server
+# does not support them (standalone mongod, tests); "stream", "poll" or "off"
+CHANGE_FEED_MODE = os.getenv("CHANGE_FEED_MODE", "auto")
+# Seconds between polls in polling mode
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", 2))
+# Name the resume position is stored under in change_feed_positions
+CHANGE_FEED_CONSUMER = os.getenv("CHANGE_FEED_CONSUMER", "python-api")
+# Seconds between writes of the resume position
+CHANGE_FEED_SAVE_INTERVAL = float(os.getenv("CHANGE_FEED_SAVE_INTERVAL", 5))
+# Documents read per collection per poll
+CHANGE_FEED_POLL_BATCH = int(os.getenv("CHANGE_FEED_POLL_BATCH", 500))
+
+POSITION_COLLECTION = "change_feed_positions"
+# The server does not support change streams (not a replica set)
+NOT_REPLICA_SET = 40573
+# The resume token is older than the oplog, or otherwise unusable
+HISTORY_LOST = {280, 286}
+
+change_feed_events = registry.counter("change_feed_events", "Events published from MongoDB changes by type", ("type",))
+
+# Messages only matter when created; their content never leaves the server
+STREAM_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": {"$in": ["users", "chats"]}, "operationType": {"$in": ["insert", "update", "replace", "delete"]}},
+        {"ns.coll": "messages", "operationType": "insert"}
+    ]}},
+    {"$project": {"fullDocument.content": 0, "fullDocument.password": 0, "fullDocument.resetPasswordToken": 0}}
+]
+
+class ChangeStreamUnsupported(Exception):
+    pass
+
+def _top_level(fields) -> set:
+    return {field.split(".", 1)[0] for field in fields}
+
+def events_from_change(change: Dict[str, Any]) -> List[Any]:
+    """
+    Translate a change stream document into events
+    """
+    collection = change["ns"]["coll"]
+    operation = change["operationType"]
+    key = str(change["documentKey"]["_id"])
+    document = change.get("fullDocument") or {}
+    description = change.get("updateDescription") or {}
+
+    if collection == "messages" and operation == "insert":
+        return [MessageCreated(key, str(document.get("chat")), str(document.get("sender")), document.get("createdAt"))]
+
+    if collection == "users":
+        if operation == "delete":
+            return [UserUpdated(key, None, True)]
+        if operation == "update":
+            changed = _top_level(description.get("updatedFields", {})) | _top_level(description.get("removedFields", []))
+            return [UserUpdated(key, frozenset(changed))]
+        return [UserUpdated(key)]
+
+    if collection == "chats":
+        if operation == "delete":
+            return [ChatMembershipChanged(key)]
+        if operation == "update":
+            changed = (
+                _top_level(description.get("updatedFields", {}))
+                | _top_level(description.get("removedFields", []))
+                | {array.get("field", "").split(".", 1)[0] for array in description.get("truncatedArrays", [])}
+            )
+            if "users" not in changed:
+                return []
+            users = description.get("updatedFields", {}).get("users")
+            return [ChatMembershipChanged(key, frozenset(str(user) for user in users) if isinstance(users, list) else None)]
+        return [ChatMembershipChanged(key, frozenset(str(user) for user in document.get("users", [])))]
+
+    return []
+
+class ChangeFeed:
+    """
+    Publishes changes the Node backend makes to users, chats and messages as
+    events on the bus. Follows a change stream from a resume token saved in
+    change_feed_positions, so a restart continues where it stopped. Without
+    replica set support it polls updatedAt / createdAt instead; polling cannot
+    see deletes and reports every updated chat as a membership change.
+    """
+
+    def __init__(
+        self,
+        bus: EventBus = event_bus,
+        mode: str = CHANGE_FEED_MODE,
+        consumer: str = CHANGE_FEED_CONSUMER,
+        poll_interval: float = CHANGE_FEED_POLL_INTERVAL,
+        save_interval: float = CHANGE_FEED_SAVE_INTERVAL
+    ):
+        self.bus = bus
+        self.mode = mode
+        self.consumer = consumer
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+        # "stream" or "poll" while running
+        self.active_mode: Optional[str] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.active_mode is not None
+
+    def _load_position(self) -> Dict[str, Any]:
+        return get_collection(POSITION_COLLECTION).find_one({"_id": self.consumer}) or {}
+
+    def _save_position(self, **fields):
+        get_collection(POSITION_COLLECTION).update_one(
+            {"_id": self.consumer},
+            {"$set": {**fields, "updatedAt": time.time()}},
+            upsert=True
+        )
+
+    def _publish(self, loop: asyncio.AbstractEventLoop, events: List[Any]):
+        for event in events:
+            change_feed_events.inc(type(event).__name__)
+            asyncio.run_coroutine_threadsafe(self.bus.publish(event), loop)
+
+    def _stream(self, loop: asyncio.AbstractEventLoop):
+        """
+        Follow the change stream until stopped. Runs in its own thread, since
+        pymongo blocks while waiting for changes.
+        """
+        database = get_db_connection()
+        if not hasattr(type(database), "watch"):
+            # e.g. mongomock in tests
+            raise ChangeStreamUnsupported("the database client has no change streams")
+        token = self._load_position().get("token")
+        saved_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                with database.watch(STREAM_PIPELINE, resume_after=token, max_await_time_ms=1000) as stream:
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            self._publish(loop, events_from_change(change))
+                        # The post-batch token also moves forward while idle
+                        if stream.resume_token is not None:
+                            token = stream.resume_token
+                        if time.monotonic() - saved_at >= self.save_interval:
+                            self._save_position(mode="stream", token=token)
+                            saved_at = time.monotonic()
+            except OperationFailure as e:
+                if e.code == NOT_REPLICA_SET:
+                    raise ChangeStreamUnsupported(str(e))
+                if e.code in HISTORY_LOST:
+                    # Changes since the token are gone; caches rely on their TTLs for the gap
+                    print(f"Change stream resume token expired, restarting from now: {e}")
+                    token = None
+                    continue
+                print(f"Change stream failed, retrying: {e}")
+                self._stop.wait(self.poll_interval)
+            except PyMongoError as e:
+                print(f"Change stream failed, retrying: {e}")
+                self._stop.wait(self.poll_interval)
+        if token is not None:
+            self._save_position(mode="stream", token=token)
+
+    def _initial_positions(self) -> Dict[str, Any]:
+        # Start from the newest documents, history is not replayed
+        positions = {}
+        for name, field in (("users", "updatedAt"), ("chats", "updatedAt"), ("messages", "createdAt")):
+            latest = get_collection(name).find_one({field: {"$exists": True}}, {field: 1}, sort=[(field, -1), ("_id", -1)])
+            positions[name] = {"at": latest[field], "_id": latest["_id"]} if latest else None
+        return positions
+
+    def _poll_once(self, positions: Dict[str, Any]) -> List[Any]:
+        """
+        Read documents changed since positions, moving positions forward
+        """
+        events = []
+        for name, field, projection in (
+            ("users", "updatedAt", {"updatedAt": 1}),
+            ("chats", "updatedAt", {"updatedAt": 1, "users": 1}),
+            ("messages", "createdAt", {"createdAt": 1, "chat": 1, "sender": 1})
+        ):
+            position = positions.get(name)
+            query: Dict[str, Any] = {field: {"$exists": True}}
+            if position:
+                # Keyset on (time, _id), as timestamps are not unique
+                query = {"$or": [
+                    {field: {"$gt": position["at"]}},
+                    {field: position["at"], "_id": {"$gt": position["_id"]}}
+                ]}
+            for document in get_collection(name).find(query, projection).sort([(field, 1), ("_id", 1)]).limit(CHANGE_FEED_POLL_BATCH):
+                key = str(document["_id"])
+                if name == "users":
+                    events.append(UserUpdated(key))
+                elif name == "chats":
+                    events.append(ChatMembershipChanged(key, frozenset(str(user) for user in document.get("users", []))))
+                else:
+                    events.append(MessageCreated(key, str(document.get("chat")), str(document.get("sender")), document.get("createdAt")))
+                positions[name] = {"at": document[field], "_id": document["_id"]}
+        return events
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        stored = self._load_position()
+        positions = stored.get("positions") if stored.get("mode") == "poll" else None
+        if positions is None:
+            positions = await loop.run_in_executor(None, self._initial_positions)
+        saved_at = time.monotonic()
+        while True:
+            events = []
+            try:
+                events = await loop.run_in_executor(None, self._poll_once, positions)
+                for event in events:
+                    change_feed_events.inc(type(event).__name__)
+                    await self.bus.publish(event)
+                if time.monotonic() - saved_at >= self.save_interval:
+                    await loop.run_in_executor(None, lambda: self._save_position(mode="poll", positions=positions))
+                    saved_at = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to poll for changes: {e}")
+            # A full batch means more is waiting
+            if len(events) < CHANGE_FEED_POLL_BATCH:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run(self):
+        """
+        Publish changes until cancelled
+        """
+        if self.mode == "off":
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            if self.mode in ("auto", "stream"):
+                self._stop.clear()
+                finished = loop.create_future()
+
+                def follow():
+                    try:
+                        self._stream(loop)
+                        loop.call_soon_threadsafe(finished.set_result, None)
+                    except BaseException as e:
+                        loop.call_soon_threadsafe(finished.set_exception, e)
+
+                self.active_mode = "stream"
+                threading.Thread(target=follow, name="change-stream", daemon=True).start()
+                try:
+                    await finished
+                    return
+                except ChangeStreamUnsupported as e:
+                    if self.mode == "stream":
+                        print(f"Change streams unavailable, change feed stopped: {e}")
+                        return
+                    print(f"Change streams unavailable, polling every {self.poll_interval:g}s: {e}")
+                except asyncio.CancelledError:
+                    self._stop.set()
+                    raise
+
+            self.active_mode = "poll"
+            await self._poll()
+        finally:
+            self.active_mode = None
+
+# Shared per worker; each worker keeps its own caches, so each follows the changes
+change_feed = ChangeFeed()
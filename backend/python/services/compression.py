@@ -0,0 +1,193 @@
+import asyncio
+import gzip
+import hashlib
+import os
+from typing import Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+# Bodies smaller than this are sent as they are; compression would not pay off
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+# Larger bodies are compressed in a thread instead of on the event loop
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", 256 * 1024))
+
+# Media types worth compressing; images, video and archives already are
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+# Headers a 304 keeps, see RFC 9110 section 15.4.5
+NOT_MODIFIED_HEADERS = {b"etag", b"cache-control", b"vary", b"expires", b"content-location", b"date"}
+
+Headers = List[Tuple[bytes, bytes]]
+
+def content_etag(body: bytes) -> str:
+    """
+    Weak validator from a hash of the uncompressed body; weak, because the
+    gzip and brotli encodings of the same body share it
+    """
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def version_etag(*parts) -> str:
+    """
+    Validator from a data version and the request parameters, so a handler
+    can answer 304 without building the response
+    """
+    key = "\x1f".join(str(part) for part in parts).encode()
+    return f'W/"{hashlib.blake2b(key, digest_size=16).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an ETag against an If-None-Match header
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    The best encoding the client accepts: br when available, else gzip
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+def _header(headers: Headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _without(headers: Headers, names: Iterable[bytes]) -> Headers:
+    names = set(names)
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware for complete (non-streamed) responses: adds an ETag
+    to successful GETs and answers a matching If-None-Match with 304, then
+    compresses compressible bodies over min_size with brotli or gzip.
+    Streamed responses, such as static files, pass through untouched.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE, thread_min_size: int = COMPRESSION_THREAD_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+        self.thread_min_size = thread_min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        encoding = accepted_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        conditional = scope["method"] == "GET"
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether the response is complete
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # Streamed response, send it as it is
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            await self._send_complete(start_message, message.get("body", b""), encoding, conditional, if_none_match, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_complete(self, start, body: bytes, encoding: Optional[str], conditional: bool, if_none_match: str, send):
+        status = start["status"]
+        headers: Headers = list(start.get("headers", []))
+
+        content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+        compressible = (
+            len(body) >= self.min_size
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+            and _header(headers, b"content-encoding") is None
+        )
+        if compressible:
+            # Caches must key the response on the encoding, 304s included
+            vary = _header(headers, b"vary")
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers = _without(headers, [b"vary"]) + [(b"vary", vary + b", Accept-Encoding")]
+
+        if conditional and status == 200:
+            etag = _header(headers, b"etag")
+            if etag is None:
+                etag = content_etag(body).encode()
+                headers.append((b"etag", etag))
+            if etag_matches(if_none_match, etag.decode("latin-1")):
+                headers = [(key, value) for key, value in headers if key.lower() in NOT_MODIFIED_HEADERS]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if compressible and encoding is not None:
+            if len(body) >= self.thread_min_size:
+                compressed = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            if len(compressed) < len(body):
+                body = compressed
+                headers = _without(headers, [b"content-length"]) + [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(body)).encode())
+                ]
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,140 @@
+import asyncio
+import os
+from typing import Dict, Iterable, List
+from fastapi import WebSocket
+from dotenv import load_dotenv
+from services.metrics import websocket_connections, websocket_messages_sent
+
+# Load environment variables
+load_dotenv()
+
+# Maximum simultaneous WebSocket connections per user (e.g. web + mobile + tablet)
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", 5))
+# What to do when a user exceeds the limit: "evict_oldest" or "reject"
+WS_CONNECTION_OVERFLOW = os.getenv("WS_CONNECTION_OVERFLOW", "evict_oldest")
+
+# Application-defined close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_REPLACED = 4001
+
+class ConnectionManager:
+    """
+    Track WebSocket connections per user.
+    A user may be connected from several devices at once; messages addressed
+    to a user are fanned out to every one of their sockets concurrently.
+    """
+
+    def __init__(self, max_per_user: int = WS_MAX_CONNECTIONS_PER_USER, overflow: str = WS_CONNECTION_OVERFLOW):
+        self.max_per_user = max_per_user
+        self.overflow = overflow
+        # user_id -> sockets in connection order (dict used as an ordered set)
+        self._connections: Dict[str, Dict[WebSocket, None]] = {}
+        # Set while the server shuts down, new connections are refused
+        self.draining = False
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._connections
+
+    @property
+    def user_count(self) -> int:
+        return len(self._connections)
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self._connections.values())
+
+    def sockets_for(self, user_id: str) -> List[WebSocket]:
+        return list(self._connections.get(user_id, ()))
+
+    async def connect(self, user_id: str, websocket: WebSocket) -> bool:
+        """
+        Accept and register a socket. Returns False if the connection was refused.
+        """
+        if self.draining:
+            websocket_connections.inc("rejected")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return False
+
+        sockets = self._connections.get(user_id, {})
+        evicted = None
+        if len(sockets) >= self.max_per_user:
+            if self.overflow == "reject":
+                websocket_connections.inc("rejected")
+                await websocket.close(code=CLOSE_POLICY_VIOLATION)
+                return False
+            # Drop the oldest connection, it is most likely a stale device
+            evicted = next(iter(sockets))
+            del sockets[evicted]
+
+        await websocket.accept()
+        self._connections.setdefault(user_id, {})[websocket] = None
+        websocket_connections.inc("accepted")
+
+        # Close the evicted socket only once the new one is registered, so the
+        # user is never seen as fully disconnected in between
+        if evicted is not None:
+            websocket_connections.inc("evicted")
+            await self._close(evicted, CLOSE_REPLACED)
+        return True
+
+    def disconnect(self, user_id: str, websocket: WebSocket) -> bool:
+        """
+        Unregister a socket. Returns True if the user has no connections left.
+        """
+        sockets = self._connections.get(user_id)
+        if sockets is None:
+            return True
+        if sockets.pop(websocket, False) is None:
+            websocket_connections.inc("closed")
+        if not sockets:
+            del self._connections[user_id]
+            return True
+        return False
+
+    async def send_to_user(self, user_id: str, text: str) -> int:
+        """
+        Send a message to every connection of a user. Returns the number of sockets reached.
+        """
+        return await self.send_to_users((user_id,), text)
+
+    async def send_to_users(self, user_ids: Iterable[str], text: str) -> int:
+        """
+        Send the same message to every connection of several users at once
+        """
+        targets = []
+        for user_id in user_ids:
+            for websocket in self._connections.get(user_id, ()):
+                targets.append((user_id, websocket))
+        if not targets:
+            return 0
+
+        results = await asyncio.gather(*(websocket.send_text(text) for _, websocket in targets), return_exceptions=True)
+
+        delivered = 0
+        for (user_id, websocket), result in zip(targets, results):
+            if isinstance(result, Exception):
+                # Broken socket, its receive loop will clean up the rest
+                self.disconnect(user_id, websocket)
+            else:
+                delivered += 1
+        websocket_messages_sent.inc(amount=delivered)
+        return delivered
+
+    async def close_all(self, code: int = CLOSE_GOING_AWAY) -> int:
+        """
+        Refuse new connections and close every socket concurrently, so clients
+        reconnect to another worker. Returns the number of sockets closed.
+        """
+        self.draining = True
+        sockets = [websocket for user_sockets in self._connections.values() for websocket in user_sockets]
+        await asyncio.gather(*(self._close(websocket, code) for websocket in sockets))
+        return len(sockets)
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Type
+
+class UserUpdated(NamedTuple):
+    user_id: str
+    # Top-level fields that changed, None when unknown (replaced or polled)
+    fields: Optional[FrozenSet[str]] = None
+    deleted: bool = False
+
+class MessageCreated(NamedTuple):
+    message_id: str
+    chat_id: str
+    sender_id: str
+    created_at: Optional[datetime] = None
+
+class ChatMembershipChanged(NamedTuple):
+    chat_id: str
+    # Members after the change, None when unknown or the chat was deleted
+    users: Optional[FrozenSet[str]] = None
+
+Handler = Callable[[Any], Any]
+
+class EventBus:
+    """
+    In-process publish/subscribe by event type. Handlers may be plain
+    functions or coroutines; a failing handler is logged and does not stop
+    the others. Events are published on the event loop.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[Type, List[Handler]] = {}
+        self.published = 0
+
+    def subscribe(self, event_type: Type, handler: Handler):
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, event_type: Type, handler: Handler):
+        handlers = self._handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    @property
+    def subscribed(self) -> bool:
+        return any(self._handlers.values())
+
+    async def publish(self, event):
+        self.published += 1
+        for handler in list(self._handlers.get(type(event), ())):
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Failed to handle {type(event).__name__}: {e}")
+
+# Shared by the change feed and its subscribers
+event_bus = EventBus()
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from db.mongodb import get_db_connection
+from db.write_behind import write_behind
+from services.metrics import loop_lag_last
+
+# Load environment variables
+load_dotenv()
+
+# Seconds a readiness result is reused, so probes from several load
+# balancers do not each ping the database
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", 2))
+# Seconds to wait for the database ping before reporting it as down
+HEALTH_MONGO_TIMEOUT = float(os.getenv("HEALTH_MONGO_TIMEOUT", 2))
+HEALTH_MONGO_WARN_MS = float(os.getenv("HEALTH_MONGO_WARN_MS", 250))
+HEALTH_LOOP_LAG_WARN_MS = float(os.getenv("HEALTH_LOOP_LAG_WARN_MS", 100))
+HEALTH_LOOP_LAG_FAIL_MS = float(os.getenv("HEALTH_LOOP_LAG_FAIL_MS", 1000))
+HEALTH_WRITE_BEHIND_WARN = int(os.getenv("HEALTH_WRITE_BEHIND_WARN", 5000))
+HEALTH_WRITE_BEHIND_FAIL = int(os.getenv("HEALTH_WRITE_BEHIND_FAIL", 50000))
+HEALTH_MIN_FREE_MB = float(os.getenv("HEALTH_MIN_FREE_MB", 100))
+
+PASS, WARN, FAIL = "pass", "warn", "fail"
+SEVERITY = {PASS: 0, WARN: 1, FAIL: 2}
+
+Check = Dict[str, Any]
+
+def threshold_status(value: float, warn: float, fail: Optional[float] = None) -> str:
+    if fail is not None and value >= fail:
+        return FAIL
+    if value >= warn:
+        return WARN
+    return PASS
+
+def ping_mongo() -> float:
+    """
+    Round trip of a ping command in milliseconds
+    """
+    started = time.perf_counter()
+    get_db_connection().command("ping")
+    return (time.perf_counter() - started) * 1000
+
+def check_directory(path: str, min_free_mb: float = HEALTH_MIN_FREE_MB) -> Check:
+    """
+    A directory the worker writes to must exist, be writable and have space left
+    """
+    if not os.path.isdir(path) or not os.access(path, os.W_OK):
+        return {"status": FAIL, "path": path, "error": "missing or not writable"}
+    free_mb = shutil.disk_usage(path).free / (1024 * 1024)
+    return {"status": WARN if free_mb < min_free_mb else PASS, "path": path, "free_mb": round(free_mb)}
+
+class HealthChecker:
+    """
+    Readiness of this worker: the database answers, the event loop keeps up,
+    queued writes drain and the directories it writes to are usable. Every
+    check is pass, warn or fail; any fail makes the worker not ready.
+    """
+
+    def __init__(self, cache_ttl: float = HEALTH_CACHE_TTL, mongo_timeout: float = HEALTH_MONGO_TIMEOUT, directories: Iterable[str] = ()):
+        self.cache_ttl = cache_ttl
+        self.mongo_timeout = mongo_timeout
+        self.directories = list(directories)
+        # Extra checks registered by routers, name -> function returning a check
+        self._checks: Dict[str, Callable[[], Check]] = {}
+        self._cached: Optional[Tuple[float, Dict[str, Any]]] = None
+        # Set when the server starts shutting down, so load balancers stop routing here
+        self.shutting_down = False
+        # Shared by concurrent probes while a check is running
+        self._running: Optional[asyncio.Future] = None
+        self._ping: Optional[asyncio.Future] = None
+
+    def add_check(self, name: str, check: Callable[[], Check]):
+        self._checks[name] = check
+
+    async def _check_mongo(self) -> Check:
+        # pymongo blocks up to its server selection timeout, so the ping runs
+        # in a thread and is given up on after mongo_timeout; a ping that is
+        # still hanging is not repeated, so threads do not pile up
+        if self._ping is not None and not self._ping.done():
+            return {"status": FAIL, "error": "previous ping still pending"}
+        self._ping = asyncio.get_running_loop().run_in_executor(None, ping_mongo)
+        try:
+            latency = await asyncio.wait_for(asyncio.shield(self._ping), self.mongo_timeout)
+        except asyncio.TimeoutError:
+            return {"status": FAIL, "error": f"no reply within {self.mongo_timeout:g}s"}
+        except Exception as e:
+            return {"status": FAIL, "error": str(e)}
+        return {"status": threshold_status(latency, HEALTH_MONGO_WARN_MS), "latency_ms": round(latency, 2)}
+
+    async def _run_checks(self) -> Dict[str, Any]:
+        checks: Dict[str, Check] = {"mongodb": await self._check_mongo()}
+
+        lag_ms = loop_lag_last.value() * 1000
+        checks["event_loop"] = {
+            "status": threshold_status(lag_ms, HEALTH_LOOP_LAG_WARN_MS, HEALTH_LOOP_LAG_FAIL_MS),
+            "lag_ms": round(lag_ms, 2)
+        }
+
+        depth = write_behind.depth
+        checks["write_behind"] = {
+            "status": threshold_status(depth, HEALTH_WRITE_BEHIND_WARN, HEALTH_WRITE_BEHIND_FAIL),
+            "depth": depth
+        }
+
+        for path in self.directories:
+            checks[f"disk:{path}"] = check_directory(path)
+
+        for name, check in self._checks.items():
+            try:
+                checks[name] = check()
+            except Exception as e:
+                checks[name] = {"status": FAIL, "error": str(e)}
+
+        status = max((check["status"] for check in checks.values()), key=SEVERITY.get)
+        return {"status": status, "checked_at": time.time(), "checks": checks}
+
+    async def readiness(self) -> Dict[str, Any]:
+        """
+        The latest readiness report, rerun at most once per cache_ttl
+        """
+        if self.shutting_down:
+            return {"status": FAIL, "checked_at": time.time(), "checks": {"shutdown": {"status": FAIL}}}
+        now = time.monotonic()
+        if self._cached and now - self._cached[0] < self.cache_ttl:
+            return self._cached[1]
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._run_checks())
+        running = self._running
+        try:
+            report = await asyncio.shield(running)
+        finally:
+            if self._running is running and running.done():
+                self._running = None
+        self._cached = (time.monotonic(), report)
+        return report
+
+# Shared per worker; uploads are written to ./uploads and spooled to the temp dir
+health_checker = HealthChecker(directories=["uploads", os.getenv("UPLOAD_TMP_DIR") or tempfile.gettempdir()])
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Optional, Union
+from dotenv import load_dotenv
+from services.result_cache import ResultCache, content_key, get_cache
+from services.uploads import Upload
+
+# Load environment variables
+load_dotenv()
+
+# Decode limit; the upload limit IMAGE_MAX_BYTES lives with the other upload limits
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 50_000_000))
+# Longest side of the reduced image the statistics are computed on
+IMAGE_ANALYSIS_SIZE = int(os.getenv("IMAGE_ANALYSIS_SIZE", 256))
+# Worker processes, and how many images may wait for a free worker
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+IMAGE_MAX_QUEUE = int(os.getenv("IMAGE_MAX_QUEUE", 16))
+IMAGE_ANALYSIS_TIMEOUT = float(os.getenv("IMAGE_ANALYSIS_TIMEOUT", 30))
+
+# Colors reported in the palette
+IMAGE_PALETTE_SIZE = int(os.getenv("IMAGE_PALETTE_SIZE", 5))
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds the configured size or pixel limits"""
+
+class ImagePoolBusyError(Exception):
+    """Raised when too many images are already waiting for analysis"""
+
+def analyze_image(source: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Decode an image (bytes or a file path) at reduced resolution and compute
+    approximate color statistics. Runs in a worker process.
+    """
+    import numpy as np
+    from PIL import Image
+    from services.palette import to_rgb, extract_palette, dominant_color_name
+
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    try:
+        img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    except Image.DecompressionBombError as e:
+        # PIL refuses images over twice MAX_IMAGE_PIXELS before the check below
+        raise ImageTooLargeError(str(e)) from e
+
+    # Header information of the original image
+    width, height = img.size
+    format_type = img.format
+    mode = img.mode
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLargeError(f"Image exceeds {IMAGE_MAX_PIXELS} pixels")
+
+    # Let the decoder scale down (JPEG decodes at 1/2, 1/4 or 1/8 directly),
+    # then resample to the analysis size. Color statistics are approximate anyway.
+    img.draft(mode, (IMAGE_ANALYSIS_SIZE, IMAGE_ANALYSIS_SIZE))
+    img.thumbnail((IMAGE_ANALYSIS_SIZE, IMAGE_ANALYSIS_SIZE))
+    # Every mode (RGBA, L, P, CMYK, ...) is analyzed as RGB
+    pixels = np.asarray(to_rgb(img)).reshape(-1, 3)
+
+    avg_color = pixels.mean(axis=0).astype(int)
+    avg_color_hex = f"#{avg_color[0]:02x}{avg_color[1]:02x}{avg_color[2]:02x}"
+
+    # The dominant color is the largest k-means cluster, not the average:
+    # a red and blue image is red or blue, not magenta
+    palette = extract_palette(pixels, k=IMAGE_PALETTE_SIZE)
+    dominant_color = dominant_color_name(palette) or "N/A"
+
+    # Estimate if image is light or dark
+    brightness = float(pixels.mean()) / 255
+    tone = "light" if brightness > 0.5 else "dark"
+
+    return {
+        "format": format_type,
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "avg_color": avg_color_hex,
+        "dominant_color": dominant_color,
+        "palette": palette,
+        "tone": tone
+    }
+
+class ImageAnalysisPool:
+    """
+    Process pool for image analysis, so decoding neither blocks the event loop
+    nor contends for the GIL. Bounded: when every worker is busy and the queue
+    is full, new images are refused instead of piling up in memory.
+    """
+
+    def __init__(
+        self,
+        workers: int = IMAGE_WORKERS,
+        max_queue: int = IMAGE_MAX_QUEUE,
+        timeout: float = IMAGE_ANALYSIS_TIMEOUT,
+        cache: Optional[ResultCache] = None
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Results by content hash, the same stickers and memes are sent over and over
+        self.cache = cache or get_cache("image_recognition")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started on first use so workers that never analyze images stay lean
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def analyze(self, upload: Upload) -> Dict[str, Any]:
+        # The upload was hashed while it streamed in; analysis settings are
+        # part of the key so changing them recomputes
+        key = content_key(upload.digest, IMAGE_ANALYSIS_SIZE, IMAGE_PALETTE_SIZE)
+        return await self.cache.get_or_compute_async(key, lambda: self._run(upload.source()))
+
+    async def _run(self, source: Union[bytes, str]) -> Dict[str, Any]:
+        if self.in_flight >= self.workers + self.max_queue:
+            raise ImagePoolBusyError("Image analysis is busy, try again later")
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(analyze_image, source)
+        # The slot is freed when the worker is done, not when the caller stops
+        # waiting: a timed out image keeps its worker busy until it finishes
+        self.in_flight += 1
+        future.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        # Called from the executor's thread; in_flight belongs to the event loop
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # The loop is closed, nothing waits on the count anymore
+            self._decrement()
+
+    def _decrement(self):
+        self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Shared pool for the API process
+image_pool = ImageAnalysisPool()
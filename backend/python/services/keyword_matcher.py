@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+CONFIG_DIR = os.getenv("RULES_CONFIG_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config"))
+# How often (seconds) a rule table checks its file for changes
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", 5))
+
+class KeywordMatcher:
+    """
+    Match many keyword rules against a text in a single pass.
+    All keywords are compiled into one case-insensitive alternation anchored
+    on word boundaries, so "no" matches "no" but not "know".
+    """
+
+    def __init__(self, rules: List[List[str]]):
+        # Normalized keyword -> indices of the rules that contain it
+        self._rules_by_keyword: Dict[str, List[int]] = {}
+        for index, keywords in enumerate(rules):
+            for keyword in keywords:
+                rule_ids = self._rules_by_keyword.setdefault(self._normalize(keyword), [])
+                if index not in rule_ids:
+                    rule_ids.append(index)
+
+        # Longest keywords first so phrases win over their first word. Each
+        # keyword is its own named group: IGNORECASE also matches Unicode case
+        # variants ("ſad" for "sad") whose lower() is not a keyword, so hits are
+        # mapped by group rather than by their text.
+        alternatives = sorted(self._rules_by_keyword, key=len, reverse=True)
+        self._group_rules = {f"k{index}": self._rules_by_keyword[keyword] for index, keyword in enumerate(alternatives)}
+        pattern = "|".join(
+            f"(?P<k{index}>" + r"\s+".join(re.escape(word) for word in keyword.split()) + ")"
+            for index, keyword in enumerate(alternatives)
+        )
+        self._pattern = re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE) if alternatives else None
+
+    @staticmethod
+    def _normalize(keyword: str) -> str:
+        return " ".join(keyword.lower().split())
+
+    def match(self, text: str) -> List[int]:
+        """
+        Indices of all rules with at least one keyword in the text, in rule order
+        """
+        if not self._pattern:
+            return []
+        matched = set()
+        for hit in self._pattern.finditer(text):
+            matched.update(self._group_rules[hit.lastgroup])
+        return sorted(matched)
+
+class RuleTable:
+    """
+    A keyword -> suggestions table loaded from a JSON file in config/.
+    The file is re-read when it changes, so rules can be edited without a restart.
+
+    File format:
+        {"limit": 3, "fallback": [...], "rules": [{"keywords": [...], "suggestions": [...]}]}
+    """
+
+    def __init__(self, filename: str, reload_interval: float = RULES_RELOAD_INTERVAL):
+        self.path = filename if os.path.isabs(filename) else os.path.join(CONFIG_DIR, filename)
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._load()
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        rules = config.get("rules", [])
+        # Build everything first, then swap, so readers never see a half-loaded table
+        self._table = (
+            int(config.get("limit", 3)),
+            list(config.get("fallback", [])),
+            [list(rule.get("suggestions", [])) for rule in rules],
+            KeywordMatcher([rule.get("keywords", []) for rule in rules])
+        )
+        self._mtime = mtime
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    self._load()
+            except (OSError, ValueError) as e:
+                # Keep serving the previous rules if the file is missing or invalid
+                print(f"Failed to reload rules from {self.path}: {e}")
+
+    @property
+    def limit(self) -> int:
+        self.reload_if_changed()
+        return self._table[0]
+
+    def suggest(self, text: str) -> List[str]:
+        """
+        Suggestions of every matching rule in rule order, de-duplicated and
+        limited, or the fallback list when nothing matches
+        """
+        self.reload_if_changed()
+        limit, fallback, rule_suggestions, matcher = self._table
+        suggestions = []
+        for index in matcher.match(text):
+            suggestions.extend(rule_suggestions[index])
+        if not suggestions:
+            suggestions = fallback
+        return list(dict.fromkeys(suggestions))[:limit]
+
+    def suggest_batch(self, texts: List[str]) -> List[List[str]]:
+        """
+        Suggestions for many texts; repeated texts are matched once
+        """
+        self.reload_if_changed()
+        results: Dict[str, List[str]] = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.suggest(text)
+        return [results[text] for text in texts]
@@ -0,0 +1,299 @@
+import asyncio
+import heapq
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from pymongo import ReturnDocument, UpdateOne
+from db.mongodb import get_collection
+from services.events import MessageCreated, event_bus
+from services.text_analysis import Lexicon, tokenize, LEXICON_PATH
+
+# Load environment variables
+load_dotenv()
+
+# Messages read per chunk, and processes analyzing chunks
+ROLLUP_CHUNK_SIZE = int(os.getenv("ROLLUP_CHUNK_SIZE", 5000))
+ROLLUP_WORKERS = int(os.getenv("ROLLUP_WORKERS", min(2, os.cpu_count() or 1)))
+# Seconds between scheduled runs in the API process, 0 disables them
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", 3600))
+# Keywords a chunk reports per chat-day, and keywords kept in a chat-day's
+# rollup when chunks are merged into it; keeps rollup documents bounded
+ROLLUP_KEYWORDS_PER_CHUNK = int(os.getenv("ROLLUP_KEYWORDS_PER_CHUNK", 100))
+ROLLUP_KEYWORDS_PER_DAY = int(os.getenv("ROLLUP_KEYWORDS_PER_DAY", 200))
+# A run holds the lock this long; a crashed run's lock expires after it
+ROLLUP_LOCK_TTL = int(os.getenv("ROLLUP_LOCK_TTL", 1800))
+
+ROLLUP_COLLECTION = "message_rollups"
+CHECKPOINT_ID = "message_rollups"
+
+# Loaded once per worker process
+_worker_lexicon: Optional[Lexicon] = None
+
+def _init_worker(lexicon_path: str):
+    global _worker_lexicon
+    _worker_lexicon = Lexicon.from_file(lexicon_path)
+
+def analyze_chunk(rows: List[Tuple[str, str, str]], keywords_per_group: int = ROLLUP_KEYWORDS_PER_CHUNK) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Aggregate (chat, day, content) rows into per chat-day sentiment counts
+    and top keywords. Runs in a worker process.
+    """
+    lexicon = _worker_lexicon or Lexicon.from_file()
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for chat_id, day, content in rows:
+        group = groups.get((chat_id, day))
+        if group is None:
+            group = groups[(chat_id, day)] = {
+                "messages": 0, "positive": 0, "negative": 0, "neutral": 0, "score": 0.0, "keywords": Counter()
+            }
+        words = tokenize(content)
+        score = lexicon.sentiment_score(words)
+        group["messages"] += 1
+        group[lexicon.sentiment_label(score)] += 1
+        group["score"] += score
+        group["keywords"].update(word for word in words if lexicon.is_keyword(word))
+
+    for group in groups.values():
+        group["keywords"] = dict(heapq.nlargest(keywords_per_group, group["keywords"].items(), key=lambda item: item[1]))
+    return groups
+
+def merge_keywords(stored: Dict[str, int], added: Dict[str, int], limit: int = ROLLUP_KEYWORDS_PER_DAY) -> Dict[str, int]:
+    """
+    Sum two keyword counts and keep the top limit. Counts of keywords that
+    drop out are lost, so later counts are approximate for rare words only.
+    """
+    merged = Counter(stored)
+    merged.update(added)
+    return dict(heapq.nlargest(limit, merged.items(), key=lambda item: item[1]))
+
+def rollup_updates(groups: Dict[Tuple[str, str], Dict[str, Any]], stored_keywords: Optional[Dict[str, Dict[str, int]]] = None, keywords_per_day: int = ROLLUP_KEYWORDS_PER_DAY) -> List[UpdateOne]:
+    """
+    Upserts adding each chat-day's counts to its rollup. Keywords are merged
+    with the rollup's stored ones (by rollup _id) and replaced, not incremented,
+    so a busy chat-day cannot grow past keywords_per_day keywords.
+    """
+    stored_keywords = stored_keywords or {}
+    updates = []
+    for (chat_id, day), group in groups.items():
+        rollup_id = f"{chat_id}:{day}"
+        increments = {
+            "messages": group["messages"],
+            "sentiment.positive": group["positive"],
+            "sentiment.negative": group["negative"],
+            "sentiment.neutral": group["neutral"],
+            "score_sum": group["score"]
+        }
+        keywords = merge_keywords(stored_keywords.get(rollup_id, {}), group["keywords"], keywords_per_day)
+        updates.append(UpdateOne(
+            {"_id": rollup_id},
+            {"$inc": increments, "$set": {"chat": chat_id, "day": day, "keywords": keywords, "updatedAt": time.time()}},
+            upsert=True
+        ))
+    return updates
+
+class MessageRollups:
+    """
+    Daily sentiment and keyword rollups per chat in message_rollups.
+    Messages are streamed in (createdAt, _id) order from a checkpoint and
+    analyzed in a process pool. A chunk is counted at least once: if a run
+    dies between writing a chunk and its checkpoint, that chunk is counted again.
+    Runs need the createdAt_id index on messages, which the Node Message
+    model declares; this service does not create indexes on Node's collections.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = ROLLUP_CHUNK_SIZE,
+        workers: int = ROLLUP_WORKERS,
+        interval: int = ROLLUP_INTERVAL,
+        lexicon_path: str = LEXICON_PATH
+    ):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.interval = interval
+        self.lexicon_path = lexicon_path
+        # New messages reported by the change feed since the last run
+        self.pending = 0
+        self._wake: Optional[asyncio.Event] = None
+
+    def _acquire(self) -> Optional[Dict[str, Any]]:
+        # Only one API worker or CLI run processes at a time
+        now = time.time()
+        checkpoints = get_collection("analytics_checkpoints")
+        checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$setOnInsert": {"position": None, "lockedUntil": 0}}, upsert=True)
+        return checkpoints.find_one_and_update(
+            {"_id": CHECKPOINT_ID, "lockedUntil": {"$lt": now}},
+            {"$set": {"lockedUntil": now + ROLLUP_LOCK_TTL}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _save_checkpoint(self, position: Dict[str, Any], processed: int):
+        get_collection("analytics_checkpoints").update_one(
+            {"_id": CHECKPOINT_ID},
+            {
+                "$set": {"position": position, "lockedUntil": time.time() + ROLLUP_LOCK_TTL, "updatedAt": time.time()},
+                "$inc": {"processed": processed}
+            }
+        )
+
+    def _release(self):
+        get_collection("analytics_checkpoints").update_one({"_id": CHECKPOINT_ID}, {"$set": {"lockedUntil": 0}})
+
+    def _ensure_indexes(self):
+        # The trends query reads in index order
+        get_collection(ROLLUP_COLLECTION).create_index([("day", 1), ("chat", 1)], name="day_chat")
+
+    def _chunks(self, position: Optional[Dict[str, Any]]) -> Iterator[Tuple[List[Tuple[str, str, str]], Dict[str, Any]]]:
+        query: Dict[str, Any] = {"messageType": "text", "isDeleted": {"$ne": True}}
+        if position:
+            # Keyset resume after the last message already counted
+            query["$or"] = [
+                {"createdAt": {"$gt": position["createdAt"]}},
+                {"createdAt": position["createdAt"], "_id": {"$gt": position["_id"]}}
+            ]
+        cursor = get_collection("messages").find(
+            query, {"chat": 1, "content": 1, "createdAt": 1}
+        ).sort([("createdAt", 1), ("_id", 1)]).batch_size(self.chunk_size)
+
+        rows = []
+        for message in cursor:
+            created_at = message.get("createdAt")
+            if isinstance(created_at, datetime):
+                rows.append((str(message.get("chat")), created_at.strftime("%Y-%m-%d"), message.get("content") or ""))
+            if len(rows) >= self.chunk_size:
+                yield rows, {"createdAt": created_at, "_id": message["_id"]}
+                rows = []
+        if rows:
+            yield rows, {"createdAt": created_at, "_id": message["_id"]}
+
+    def process(self, max_chunks: Optional[int] = None) -> int:
+        """
+        Roll up messages sent since the checkpoint. Returns how many were
+        processed, or -1 when another run holds the lock.
+        """
+        checkpoint = self._acquire()
+        if checkpoint is None:
+            return -1
+
+        self._ensure_indexes()
+        rollups = get_collection(ROLLUP_COLLECTION)
+        processed = 0
+        # Chunks in flight, written back in order so the checkpoint only moves forward
+        pending: deque = deque()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.lexicon_path,)) as executor:
+                def write_oldest():
+                    nonlocal processed
+                    future, position, size = pending.popleft()
+                    groups = future.result()
+                    # Only this run writes rollups while it holds the lock, so
+                    # reading the stored keywords and replacing them is safe
+                    rollup_ids = [f"{chat_id}:{day}" for chat_id, day in groups]
+                    stored = {
+                        rollup["_id"]: rollup.get("keywords", {})
+                        for rollup in rollups.find({"_id": {"$in": rollup_ids}}, {"keywords": 1})
+                    } if rollup_ids else {}
+                    updates = rollup_updates(groups, stored)
+                    if updates:
+                        rollups.bulk_write(updates, ordered=False)
+                    self._save_checkpoint(position, size)
+                    processed += size
+
+                for index, (rows, position) in enumerate(self._chunks(checkpoint.get("position"))):
+                    if max_chunks is not None and index >= max_chunks:
+                        break
+                    pending.append((executor.submit(analyze_chunk, rows), position, len(rows)))
+                    # Bound memory: read ahead at most two chunks per worker
+                    if len(pending) >= self.workers * 2:
+                        write_oldest()
+                while pending:
+                    write_oldest()
+        finally:
+            self._release()
+        return processed
+
+    def reset(self):
+        """
+        Drop all rollups and the checkpoint so the next run starts over
+        """
+        get_collection(ROLLUP_COLLECTION).delete_many({})
+        get_collection("analytics_checkpoints").delete_one({"_id": CHECKPOINT_ID})
+
+    def notify(self, event: Optional[MessageCreated] = None):
+        """
+        Count a new message; a full chunk's worth starts a run before the interval ends
+        """
+        self.pending += 1
+        if self.pending >= self.chunk_size and self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        """
+        Process new messages every interval, or once a chunk of them has
+        arrived, off the event loop
+        """
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self.pending = 0
+            try:
+                processed = await loop.run_in_executor(None, self.process)
+                if processed > 0:
+                    print(f"Rolled up {processed} messages")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to roll up messages: {e}")
+
+def query_trends(chat_id: Optional[str], start: datetime, end: datetime, top_k: int = 10) -> List[Dict[str, Any]]:
+    """
+    Daily sentiment and top keywords between start and end (exclusive), for
+    one chat or summed over all chats
+    """
+    query: Dict[str, Any] = {"day": {"$gte": start.strftime("%Y-%m-%d"), "$lt": end.strftime("%Y-%m-%d")}}
+    if chat_id:
+        query["chat"] = chat_id
+
+    days: Dict[str, Dict[str, Any]] = {}
+    for rollup in get_collection(ROLLUP_COLLECTION).find(query):
+        day = days.get(rollup["day"])
+        if day is None:
+            day = days[rollup["day"]] = {"messages": 0, "sentiment": Counter(), "score_sum": 0.0, "keywords": Counter()}
+        day["messages"] += rollup.get("messages", 0)
+        day["sentiment"].update(rollup.get("sentiment", {}))
+        day["score_sum"] += rollup.get("score_sum", 0.0)
+        day["keywords"].update(rollup.get("keywords", {}))
+
+    trends = []
+    current = start
+    while current < end:
+        key = current.strftime("%Y-%m-%d")
+        day = days.get(key)
+        if day is None:
+            trends.append({"date": key, "messages": 0, "sentiment": {"positive": 0, "negative": 0, "neutral": 0}, "average_score": 0, "keywords": []})
+        else:
+            trends.append({
+                "date": key,
+                "messages": day["messages"],
+                "sentiment": {label: day["sentiment"].get(label, 0) for label in ("positive", "negative", "neutral")},
+                "average_score": round(day["score_sum"] / day["messages"], 3) if day["messages"] else 0,
+                "keywords": [word for word, _ in day["keywords"].most_common(top_k)]
+            })
+        current += timedelta(days=1)
+    return trends
+
+# Shared pipeline for the API process and the CLI
+message_rollups = MessageRollups()
+
+event_bus.subscribe(MessageCreated, message_rollups.notify)
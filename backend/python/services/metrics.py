@@ -0,0 +1,323 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+from pymongo import monitoring
+from services.profiler import current_timings
+
+# Load environment variables
+load_dotenv()
+
+# Seconds between event loop lag samples, 0 disables the monitor
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Database round trips are mostly sub-millisecond to tens of milliseconds
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """
+    A named metric with a fixed set of label names. Updates take a lock,
+    since database operations are recorded from executor threads.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """
+        (suffix, formatted labels, value) for every series
+        """
+        return ()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield "_total", _format_labels(self.labels, label_values), value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield "", _format_labels(self.labels, label_values), value
+
+class Histogram(Metric):
+    """
+    Cumulative buckets as in the Prometheus exposition format. Observations
+    only bump one bucket count; the counts are accumulated when rendered.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._values.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = [(label_values, list(counts), total) for label_values, (counts, total) in self._values.items()]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labels, label_values, f'le="{_format_value(float(bound))}"'), cumulative
+            yield "_count", _format_labels(self.labels, label_values), cumulative
+            yield "_sum", _format_labels(self.labels, label_values), total
+
+class CallbackGauge(Metric):
+    """
+    A gauge or counter read from the application when scraped, so keeping
+    it current costs nothing on the hot path
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str], read: Callable[[], Iterable[Tuple[LabelValues, float]]], kind: str = "gauge"):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.read = read
+
+    def samples(self):
+        suffix = "_total" if self.kind == "counter" else ""
+        for label_values, value in self.read():
+            yield suffix, _format_labels(self.labels, label_values), value
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, labels: Iterable[str], read, kind: str = "gauge") -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, labels, read, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Failed to render metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+# Shared registry; each worker process reports its own values
+registry = Registry()
+
+http_requests = registry.counter("http_requests", "HTTP requests by route template, method and status", ("route", "method", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route template and method", ("route", "method"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled, by router prefix", ("prefix",))
+db_operation_duration = registry.histogram("mongodb_operation_duration_seconds", "MongoDB command round trips by collection and command", ("collection", "command"), DB_BUCKETS)
+db_operation_failures = registry.counter("mongodb_operation_failures", "Failed MongoDB commands by collection and command", ("collection", "command"))
+websocket_connections = registry.counter("websocket_connections", "WebSocket connections by outcome (accepted, rejected, evicted, closed)", ("outcome",))
+websocket_messages_received = registry.counter("websocket_messages_received", "Signaling messages received by type", ("type",))
+websocket_messages_sent = registry.counter("websocket_messages_sent", "Messages delivered to WebSockets by fan-out")
+loop_lag = registry.histogram("event_loop_lag_seconds", "How late the event loop wakes a task sleeping for LOOP_LAG_INTERVAL", (), LAG_BUCKETS)
+loop_lag_last = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+def _cache_counters():
+    # Imported when scraped, so the metrics module does not load the cache
+    from services.result_cache import cache_stats
+    for namespace, stats in cache_stats().items():
+        for result in ("hits", "disk_hits", "misses", "evictions"):
+            yield (namespace, result), stats[result]
+
+def _cache_sizes():
+    from services.result_cache import cache_stats
+    for namespace, stats in cache_stats().items():
+        yield (namespace, "entries"), stats["entries"]
+        yield (namespace, "bytes"), stats["bytes"]
+
+registry.callback("cache_lookups", "Result cache lookups and evictions by namespace", ("namespace", "result"), _cache_counters, kind="counter")
+registry.callback("cache_size", "Result cache size by namespace", ("namespace", "unit"), _cache_sizes)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing HTTP requests. Requests are labeled by the
+    matched route's path template (e.g. /api/search/messages), never by the
+    raw path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app, prefixes: Iterable[str] = (), exclude: Iterable[str] = ("/metrics",)):
+        self.app = app
+        # Longest first, so /api/users/avatar style paths match their router
+        self.prefixes = sorted(prefixes, key=len, reverse=True)
+        self.exclude = set(exclude)
+
+    def _prefix(self, path: str) -> str:
+        for prefix in self.prefixes:
+            if path.startswith(prefix):
+                return prefix
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        prefix = self._prefix(scope["path"])
+        status = 500
+        started = time.perf_counter()
+        http_in_flight.inc(prefix)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(prefix)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            if route is not None and prefix != "other" and not template.startswith(prefix):
+                # Routes of an included router may carry their path without its prefix
+                template = prefix + template
+            method = scope["method"]
+            http_request_duration.observe(time.perf_counter() - started, template, method)
+            http_requests.inc(template, method, str(status))
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    pymongo command listener timing every round trip to the server,
+    including getMore batches of cursors, by collection and command
+    """
+
+    def __init__(self):
+        # (connection, request id) -> collection of commands in flight
+        self._pending: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._pending[self._key(event)] = collection if isinstance(collection, str) else "-"
+
+    def _record(self, event) -> str:
+        collection = self._pending.pop(self._key(event), "-")
+        seconds = event.duration_micros / 1e6
+        db_operation_duration.observe(seconds, collection, event.command_name)
+        # Per-request breakdown for slow requests and the Server-Timing header
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add_db(collection, event.command_name, seconds)
+        return collection
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        db_operation_failures.inc(self._record(event), event.command_name)
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """
+    Sample how late the event loop runs a task that sleeps for interval;
+    sustained lag means handlers are blocking the loop
+    """
+    if not interval:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+NAMED_COLORS = {
+    "red": [255, 0, 0],
+    "green": [0, 255, 0],
+    "blue": [0, 0, 255],
+    "yellow": [255, 255, 0],
+    "cyan": [0, 255, 255],
+    "magenta": [255, 0, 255],
+    "white": [255, 255, 255],
+    "black": [0, 0, 0],
+    "gray": [128, 128, 128]
+}
+_COLOR_NAMES = list(NAMED_COLORS)
+_COLOR_VALUES = np.array(list(NAMED_COLORS.values()), dtype=np.float32)
+
+def to_rgb(img):
+    """
+    Convert any PIL image mode to RGB. Transparent areas are composited on white.
+    """
+    from PIL import Image
+
+    if img.mode == "RGB":
+        return img
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if img.mode in ("RGBA", "LA", "PA", "RGBa", "La"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode in ("I", "I;16", "F"):
+        # Scale high bit-depth grayscale down to 8 bits before converting
+        values = np.asarray(img, dtype=np.float32)
+        peak = values.max() or 1.0
+        img = Image.fromarray((values * (255.0 / peak)).clip(0, 255).astype(np.uint8), "L")
+    return img.convert("RGB")
+
+def sample_pixels(pixels: np.ndarray, sample_size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Random subset of an (n, 3) pixel array
+    """
+    if len(pixels) <= sample_size:
+        return pixels
+    return pixels[rng.choice(len(pixels), size=sample_size, replace=False)]
+
+def nearest_color_names(colors: np.ndarray) -> List[str]:
+    """
+    Closest named color for each row of an (n, 3) array, in one broadcasted distance computation
+    """
+    distances = ((colors[:, None, :] - _COLOR_VALUES[None, :, :]) ** 2).sum(axis=2)
+    return [_COLOR_NAMES[index] for index in distances.argmin(axis=1)]
+
+def _assign(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    # Squared distances via |p|^2 - 2 p.c + |c|^2, avoids an (n, k, 3) temporary
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return distances.argmin(axis=1)
+
+def mini_batch_kmeans(
+    points: np.ndarray,
+    k: int,
+    rng: np.random.Generator,
+    batch_size: int = 512,
+    iterations: int = 30
+) -> np.ndarray:
+    """
+    Mini-batch k-means (Sculley, 2010) on an (n, 3) float array; returns (k, 3) centers
+    """
+    k = min(k, len(points))
+
+    # k-means++ seeding
+    centers = np.empty((k, points.shape[1]), dtype=np.float32)
+    centers[0] = points[rng.integers(len(points))]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for index in range(1, k):
+        total = closest.sum()
+        if total == 0:
+            # Fewer distinct colors than clusters
+            centers[index:] = centers[0]
+            break
+        centers[index] = points[rng.choice(len(points), p=closest / total)]
+        closest = np.minimum(closest, ((points - centers[index]) ** 2).sum(axis=1))
+
+    counts = np.zeros(k, dtype=np.float32)
+    for _ in range(iterations):
+        batch = points[rng.integers(len(points), size=min(batch_size, len(points)))]
+        labels = _assign(batch, centers)
+        # Per-center learning rate 1/count, applied to all batch members at once
+        batch_counts = np.bincount(labels, minlength=k).astype(np.float32)
+        batch_sums = np.zeros_like(centers)
+        np.add.at(batch_sums, labels, batch)
+        updated = batch_counts > 0
+        counts[updated] += batch_counts[updated]
+        rate = (batch_counts[updated] / counts[updated])[:, None]
+        centers[updated] += rate * (batch_sums[updated] / batch_counts[updated][:, None] - centers[updated])
+    return centers
+
+def extract_palette(
+    rgb_pixels: np.ndarray,
+    k: int = 5,
+    sample_size: int = 4096,
+    seed: int = 0,
+    min_proportion: float = 0.01
+) -> List[Dict[str, Any]]:
+    """
+    Top-k colors of an (n, 3) uint8 RGB pixel array with their share of the
+    image and nearest color name, largest share first
+    """
+    if not len(rgb_pixels):
+        return []
+    rng = np.random.default_rng(seed)
+    points = sample_pixels(rgb_pixels, sample_size, rng).astype(np.float32)
+    centers = mini_batch_kmeans(points, k, rng)
+
+    labels = _assign(points, centers)
+    proportions = np.bincount(labels, minlength=len(centers)) / len(points)
+    order = np.argsort(-proportions)
+    centers = centers[order].round().clip(0, 255).astype(int)
+    proportions = proportions[order]
+    names = nearest_color_names(centers.astype(np.float32))
+
+    palette = []
+    seen = set()
+    for color, proportion, name in zip(centers, proportions, names):
+        hex_color = "#{:02x}{:02x}{:02x}".format(*color)
+        # Identical centers appear when the image has fewer colors than k
+        if proportion < min_proportion or hex_color in seen:
+            continue
+        seen.add(hex_color)
+        palette.append({"color": hex_color, "name": name, "proportion": round(float(proportion), 3)})
+    return palette
+
+def dominant_color_name(palette: List[Dict[str, Any]]) -> Optional[str]:
+    return palette[0]["name"] if palette else None
@@ -0,0 +1,244 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Requests slower than this are kept with their timings and stack, 0 disables it
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+# Slow requests kept per worker, oldest dropped first
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", 100))
+# Add a Server-Timing header with app and database time to every response
+TIMING_HEADER = os.getenv("TIMING_HEADER", "False").lower() in ["true", "1", "t", "yes"]
+# Upper bound for on-demand profiles, and the default sampling interval
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+
+# Query parameters never stored with a slow request
+REDACTED_PARAMS = {"token", "access_token", "password"}
+MAX_STACK_DEPTH = 64
+
+class RequestTimings:
+    """
+    Where the time of one request went, filled in as it runs
+    """
+    __slots__ = ("started", "db_seconds", "db_calls", "db_operations", "_lock")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.db_calls = 0
+        # "collection.command" -> [calls, seconds]
+        self.db_operations: Dict[str, List] = {}
+        # Queries of one request may run in several threads (gather_queries)
+        self._lock = threading.Lock()
+
+    def add_db(self, collection: str, command: str, seconds: float):
+        with self._lock:
+            self.db_seconds += seconds
+            self.db_calls += 1
+            operation = self.db_operations.get(f"{collection}.{command}")
+            if operation is None:
+                operation = self.db_operations[f"{collection}.{command}"] = [0, 0.0]
+            operation[0] += 1
+            operation[1] += seconds
+
+    def operations(self) -> Dict[str, List]:
+        """
+        A copy of db_operations; a timed out query may still be adding to it
+        """
+        with self._lock:
+            return {name: list(operation) for name, operation in self.db_operations.items()}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+# Timings of the request being handled; MongoDB commands add to it
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def coroutine_stack(task: asyncio.Task) -> List[str]:
+    """
+    The await chain of a task, outermost first. Task.get_stack() only
+    returns the outermost frame of a suspended coroutine.
+    """
+    frames = []
+    coro = task.get_coro()
+    while coro is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+class StackSampler:
+    """
+    Sampling profiler over sys._current_frames(), run in its own thread so it
+    sees the event loop while it is busy. Stacks are aggregated at function
+    level in the collapsed format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def sample(self, seconds: float, interval: float) -> Dict[str, Any]:
+        """
+        Sample every thread's stack each interval for seconds. Raises
+        RuntimeError when a profile is already running in this worker.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running in this worker")
+        try:
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    thread_name = names.get(thread_id) or f"thread-{thread_id}"
+                    stacks[f"{thread_name};{self._collapse(frame)}"] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "samples": samples,
+                "seconds": round(time.perf_counter() - started, 3),
+                "interval_ms": interval * 1000,
+                "stacks": stacks
+            }
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(profile: Dict[str, Any]) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].most_common())
+
+class SlowRequestLog:
+    """
+    Bounded ring buffer of the recent slow requests of this worker
+    """
+
+    def __init__(self, size: int = SLOW_REQUEST_BUFFER):
+        self._entries = deque(maxlen=size)
+
+    def add(self, entry: Dict[str, Any]):
+        self._entries.append(entry)
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        return list(self._entries)[-limit:][::-1]
+
+    def clear(self):
+        self._entries.clear()
+
+def _params(scope) -> Dict[str, Any]:
+    query = {
+        key: "[redacted]" if key.lower() in REDACTED_PARAMS else value
+        for key, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"))
+    }
+    return {"query": query, "path": dict(scope.get("path_params") or {})}
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware recording requests slower than the threshold, with
+    their database time per collection and command and where the request was
+    waiting once the threshold passed. Optionally adds a Server-Timing header.
+    """
+
+    def __init__(self, app, slow_log: "SlowRequestLog", threshold_ms: float = SLOW_REQUEST_MS, timing_header: bool = TIMING_HEADER, exclude=("/metrics",)):
+        self.app = app
+        self.slow_log = slow_log
+        self.threshold = threshold_ms / 1000
+        self.timing_header = timing_header
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude or not (self.threshold or self.timing_header):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        reset_token = current_timings.set(timings)
+        status = 500
+        snapshot: Dict[str, Any] = {}
+
+        watchdog = None
+        if self.threshold:
+            # Taken while the request is still running; the timer firing late
+            # means the event loop itself was blocked
+            task = asyncio.current_task()
+            def take_snapshot():
+                snapshot["stack"] = coroutine_stack(task)
+                snapshot["loop_delay_ms"] = round((timings.elapsed() - self.threshold) * 1000, 1)
+            watchdog = asyncio.get_running_loop().call_later(self.threshold, take_snapshot)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.timing_header:
+                    elapsed = timings.elapsed() * 1000
+                    value = f'app;dur={elapsed:.1f}, db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_calls} queries"'
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timings.reset(reset_token)
+            if watchdog is not None:
+                watchdog.cancel()
+            elapsed = timings.elapsed()
+            if self.threshold and elapsed >= self.threshold:
+                route = scope.get("route")
+                self.slow_log.add({
+                    "timestamp": datetime.now().isoformat(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": getattr(route, "path", None),
+                    "params": _params(scope),
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "db_ms": round(timings.db_seconds * 1000, 1),
+                    "db_operations": {
+                        name: {"calls": calls, "ms": round(seconds * 1000, 1)}
+                        for name, (calls, seconds) in timings.operations().items()
+                    },
+                    # No stack: the request blocked the event loop past the
+                    # threshold until it finished, /profile shows where
+                    "stack": snapshot.get("stack"),
+                    "loop_delay_ms": snapshot.get("loop_delay_ms", round((elapsed - self.threshold) * 1000, 1))
+                })
+
+# Shared per worker
+stack_sampler = StackSampler()
+slow_requests = SlowRequestLog()
@@ -0,0 +1,276 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from db.mongodb import get_collection
+from services.events import ChatMembershipChanged, event_bus
+from services.keyword_matcher import RuleTable
+from services.text_analysis import tokenize, chat_filter
+
+# Load environment variables
+load_dotenv()
+
+# Pairs are mined from consecutive text messages by different senders,
+# answered within REPLY_MAX_GAP seconds with at most REPLY_MAX_LENGTH characters
+REPLY_MAX_GAP = int(os.getenv("REPLY_MAX_GAP", 600))
+REPLY_MAX_LENGTH = int(os.getenv("REPLY_MAX_LENGTH", 60))
+# A response must have been sent this many times before it is suggested
+REPLY_MIN_SUPPORT = int(os.getenv("REPLY_MIN_SUPPORT", 2))
+# Per-chat memory bounds of the index
+REPLY_MAX_RESPONSES = int(os.getenv("REPLY_MAX_RESPONSES", 200))
+REPLY_MAX_NGRAMS = int(os.getenv("REPLY_MAX_NGRAMS", 2000))
+REPLY_MAX_PER_NGRAM = int(os.getenv("REPLY_MAX_PER_NGRAM", 10))
+# Chat indexes kept in memory, and how long they are reused
+REPLY_INDEX_CACHE_CHATS = int(os.getenv("REPLY_INDEX_CACHE_CHATS", 1000))
+REPLY_INDEX_CACHE_TTL = int(os.getenv("REPLY_INDEX_CACHE_TTL", 600))
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Bigrams say more about the message than single words
+NGRAM_WEIGHTS = {1: 1.0, 2: 2.0}
+
+def prompt_ngrams(text: str) -> Dict[str, float]:
+    """
+    Unigrams and bigrams of a message with their weights
+    """
+    words = tokenize(text)
+    grams = {word: NGRAM_WEIGHTS[1] for word in words}
+    for first, second in zip(words, words[1:]):
+        grams[f"{first} {second}"] = NGRAM_WEIGHTS[2]
+    return grams
+
+def normalize_response(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+class ReplyIndex:
+    """
+    Counts of which responses followed messages containing each n-gram in one chat.
+    Bounded by REPLY_MAX_RESPONSES responses, REPLY_MAX_NGRAMS n-grams and
+    REPLY_MAX_PER_NGRAM responses per n-gram; the least frequent are dropped.
+    """
+
+    def __init__(
+        self,
+        prompts: int = 0,
+        responses: Optional[List[str]] = None,
+        response_counts: Optional[List[int]] = None,
+        ngrams: Optional[Dict[str, Dict[int, int]]] = None
+    ):
+        self.prompts = prompts
+        self.responses = responses or []
+        self.response_counts = response_counts or []
+        self.ngrams = ngrams or {}
+        self._response_ids = {response.lower(): index for index, response in enumerate(self.responses)}
+        self._totals = {gram: sum(postings.values()) for gram, postings in self.ngrams.items()}
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "ReplyIndex":
+        return cls(
+            document.get("prompts", 0),
+            list(document.get("responses", [])),
+            list(document.get("response_counts", [])),
+            {gram: {index: count for index, count in postings} for gram, postings in document.get("ngrams", {}).items()}
+        )
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "prompts": self.prompts,
+            "responses": self.responses,
+            "response_counts": self.response_counts,
+            # Postings as [response index, count] pairs, BSON keys must be strings
+            "ngrams": {gram: [[index, count] for index, count in postings.items()] for gram, postings in self.ngrams.items()}
+        }
+
+    def add_pair(self, prompt: str, response: str):
+        response = normalize_response(response)
+        key = response.lower()
+        index = self._response_ids.get(key)
+        if index is None:
+            index = len(self.responses)
+            self._response_ids[key] = index
+            self.responses.append(response)
+            self.response_counts.append(0)
+        self.response_counts[index] += 1
+        self.prompts += 1
+        for gram in prompt_ngrams(prompt):
+            postings = self.ngrams.setdefault(gram, {})
+            postings[index] = postings.get(index, 0) + 1
+            self._totals[gram] = self._totals.get(gram, 0) + 1
+
+    def prune(
+        self,
+        max_responses: int = REPLY_MAX_RESPONSES,
+        max_ngrams: int = REPLY_MAX_NGRAMS,
+        max_per_ngram: int = REPLY_MAX_PER_NGRAM
+    ):
+        """
+        Drop the least frequent responses and n-grams down to the limits
+        """
+        kept = heapq.nlargest(max_responses, range(len(self.responses)), key=self.response_counts.__getitem__)
+        kept.sort()
+        remap = {old: new for new, old in enumerate(kept)}
+
+        ngrams = {}
+        for gram, postings in self.ngrams.items():
+            postings = {remap[index]: count for index, count in postings.items() if index in remap}
+            if postings:
+                ngrams[gram] = dict(heapq.nlargest(max_per_ngram, postings.items(), key=lambda item: item[1]))
+        totals = {gram: sum(postings.values()) for gram, postings in ngrams.items()}
+        kept_grams = heapq.nlargest(max_ngrams, totals, key=totals.__getitem__)
+
+        self.responses = [self.responses[index] for index in kept]
+        self.response_counts = [self.response_counts[index] for index in kept]
+        self.ngrams = {gram: ngrams[gram] for gram in kept_grams}
+        self._totals = {gram: totals[gram] for gram in kept_grams}
+        self._response_ids = {response.lower(): index for index, response in enumerate(self.responses)}
+
+    def rank(self, text: str, limit: int, min_support: int = REPLY_MIN_SUPPORT) -> List[str]:
+        """
+        Responses most often sent after messages sharing n-grams with the text.
+        Each n-gram votes with its weight times IDF, split by how often each
+        response followed it.
+        """
+        scores: Dict[int, float] = {}
+        for gram, weight in prompt_ngrams(text).items():
+            postings = self.ngrams.get(gram)
+            if not postings:
+                continue
+            total = self._totals[gram]
+            idf = math.log((self.prompts + 1) / (total + 1)) + 1
+            for index, count in postings.items():
+                scores[index] = scores.get(index, 0.0) + weight * idf * count / total
+
+        candidates = [index for index in scores if self.response_counts[index] >= min_support]
+        best = heapq.nlargest(limit, candidates, key=lambda index: (scores[index], self.response_counts[index]))
+        return [self.responses[index] for index in best]
+
+def mine_pairs(messages: Iterable[Dict[str, Any]], previous: Optional[Dict[str, Any]] = None, max_gap: int = REPLY_MAX_GAP):
+    """
+    (prompt, response) pairs from messages in send order; previous is the
+    message before the first one, when resuming. Yields (prompt, response, message).
+    """
+    for message in messages:
+        content = message.get("content") or ""
+        if (
+            previous is not None
+            and content
+            and len(content) <= REPLY_MAX_LENGTH
+            and previous.get("content")
+            and str(previous.get("sender")) != str(message.get("sender"))
+            and previous.get("createdAt") and message.get("createdAt")
+            and (message["createdAt"] - previous["createdAt"]).total_seconds() <= max_gap
+        ):
+            yield previous["content"], content, message
+        else:
+            yield None, None, message
+        previous = message
+
+class ReplyRanker:
+    """
+    Learned smart replies per chat, built offline into chat_reply_index
+    (see jobs/build_reply_index.py) and cached in memory with the chat's members.
+    """
+
+    def __init__(self, cache_chats: int = REPLY_INDEX_CACHE_CHATS, cache_ttl: int = REPLY_INDEX_CACHE_TTL):
+        self.cache_chats = cache_chats
+        self.cache_ttl = cache_ttl
+        # chat -> (loaded at, index or None, member IDs)
+        self._cache: "OrderedDict[str, Tuple[float, Optional[ReplyIndex], FrozenSet[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, chat_id: str, full: bool = False) -> int:
+        """
+        Add the pairs of messages sent since the last build to the chat's index,
+        or rebuild it from scratch with full=True. Returns the number of messages read.
+        """
+        index_collection = get_collection("chat_reply_index")
+        document = None if full else index_collection.find_one({"_id": chat_id})
+        index = ReplyIndex.from_document(document) if document else ReplyIndex()
+        previous = document.get("tail") if document else None
+
+        query = {"chat": chat_filter(chat_id), "messageType": "text", "isDeleted": {"$ne": True}}
+        if previous:
+            # Keyset resume after the last message already counted
+            query["$or"] = [
+                {"createdAt": {"$gt": previous["createdAt"]}},
+                {"createdAt": previous["createdAt"], "_id": {"$gt": previous["_id"]}}
+            ]
+        cursor = get_collection("messages").find(
+            query, {"sender": 1, "content": 1, "createdAt": 1}
+        ).sort([("createdAt", 1), ("_id", 1)]).batch_size(1000)
+
+        read = 0
+        for prompt, response, message in mine_pairs(cursor, previous):
+            read += 1
+            previous = message
+            if prompt is not None:
+                index.add_pair(prompt, response)
+        index.prune()
+
+        index_collection.replace_one(
+            {"_id": chat_id},
+            {"_id": chat_id, **index.to_document(), "tail": previous, "updatedAt": time.time()},
+            upsert=True
+        )
+        self.invalidate(chat_id)
+        return read
+
+    def invalidate(self, chat_id: str):
+        """
+        Drop a chat's cached index and members, e.g. when its membership changes
+        """
+        with self._lock:
+            self._cache.pop(chat_id, None)
+
+    def _load(self, chat_id: str) -> Tuple[float, Optional[ReplyIndex], FrozenSet[str]]:
+        with self._lock:
+            cached = self._cache.get(chat_id)
+            if cached and time.time() - cached[0] < self.cache_ttl:
+                self._cache.move_to_end(chat_id)
+                return cached
+
+        chat = get_collection("chats").find_one({"_id": chat_filter(chat_id)}, {"users": 1})
+        members = frozenset(str(user) for user in (chat or {}).get("users", []))
+        document = get_collection("chat_reply_index").find_one({"_id": chat_id}) if members else None
+        cached = (time.time(), ReplyIndex.from_document(document) if document else None, members)
+
+        with self._lock:
+            self._cache[chat_id] = cached
+            self._cache.move_to_end(chat_id)
+            while len(self._cache) > self.cache_chats:
+                self._cache.popitem(last=False)
+        return cached
+
+    def learned(self, text: str, chat_id: Optional[str], user_id: str, limit: int) -> List[str]:
+        """
+        Learned replies for a chat; only members see what their chat says
+        """
+        if not chat_id:
+            return []
+        _, index, members = self._load(chat_id)
+        if index is None or user_id not in members:
+            return []
+        return index.rank(text, limit)
+
+    def suggest(self, text: str, chat_id: Optional[str], user_id: str, rules: RuleTable) -> Tuple[List[str], str]:
+        """
+        Learned replies first, topped up from the keyword rules.
+        Returns the suggestions and where they came from.
+        """
+        limit = rules.limit
+        learned = self.learned(text, chat_id, user_id, limit)
+        if len(learned) >= limit:
+            return learned, "chat"
+        suggestions = list(dict.fromkeys(learned + rules.suggest(text)))[:limit]
+        return suggestions, "chat" if learned else "rules"
+
+# Shared ranker for the API process
+reply_ranker = ReplyRanker()
+
+# Members are cached with the index, so a removed member stops seeing
+# suggestions as soon as the change feed reports it
+event_bus.subscribe(ChatMembershipChanged, lambda event: reply_ranker.invalidate(event.chat_id))
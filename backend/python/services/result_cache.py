@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 10000))
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# SQLite file for the on-disk tier; empty disables it
+AI_CACHE_DB_PATH = os.getenv("AI_CACHE_DB_PATH", "")
+AI_CACHE_DISK_MAX_ENTRIES = int(os.getenv("AI_CACHE_DISK_MAX_ENTRIES", 200000))
+# Entries older than this are recomputed (seconds, 0 = never expire)
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", 7 * 24 * 60 * 60))
+
+def content_key(content: Union[bytes, str], *parts: Any) -> bytes:
+    """
+    BLAKE2 digest of some content plus anything else the result depends on.
+    Text is NFC-normalized so equivalent Unicode spellings share a key.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    if isinstance(content, str):
+        content = unicodedata.normalize("NFC", content).encode("utf-8", "surrogatepass")
+    digest.update(content)
+    return digest.digest()
+
+class _DiskTier:
+    """
+    SQLite table of JSON results that survives restarts
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "namespace TEXT NOT NULL, key BLOB NOT NULL, value TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+
+    def get(self, namespace: str, key: bytes) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT value, created FROM results WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+
+    def put(self, namespace: str, key: bytes, value: str, created: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (namespace, key, value, created) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, created)
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                # Drop the oldest rows beyond the limit
+                self._db.execute(
+                    "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+_disk_tiers: Dict[str, _DiskTier] = {}
+
+def _disk_tier(path: str) -> _DiskTier:
+    # One connection per file, shared by every cache namespace
+    if path not in _disk_tiers:
+        _disk_tiers[path] = _DiskTier(path, AI_CACHE_DISK_MAX_ENTRIES)
+    return _disk_tiers[path]
+
+class ResultCache:
+    """
+    LRU memoization of JSON-serializable results, bounded by entry count and
+    approximate size, with an optional SQLite tier behind it.
+    Keys come from content_key().
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = AI_CACHE_MAX_ENTRIES,
+        max_bytes: int = AI_CACHE_MAX_BYTES,
+        disk_path: Optional[str] = AI_CACHE_DB_PATH or None,
+        ttl: int = AI_CACHE_TTL
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._disk_opened: Optional[_DiskTier] = None
+        self._entries: "OrderedDict[bytes, Tuple[Any, int, float]]" = OrderedDict()  # key -> (value, size, created)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def _disk(self) -> Optional[_DiskTier]:
+        # Opened on first use, image worker processes import this module too
+        if self._disk_opened is None and self.disk_path:
+            self._disk_opened = _disk_tier(self.disk_path)
+        return self._disk_opened
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def _store(self, key: bytes, value: Any, size: int, created: float):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size, created)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get(self, key: bytes) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[2]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self._disk is not None:
+            try:
+                row = self._disk.get(self.namespace, key)
+            except sqlite3.Error as e:
+                print(f"AI cache disk read failed: {e}")
+                row = None
+            if row and not self._expired(row[1]):
+                value = json.loads(row[0])
+                self._store(key, value, len(row[0]), row[1])
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: bytes, value: Any):
+        serialized = json.dumps(value, default=str)
+        created = time.time()
+        self._store(key, value, len(serialized), created)
+        if self._disk is not None:
+            try:
+                self._disk.put(self.namespace, key, serialized, created)
+            except sqlite3.Error as e:
+                print(f"AI cache disk write failed: {e}")
+
+    def get_or_compute(self, key: bytes, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    async def get_or_compute_async(self, key: bytes, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "disk_tier": bool(self.disk_path)
+        }
+
+# Every cache created, by namespace, for reporting
+_caches: Dict[str, ResultCache] = {}
+
+def get_cache(namespace: str, **options) -> ResultCache:
+    """
+    The shared cache for a namespace, created on first use
+    """
+    if namespace not in _caches:
+        _caches[namespace] = ResultCache(namespace, **options)
+    return _caches[namespace]
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {namespace: cache.stats() for namespace, cache in _caches.items()}
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Participant roles
+ROLE_HOST = "host"
+ROLE_SPEAKER = "speaker"
+ROLE_LISTENER = "listener"
+ROLES = (ROLE_HOST, ROLE_SPEAKER, ROLE_LISTENER)
+
+# Maximum number of media-sending participants (host + speakers) in a room
+ROOM_MAX_SIZE = int(os.getenv("ROOM_MAX_SIZE", 16))
+# Maximum number of participants of any role; every event fans out to all of them
+ROOM_MAX_PARTICIPANTS = int(os.getenv("ROOM_MAX_PARTICIPANTS", 100))
+# What happens to joins beyond ROOM_MAX_SIZE: "listen_only" or "reject"
+ROOM_OVERFLOW_POLICY = os.getenv("ROOM_OVERFLOW_POLICY", "listen_only")
+# Join/leave events arriving within this window are sent as one message
+ROOM_EVENT_COALESCE_MS = int(os.getenv("ROOM_EVENT_COALESCE_MS", 50))
+# Events kept per room so clients can resync after a gap
+ROOM_EVENT_LOG_SIZE = int(os.getenv("ROOM_EVENT_LOG_SIZE", 256))
+# Above this many senders a full mesh gets too expensive and clients should use an SFU
+ROOM_MESH_MAX_SENDERS = int(os.getenv("ROOM_MESH_MAX_SENDERS", 4))
+
+class RoomFullError(Exception):
+    """Raised when a room cannot admit another participant"""
+
+class Room:
+    """
+    Participants of a call with their roles, plus an ordered event stream.
+    Membership events are numbered with a per-room sequence, buffered for a
+    short window and fanned out to all participants as a single message.
+    """
+
+    def __init__(
+        self,
+        call_id: str,
+        send: Callable[[Iterable[str], str], Awaitable[Any]],
+        max_size: int = ROOM_MAX_SIZE,
+        max_participants: int = ROOM_MAX_PARTICIPANTS,
+        overflow_policy: str = ROOM_OVERFLOW_POLICY,
+        coalesce_ms: int = ROOM_EVENT_COALESCE_MS
+    ):
+        self.call_id = call_id
+        self.max_size = max_size
+        self.max_participants = max_participants
+        self.overflow_policy = overflow_policy
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.seq = 0
+        self._send = send
+        self._roles: Dict[str, str] = {}  # user_id -> role, in join order
+        self._log = deque(maxlen=ROOM_EVENT_LOG_SIZE)
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._roles
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    @property
+    def participants(self) -> List[str]:
+        return list(self._roles)
+
+    @property
+    def sender_count(self) -> int:
+        return sum(1 for role in self._roles.values() if role != ROLE_LISTENER)
+
+    @property
+    def topology(self) -> str:
+        """
+        Hint for clients: full mesh for small rooms, SFU forwarding for larger ones
+        """
+        return "mesh" if self.sender_count <= ROOM_MESH_MAX_SENDERS else "sfu"
+
+    @property
+    def host(self) -> Optional[str]:
+        for user_id, role in self._roles.items():
+            if role == ROLE_HOST:
+                return user_id
+        return None
+
+    def role_of(self, user_id: str) -> Optional[str]:
+        return self._roles.get(user_id)
+
+    def add(self, user_id: str, role: str = ROLE_SPEAKER) -> str:
+        """
+        Add a participant without emitting an event. Returns the role granted.
+        """
+        if user_id in self._roles:
+            return self._roles[user_id]
+        if len(self._roles) >= self.max_participants:
+            raise RoomFullError(f"Room is full ({self.max_participants} participants)")
+        if role == ROLE_HOST and self.host is not None:
+            # A room has a single host
+            role = ROLE_SPEAKER
+        if role != ROLE_LISTENER and self.sender_count >= self.max_size:
+            if self.overflow_policy != "listen_only":
+                raise RoomFullError(f"Room is full ({self.max_size} senders)")
+            role = ROLE_LISTENER
+        self._roles[user_id] = role
+        return role
+
+    def join(self, user_id: str) -> str:
+        """
+        Add a participant (if needed) and announce the join
+        """
+        role = self.add(user_id)
+        self._emit({"type": "user_joined", "user_id": user_id, "role": role})
+        return role
+
+    def leave(self, user_id: str, reason: str = "user_left") -> bool:
+        """
+        Remove a participant and announce it. Returns False if they were not in the room.
+        """
+        if self._roles.pop(user_id, None) is None:
+            return False
+        if self._roles:
+            self._emit({"type": reason, "user_id": user_id})
+        return True
+
+    def set_role(self, user_id: str, role: str):
+        if role not in ROLES or user_id not in self._roles:
+            raise ValueError("Invalid participant or role")
+        current = self._roles[user_id]
+        if current == role:
+            return
+        # Exactly one host: the host cannot step down, nor can a second be made
+        if current == ROLE_HOST:
+            raise ValueError("The host cannot change their own role")
+        if role == ROLE_HOST and self.host is not None:
+            raise ValueError("The room already has a host")
+        if current == ROLE_LISTENER and self.sender_count >= self.max_size:
+            raise RoomFullError(f"Room is full ({self.max_size} senders)")
+        self._roles[user_id] = role
+        self._emit({"type": "role_changed", "user_id": user_id, "role": role})
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "room_state",
+            "call_id": self.call_id,
+            "seq": self.seq,
+            "topology": self.topology,
+            "participants": [{"user_id": user_id, "role": role} for user_id, role in self._roles.items()]
+        }
+
+    def events_since(self, seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events after `seq`, or None if some of them are no longer in the log
+        """
+        if seq >= self.seq:
+            return []
+        if not self._log or self._log[0]["seq"] > seq + 1:
+            return None
+        return [event for event in self._log if event["seq"] > seq]
+
+    def events_message(self, events: List[Dict[str, Any]]) -> str:
+        return json.dumps({
+            "type": "room_events",
+            "call_id": self.call_id,
+            "seq": self.seq,
+            "topology": self.topology,
+            "events": events
+        })
+
+    def _emit(self, event: Dict[str, Any]):
+        self.seq += 1
+        event["seq"] = self.seq
+        self._log.append(event)
+        self._pending.append(event)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.coalesce_seconds, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """
+        Send all buffered events to every participant in one message
+        """
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        await self._send(self.participants, self.events_message(events))
+
+    def close(self):
+        """
+        Drop buffered events, the call is over
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending = []
@@ -0,0 +1,523 @@
+import asyncio
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from bson import ObjectId
+from dotenv import load_dotenv
+from db.mongodb import get_collection
+from services.events import MessageCreated, event_bus
+from services.text_analysis import tokenize
+
+# Load environment variables
+load_dotenv()
+
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", "search_index")
+# Messages per segment; smaller tail segments are merged once there are SEARCH_MAX_SEGMENTS of them
+SEARCH_SEGMENT_MAX_DOCS = int(os.getenv("SEARCH_SEGMENT_MAX_DOCS", 200000))
+SEARCH_MAX_SEGMENTS = int(os.getenv("SEARCH_MAX_SEGMENTS", 8))
+# Seconds between incremental builds in the API process (0 disables), and between manifest checks
+SEARCH_INDEX_INTERVAL = int(os.getenv("SEARCH_INDEX_INTERVAL", 60))
+SEARCH_RELOAD_INTERVAL = float(os.getenv("SEARCH_RELOAD_INTERVAL", 5))
+# Seconds after a new message is reported before indexing, so a burst is indexed together
+SEARCH_INDEX_DELAY = float(os.getenv("SEARCH_INDEX_DELAY", 2))
+# Index terms a prefix query may expand to
+SEARCH_MAX_PREFIX_TERMS = int(os.getenv("SEARCH_MAX_PREFIX_TERMS", 64))
+MIN_PREFIX_LENGTH = 2
+# Longer tokens (hashes, encoded blobs) are not indexed
+MAX_TERM_LENGTH = 64
+
+MANIFEST = "manifest.json"
+
+# Segment layout, little endian:
+#   header
+#   documents: fixed records in (createdAt, _id) order, the doc number is the index
+#   terms: fixed records sorted by UTF-8 term, pointing into the term blob and postings
+#   term blob: UTF-8 terms back to back
+#   postings per term: varint doc delta, varint position count, varint position deltas
+MAGIC = b"CWSI"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQQQQ")  # magic, version, documents, terms, then section offsets
+DOC = struct.Struct("<12s12sq")  # message ID, chat ID, createdAt in ms
+TERM = struct.Struct("<IHQI")  # blob offset, term length, postings offset, postings length
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_postings(data, with_positions: bool = True) -> Dict[int, List[int]]:
+    postings: Dict[int, List[int]] = {}
+    index = 0
+    length = len(data)
+    doc = 0
+    while index < length:
+        values = []
+        # doc delta, then position count
+        for _ in range(2):
+            value = shift = 0
+            while True:
+                byte = data[index]
+                index += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            values.append(value)
+        doc += values[0]
+        positions = []
+        position = 0
+        for _ in range(values[1]):
+            value = shift = 0
+            while True:
+                byte = data[index]
+                index += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            position += value
+            if with_positions:
+                positions.append(position)
+        postings[doc] = positions
+    return postings
+
+def _to_millis(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def write_segment(path: str, docs: List[Tuple[bytes, bytes, int]], postings: Dict[str, List[Tuple[int, List[int]]]]):
+    """
+    Write an immutable segment; docs are (message ID, chat ID, createdAt ms)
+    in order, postings map term -> [(doc number, positions)] in doc order
+    """
+    terms = sorted((term.encode("utf-8"), term) for term in postings)
+    blob = bytearray()
+    encoded = bytearray()
+    term_records = []
+    for term_bytes, term in terms:
+        start = len(encoded)
+        previous = 0
+        for doc, positions in postings[term]:
+            _encode_varint(doc - previous, encoded)
+            previous = doc
+            _encode_varint(len(positions), encoded)
+            last = 0
+            for position in positions:
+                _encode_varint(position - last, encoded)
+                last = position
+        term_records.append((len(blob), len(term_bytes), start, len(encoded) - start))
+        blob += term_bytes
+
+    docs_offset = HEADER.size
+    terms_offset = docs_offset + DOC.size * len(docs)
+    blob_offset = terms_offset + TERM.size * len(terms)
+    postings_offset = blob_offset + len(blob)
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(docs), len(terms), docs_offset, terms_offset, blob_offset, postings_offset))
+        for doc in docs:
+            f.write(DOC.pack(*doc))
+        for record in term_records:
+            f.write(TERM.pack(*record))
+        f.write(blob)
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+class Segment:
+    """
+    A memory-mapped segment; nothing is decoded until a query touches it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.documents, self.terms,
+         self._docs_offset, self._terms_offset, self._blob_offset, self._postings_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a search segment")
+
+    def doc(self, number: int) -> Tuple[bytes, bytes, int]:
+        return DOC.unpack_from(self._map, self._docs_offset + DOC.size * number)
+
+    def _term(self, index: int) -> Tuple[bytes, int, int]:
+        blob_start, length, postings_start, postings_length = TERM.unpack_from(self._map, self._terms_offset + TERM.size * index)
+        start = self._blob_offset + blob_start
+        return self._map[start:start + length], postings_start, postings_length
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings_at(self, index: int, with_positions: bool) -> Dict[int, List[int]]:
+        _, start, length = self._term(index)
+        start += self._postings_offset
+        return _decode_postings(memoryview(self._map)[start:start + length], with_positions)
+
+    def postings(self, term: str, with_positions: bool = True) -> Dict[int, List[int]]:
+        key = term.encode("utf-8")
+        index = self._lower_bound(key)
+        if index < self.terms and self._term(index)[0] == key:
+            return self._postings_at(index, with_positions)
+        return {}
+
+    def prefix_postings(self, prefix: str, max_terms: int = SEARCH_MAX_PREFIX_TERMS) -> Dict[int, List[int]]:
+        """
+        Union of the postings (without positions) of terms starting with prefix
+        """
+        key = prefix.encode("utf-8")
+        index = self._lower_bound(key)
+        docs: Dict[int, List[int]] = {}
+        expanded = 0
+        while index < self.terms and expanded < max_terms and self._term(index)[0].startswith(key):
+            docs.update(self._postings_at(index, False))
+            index += 1
+            expanded += 1
+        return docs
+
+    def iter_postings(self) -> Iterable[Tuple[str, Dict[int, List[int]]]]:
+        for index in range(self.terms):
+            yield self._term(index)[0].decode("utf-8"), self._postings_at(index, True)
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # A view is still referenced; the mapping goes when it does
+            pass
+
+class Clause(NamedTuple):
+    terms: Tuple[str, ...]
+    prefix: bool = False
+
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+def parse_query(query: str) -> List[Clause]:
+    """
+    Clauses that must all match: "quoted phrases", word* prefixes and
+    plain words. Words joined by punctuation (e.g. e-mail) are phrases.
+    """
+    clauses = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        if phrase:
+            terms = tokenize(phrase)
+            if terms:
+                clauses.append(Clause(tuple(terms)))
+            continue
+        terms = tokenize(word)
+        if word.endswith("*") and len(terms) == 1 and len(terms[0]) >= MIN_PREFIX_LENGTH:
+            clauses.append(Clause((terms[0],), prefix=True))
+        elif terms:
+            clauses.append(Clause(tuple(terms)))
+    return clauses
+
+def _match_clause(segment: Segment, clause: Clause) -> Set[int]:
+    if clause.prefix:
+        return set(segment.prefix_postings(clause.terms[0]))
+    if len(clause.terms) == 1:
+        return set(segment.postings(clause.terms[0], with_positions=False))
+
+    # Phrase: every term in consecutive positions
+    postings = [segment.postings(term) for term in clause.terms]
+    docs = set(postings[0])
+    for term_postings in postings[1:]:
+        docs &= term_postings.keys()
+    matched = set()
+    for doc in docs:
+        starts = set(postings[0][doc])
+        for offset, term_postings in enumerate(postings[1:], 1):
+            starts &= {position - offset for position in term_postings[doc]}
+            if not starts:
+                break
+        if starts:
+            matched.add(doc)
+    return matched
+
+class SearchHit(NamedTuple):
+    message_id: ObjectId
+    chat_id: ObjectId
+    created_at: int
+
+class SearchIndex:
+    """
+    Reader over the segments listed in the index manifest, reopened when
+    the builder publishes a new manifest
+    """
+
+    def __init__(self, directory: str = SEARCH_INDEX_DIR, reload_interval: float = SEARCH_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.segments: List[Segment] = []
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval and self._mtime is not None:
+            return
+        with self._lock:
+            self._checked_at = now
+            path = os.path.join(self.directory, MANIFEST)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                opened = {segment.name: segment for segment in self.segments}
+                segments = [
+                    opened.pop(name, None) or Segment(os.path.join(self.directory, name))
+                    for name in manifest["segments"]
+                ]
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the previous segments
+                print(f"Failed to load search index from {self.directory}: {e}")
+                return
+            self.segments = segments
+            self._mtime = mtime
+            # Segments merged away or rebuilt are no longer listed
+            for segment in opened.values():
+                segment.close()
+
+    def search(
+        self,
+        query: str,
+        chats: Set[bytes],
+        limit: int,
+        before: Optional[Tuple[int, bytes]] = None
+    ) -> List[SearchHit]:
+        """
+        Newest messages in the given chats matching every clause of the query,
+        strictly older than the (createdAt ms, message ID) keyset position
+        """
+        clauses = parse_query(query)
+        if not clauses or not chats:
+            return []
+        self.reload_if_changed()
+
+        hits: List[SearchHit] = []
+        # Segments and the documents inside them are in send order, so walking
+        # both backwards yields the newest matches first
+        for segment in reversed(self.segments):
+            docs: Optional[Set[int]] = None
+            for clause in clauses:
+                matched = _match_clause(segment, clause)
+                docs = matched if docs is None else docs & matched
+                if not docs:
+                    break
+            for number in sorted(docs or (), reverse=True):
+                message_id, chat_id, created_at = segment.doc(number)
+                if before is not None and (created_at, message_id) >= before:
+                    continue
+                if chat_id not in chats:
+                    continue
+                hits.append(SearchHit(ObjectId(message_id), ObjectId(chat_id), created_at))
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+class _SegmentBuilder:
+    def __init__(self):
+        self.docs: List[Tuple[bytes, bytes, int]] = []
+        self.postings: Dict[str, List[Tuple[int, List[int]]]] = {}
+
+    def add(self, message_id: bytes, chat_id: bytes, created_at: int, words: List[str]):
+        number = len(self.docs)
+        self.docs.append((message_id, chat_id, created_at))
+        positions: Dict[str, List[int]] = {}
+        for position, word in enumerate(words):
+            if len(word) <= MAX_TERM_LENGTH:
+                positions.setdefault(word, []).append(position)
+        for word, word_positions in positions.items():
+            self.postings.setdefault(word, []).append((number, word_positions))
+
+class SearchIndexer:
+    """
+    Builds segments from the messages collection. Each run indexes the
+    messages sent since the manifest's position into new segments, then
+    merges small tail segments. Runs on one host are serialized by a file lock.
+    """
+
+    def __init__(
+        self,
+        directory: str = SEARCH_INDEX_DIR,
+        segment_max_docs: int = SEARCH_SEGMENT_MAX_DOCS,
+        max_segments: int = SEARCH_MAX_SEGMENTS,
+        interval: int = SEARCH_INDEX_INTERVAL
+    ):
+        self.directory = directory
+        self.segment_max_docs = segment_max_docs
+        self.max_segments = max_segments
+        self.interval = interval
+        # Set by the change feed when messages arrive, see run()
+        self._wake: Optional[asyncio.Event] = None
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "sizes": [], "position": None, "documents": 0}
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        manifest["updatedAt"] = time.time()
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def _new_segment_path(self) -> str:
+        return os.path.join(self.directory, f"segment-{time.time_ns()}.idx")
+
+    def _flush(self, builder: _SegmentBuilder, manifest: Dict[str, Any], position: Dict[str, Any]):
+        path = self._new_segment_path()
+        write_segment(path, builder.docs, builder.postings)
+        manifest["segments"].append(os.path.basename(path))
+        manifest["sizes"].append(len(builder.docs))
+        manifest["documents"] += len(builder.docs)
+        manifest["position"] = position
+        # Publish after every segment so an interrupted run resumes from here
+        self._write_manifest(manifest)
+
+    def _merge_tail(self, manifest: Dict[str, Any]):
+        # The newest run of small segments, merged into one while it fits a segment
+        start = len(manifest["segments"])
+        total = 0
+        while start > 0 and total + manifest["sizes"][start - 1] <= self.segment_max_docs:
+            start -= 1
+            total += manifest["sizes"][start]
+        names = manifest["segments"][start:]
+        if len(manifest["segments"]) <= self.max_segments or len(names) < 2:
+            return
+
+        builder = _SegmentBuilder()
+        for name in names:
+            segment = Segment(os.path.join(self.directory, name))
+            base = len(builder.docs)
+            builder.docs.extend(segment.doc(number) for number in range(segment.documents))
+            for term, postings in segment.iter_postings():
+                builder.postings.setdefault(term, []).extend((base + doc, positions) for doc, positions in postings.items())
+            segment.close()
+
+        path = self._new_segment_path()
+        write_segment(path, builder.docs, builder.postings)
+        manifest["segments"][start:] = [os.path.basename(path)]
+        manifest["sizes"][start:] = [len(builder.docs)]
+        self._write_manifest(manifest)
+        for name in names:
+            os.unlink(os.path.join(self.directory, name))
+
+    def build(self, rebuild: bool = False) -> int:
+        """
+        Index new messages; returns how many were added, or -1 when another
+        build holds the lock
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "build.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return -1
+
+            manifest = self._read_manifest()
+            if rebuild:
+                stale = manifest["segments"]
+                manifest = {"segments": [], "sizes": [], "position": None, "documents": 0}
+            else:
+                stale = []
+
+            query: Dict[str, Any] = {"messageType": "text", "isDeleted": {"$ne": True}}
+            position = manifest["position"]
+            if position:
+                # Keyset resume after the last message indexed
+                created_at = datetime.fromisoformat(position["createdAt"])
+                query["$or"] = [
+                    {"createdAt": {"$gt": created_at}},
+                    {"createdAt": created_at, "_id": {"$gt": ObjectId(position["_id"])}}
+                ]
+            # Reads in the createdAt_id index declared on the Node Message model
+            cursor = get_collection("messages").find(
+                query, {"chat": 1, "content": 1, "createdAt": 1}
+            ).sort([("createdAt", 1), ("_id", 1)]).batch_size(1000)
+
+            added = 0
+            builder = _SegmentBuilder()
+            last = None
+            for message in cursor:
+                last = message
+                chat_id, created_at = message.get("chat"), message.get("createdAt")
+                # Node creates ObjectId keys; anything else cannot be stored in a segment
+                if not isinstance(message["_id"], ObjectId) or not isinstance(chat_id, ObjectId) or not isinstance(created_at, datetime):
+                    continue
+                builder.add(message["_id"].binary, chat_id.binary, _to_millis(created_at), tokenize(message.get("content") or ""))
+                added += 1
+                if len(builder.docs) >= self.segment_max_docs:
+                    self._flush(builder, manifest, {"createdAt": created_at.isoformat(), "_id": str(message["_id"])})
+                    builder = _SegmentBuilder()
+            if builder.docs:
+                self._flush(builder, manifest, {"createdAt": last["createdAt"].isoformat(), "_id": str(last["_id"])})
+            elif rebuild:
+                self._write_manifest(manifest)
+
+            for name in stale:
+                os.unlink(os.path.join(self.directory, name))
+            self._merge_tail(manifest)
+            return added
+
+    def notify(self, event: Optional[MessageCreated] = None):
+        """
+        Index soon rather than at the end of the interval
+        """
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        """
+        Index new messages every interval, or shortly after the change feed
+        reports new ones, off the event loop
+        """
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+                await asyncio.sleep(SEARCH_INDEX_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await loop.run_in_executor(None, self.build)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to update search index: {e}")
+
+# Shared reader and builder for the API process
+search_index = SearchIndex()
+search_indexer = SearchIndexer()
+
+event_bus.subscribe(MessageCreated, search_indexer.notify)
@@ -0,0 +1,253 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from db.mongodb import get_collection
+from services.result_cache import ResultCache, content_key, get_cache
+
+# Load environment variables
+load_dotenv()
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+LEXICON_PATH = os.getenv("LEXICON_PATH", os.path.join(CONFIG_DIR, "lexicon.json"))
+# Terms kept per chat in chat_term_stats, and how long they are reused in memory
+TERM_STATS_MAX_TERMS = int(os.getenv("TERM_STATS_MAX_TERMS", 5000))
+TERM_STATS_CACHE_TTL = int(os.getenv("TERM_STATS_CACHE_TTL", 600))
+
+WORD_PATTERN = re.compile(r"\b\w+\b")
+# Only words at least this long can be keywords
+MIN_KEYWORD_LENGTH = 5
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens of a text
+    """
+    return WORD_PATTERN.findall(text.lower())
+
+class Lexicon:
+    """
+    Weighted sentiment words and keyword stopwords, held in frozensets and
+    dicts for constant-time lookups per token
+    """
+
+    def __init__(self, sentiment: Dict[str, float], stopwords: Iterable[str]):
+        self.sentiment = {word.lower(): float(score) for word, score in sentiment.items()}
+        self.positive_words = frozenset(word for word, score in self.sentiment.items() if score > 0)
+        self.negative_words = frozenset(word for word, score in self.sentiment.items() if score < 0)
+        self.stopwords = frozenset(word.lower() for word in stopwords)
+        # Part of every cache key, so editing the lexicon invalidates old results
+        self.version = hashlib.blake2b(
+            json.dumps([sorted(self.sentiment.items()), sorted(self.stopwords)]).encode(),
+            digest_size=8
+        ).hexdigest()
+
+    @classmethod
+    def from_file(cls, path: str = LEXICON_PATH) -> "Lexicon":
+        """
+        Load a lexicon from JSON: {"sentiment": {word: score}, "stopwords": [word]}
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("sentiment", {}), config.get("stopwords", []))
+
+    def is_keyword(self, word: str) -> bool:
+        return len(word) >= MIN_KEYWORD_LENGTH and word not in self.stopwords
+
+    def sentiment_score(self, words: Iterable[str]) -> float:
+        # Weighted sentiment: dict lookup per token
+        score = 0.0
+        for word in words:
+            weight = self.sentiment.get(word)
+            if weight is not None:
+                score += weight
+        return score
+
+    @staticmethod
+    def sentiment_label(score: float) -> str:
+        if score > 0:
+            return "positive"
+        if score < 0:
+            return "negative"
+        return "neutral"
+
+def chat_filter(chat_id: str):
+    """
+    A chat ID as stored: chats are created by the Node backend with ObjectId
+    keys, other IDs are matched as given
+    """
+    try:
+        return ObjectId(chat_id)
+    except (InvalidId, TypeError):
+        return chat_id
+
+class TermStatistics:
+    """
+    Per-chat document frequencies for TF-IDF keyword ranking.
+    Built offline from the messages collection into chat_term_stats
+    (see jobs/build_term_stats.py) and cached in memory.
+    """
+
+    def __init__(self, lexicon: Lexicon, cache_ttl: int = TERM_STATS_CACHE_TTL):
+        self.lexicon = lexicon
+        self.cache_ttl = cache_ttl
+        # chat -> (loaded at, (documents, df) or None, updatedAt of the stats)
+        self._cache: Dict[str, Tuple[float, Optional[Tuple[int, Dict[str, int]]], Optional[float]]] = {}
+
+    def build(self, chat_id: str, max_terms: int = TERM_STATS_MAX_TERMS) -> int:
+        """
+        Count, for each keyword, how many messages of the chat contain it.
+        Returns the number of messages scanned.
+        """
+        messages_collection = get_collection("messages")
+        documents = 0
+        document_frequency = Counter()
+        for message in messages_collection.find(
+            {"chat": chat_filter(chat_id), "messageType": "text", "isDeleted": {"$ne": True}},
+            {"content": 1, "_id": 0}
+        ).batch_size(1000):
+            documents += 1
+            document_frequency.update({word for word in tokenize(message.get("content") or "") if self.lexicon.is_keyword(word)})
+
+        # Keep the most frequent terms, rare ones fall back to the default IDF
+        kept = dict(heapq.nlargest(max_terms, document_frequency.items(), key=lambda item: item[1]))
+        get_collection("chat_term_stats").replace_one(
+            {"_id": chat_id},
+            {"_id": chat_id, "documents": documents, "df": kept, "updatedAt": time.time()},
+            upsert=True
+        )
+        self._cache.pop(chat_id, None)
+        return documents
+
+    def _load(self, chat_id: str):
+        cached = self._cache.get(chat_id)
+        if cached and time.time() - cached[0] < self.cache_ttl:
+            return cached
+        stats = get_collection("chat_term_stats").find_one({"_id": chat_id})
+        value = (stats["documents"], stats["df"]) if stats and stats.get("documents") else None
+        cached = (time.time(), value, stats.get("updatedAt") if value else None)
+        self._cache[chat_id] = cached
+        return cached
+
+    def get(self, chat_id: str) -> Optional[Tuple[int, Dict[str, int]]]:
+        """
+        (document count, document frequencies) for a chat, or None if not built yet
+        """
+        return self._load(chat_id)[1]
+
+    def version(self, chat_id: str) -> Optional[float]:
+        """
+        When the chat's statistics were last built, or None if never
+        """
+        return self._load(chat_id)[2]
+
+class TextAnalyzer:
+    """
+    Sentiment, keywords and counts for chat messages.
+    Results are memoized by content hash of the text, lexicon and, when TF-IDF
+    is used, the chat's term statistics.
+    """
+
+    def __init__(self, lexicon: Lexicon, cache: Optional[ResultCache] = None):
+        self.lexicon = lexicon
+        self.term_stats = TermStatistics(lexicon)
+        self.cache = cache or get_cache("text_analysis")
+
+    def analyze(self, text: str, chat_id: Optional[str] = None, top_k: int = 5) -> Dict[str, Any]:
+        # Analyze the normalized form so equivalent spellings share a result
+        text = unicodedata.normalize("NFC", text)
+        stats_version = self.term_stats.version(chat_id) if chat_id else None
+        key = content_key(text, self.lexicon.version, chat_id or "", stats_version, top_k)
+        return self.cache.get_or_compute(key, lambda: self._analyze(text, chat_id, top_k))
+
+    def _analyze(self, text: str, chat_id: Optional[str], top_k: int) -> Dict[str, Any]:
+        words = tokenize(text)
+        score = self.lexicon.sentiment_score(words)
+        keyword_counts = Counter(word for word in words if self.lexicon.is_keyword(word))
+        term_stats = self.term_stats.get(chat_id) if chat_id and keyword_counts else None
+        idf = self._idf(term_stats, keyword_counts) if term_stats else None
+        return self._result(text, words, score, keyword_counts, idf, top_k)
+
+    @staticmethod
+    def _idf(term_stats: Tuple[int, Dict[str, int]], words: Iterable[str]) -> Dict[str, float]:
+        # Words that are common in the chat weigh less
+        documents, document_frequency = term_stats
+        return {word: math.log((documents + 1) / (document_frequency.get(word, 0) + 1)) + 1 for word in words}
+
+    def _result(self, text: str, words: List[str], score: float, keyword_counts: Counter, idf: Optional[Dict[str, float]], top_k: int) -> Dict[str, Any]:
+        if idf is not None and keyword_counts:
+            # TF-IDF: words that are common in this chat rank lower
+            scores = {word: count * idf[word] for word, count in keyword_counts.items()}
+            ranking = "tfidf"
+        else:
+            scores = keyword_counts
+            ranking = "frequency"
+        top_keywords = heapq.nlargest(top_k, scores, key=scores.__getitem__)
+
+        return {
+            "sentiment": self.lexicon.sentiment_label(score),
+            "sentiment_score": round(score, 3),
+            "keywords": top_keywords,
+            "keyword_ranking": ranking,
+            "word_count": len(words),
+            "character_count": len(text)
+        }
+
+    def analyze_batch(self, texts: List[str], chat_id: Optional[str] = None, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Analyze many texts in one pass. Each distinct text is tokenized once,
+        each distinct word of the batch is looked up in the lexicon once, and
+        the chat's term statistics are read once. Results match analyze() and
+        share its cache.
+        """
+        texts = [unicodedata.normalize("NFC", text) for text in texts]
+        stats_version = self.term_stats.version(chat_id) if chat_id else None
+        results: Dict[str, Dict[str, Any]] = {}
+        # Texts not in the cache -> (cache key, tokens)
+        missing: Dict[str, Tuple[bytes, List[str]]] = {}
+        for text in texts:
+            if text in results or text in missing:
+                continue
+            key = content_key(text, self.lexicon.version, chat_id or "", stats_version, top_k)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[text] = cached
+            else:
+                missing[text] = (key, tokenize(text))
+        if not missing:
+            return [results[text] for text in texts]
+
+        vocabulary = {word for _, words in missing.values() for word in words}
+        weights = {word: self.lexicon.sentiment[word] for word in vocabulary if word in self.lexicon.sentiment}
+        keywords = {word for word in vocabulary if self.lexicon.is_keyword(word)}
+        term_stats = self.term_stats.get(chat_id) if chat_id and keywords else None
+        idf = self._idf(term_stats, keywords) if term_stats else None
+
+        for text, (key, words) in missing.items():
+            score = 0.0
+            for word in words:
+                weight = weights.get(word)
+                if weight is not None:
+                    score += weight
+            keyword_counts = Counter(word for word in words if word in keywords)
+            result = self._result(text, words, score, keyword_counts, idf, top_k)
+            self.cache.put(key, result)
+            results[text] = result
+        return [results[text] for text in texts]
+
+# Shared analyzer using the configured lexicon
+text_analyzer = TextAnalyzer(Lexicon.from_file())
+
+def analyze_text(text: str, chat_id: Optional[str] = None) -> Dict[str, Any]:
+    return text_analyzer.analyze(text, chat_id)
+
+def analyze_batch(texts: List[str], chat_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    return text_analyzer.analyze_batch(texts, chat_id)
@@ -0,0 +1,202 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from typing import Dict, Optional, Tuple, Union
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Uploads are read in chunks of this size and kept in memory up to
+# UPLOAD_SPOOL_MAX_SIZE, larger ones continue in a temporary file
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 256 * 1024))
+UPLOAD_SPOOL_MAX_SIZE = int(os.getenv("UPLOAD_SPOOL_MAX_SIZE", 1024 * 1024))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", 5 * 1024 * 1024))
+# Allowance for multipart boundaries and headers on top of the file limit
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Leading bytes of each accepted image type -> (media type, extension)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ("image/jpeg", ".jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("image/png", ".png")),
+    (b"GIF87a", ("image/gif", ".gif")),
+    (b"GIF89a", ("image/gif", ".gif")),
+    (b"BM", ("image/bmp", ".bmp")),
+    (b"II*\x00", ("image/tiff", ".tiff")),
+    (b"MM\x00*", ("image/tiff", ".tiff"))
+]
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds its byte limit"""
+
+class UnsupportedUploadError(ValueError):
+    """Raised when an upload's content is not an accepted type"""
+
+def sniff_image_type(header: bytes) -> Optional[Tuple[str, str]]:
+    """
+    (media type, extension) of an image from its first bytes, or None
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+class Upload:
+    """
+    An uploaded file held in memory while small and in a temporary file
+    once it passes UPLOAD_SPOOL_MAX_SIZE, with its size, content hash and
+    sniffed type. Close it (or use it as a context manager) when done.
+    """
+
+    def __init__(self, filename: Optional[str], spool_max_size: int = UPLOAD_SPOOL_MAX_SIZE):
+        self.filename = filename
+        self.spool_max_size = spool_max_size
+        self.size = 0
+        self.media_type: Optional[str] = None
+        self.extension: Optional[str] = None
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._file = BytesIO()
+        self._map: Optional[mmap.mmap] = None
+        self.path: Optional[str] = None
+
+    def write(self, chunk: bytes):
+        if self.path is None and self.size + len(chunk) > self.spool_max_size:
+            # Roll over to disk, named so a worker process can open it
+            disk_file = tempfile.NamedTemporaryFile(prefix="upload_", dir=UPLOAD_TMP_DIR, delete=False)
+            disk_file.write(self._file.getbuffer())
+            self._file = disk_file
+            self.path = disk_file.name
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+    def view(self) -> memoryview:
+        """
+        Read-only view of the contents without copying them; memory-mapped when on disk
+        """
+        if self.path is None:
+            return self._file.getbuffer().toreadonly()
+        if self._map is None:
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        return memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    def open(self):
+        """
+        File-like object over the contents, positioned at the start
+        """
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def source(self) -> Union[str, bytes]:
+        """
+        What to hand a worker process: the file path when on disk,
+        so the contents are not pickled, otherwise the bytes
+        """
+        if self.path is not None:
+            self._file.flush()
+            return self.path
+        return self._file.getvalue()
+
+    def save(self, destination: str):
+        with open(destination, "wb") as f:
+            shutil.copyfileobj(self.open(), f, UPLOAD_CHUNK_SIZE)
+
+    def close(self):
+        try:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+        except BufferError:
+            # A view is still referenced; the memory goes when it does
+            pass
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "Upload":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+async def ingest_upload(file: UploadFile, max_bytes: int, require_image: bool = True) -> Upload:
+    """
+    Copy an UploadFile chunk by chunk into an Upload, stopping as soon as
+    it passes max_bytes. The type is sniffed from the content, the client's
+    content_type is not trusted.
+    """
+    upload = Upload(file.filename)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if upload.size + len(chunk) > max_bytes:
+                raise UploadTooLargeError(f"File exceeds {max_bytes // (1024 * 1024)} MB")
+            if upload.size == 0:
+                image_type = sniff_image_type(chunk[:16])
+                if require_image and image_type is None:
+                    raise UnsupportedUploadError("File must be an image")
+                if image_type:
+                    upload.media_type, upload.extension = image_type
+            upload.write(chunk)
+        if require_image and upload.size == 0:
+            raise UnsupportedUploadError("File must be an image")
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+class UploadLimitMiddleware:
+    """
+    Refuses request bodies over a per-path limit with 413 before they are
+    parsed: up front from Content-Length, or while streaming for chunked bodies.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = {path: limit + MULTIPART_OVERHEAD for path, limit in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds {(limit - MULTIPART_OVERHEAD) // (1024 * 1024)} MB"
+        content_length = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised from inside body parsing, turned into a response by the app
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
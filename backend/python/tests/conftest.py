@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Run from backend/python or the repository root alike
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET", "test-secret-test-secret-test-secret")
+
+# Stored as an ObjectId, as the Node backend creates users
+ADMIN_ID = "65a000000000000000000001"
+
+@pytest.fixture(scope="session")
+def database():
+    """
+    An in-memory chatware database behind db.mongodb.get_db_connection.
+    get_collection is left alone, so collections still pass through
+    budgeted() and are counted by the query budget.
+    """
+    mongomock = pytest.importorskip("mongomock")
+    from bson import ObjectId
+    import db.mongodb
+
+    database = mongomock.MongoClient()["chatware"]
+    original = db.mongodb.get_db_connection
+    db.mongodb.get_db_connection = lambda: database
+
+    now = datetime.now()
+    users = [ObjectId() for _ in range(6)]
+    database["users"].insert_one({"_id": ObjectId(ADMIN_ID), "name": "Admin", "email": "admin@chatware.com", "role": "super-admin", "status": "online", "createdAt": now, "lastSeen": now})
+    database["users"].insert_many([
+        {"_id": user, "name": f"User {index}", "email": f"user{index}@example.com", "role": "user", "status": "offline", "createdAt": now, "lastSeen": now}
+        for index, user in enumerate(users)
+    ])
+    chats = [
+        {"_id": ObjectId(), "chatName": "sender", "isGroupChat": False, "users": users[:2]},
+        {"_id": ObjectId(), "chatName": "Group", "isGroupChat": True, "users": users[:4], "groupAdmin": users[0]}
+    ]
+    database["chats"].insert_many(chats)
+    database["messages"].insert_many([
+        {"sender": users[index % 2], "chat": chats[index % 2]["_id"], "content": "hello there", "messageType": "text", "createdAt": now - timedelta(hours=index)}
+        for index in range(20)
+    ])
+    database["logs"].insert_many([{"action": "login", "user": str(user), "timestamp": now} for user in users])
+    database["calls"].insert_many([
+        {"call_id": f"call-{index}", "participants": [str(users[0]), str(users[1])], "call_type": "audio", "initiator": str(users[0]),
+         "status": "ended", "start_time": now - timedelta(days=index), "end_time": now - timedelta(days=index) + timedelta(minutes=5), "duration": 300}
+        for index in range(5)
+    ])
+    database.user_ids = [str(user) for user in users]
+    try:
+        yield database
+    finally:
+        db.mongodb.get_db_connection = original
+
+@pytest.fixture(scope="session")
+def client(database):
+    """
+    The app without its startup tasks, over the test database
+    """
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+@pytest.fixture
+def auth():
+    """
+    Authorization headers for a user ID, the admin's by default
+    """
+    from auth.auth_handler import sign_jwt
+
+    def headers(user_id: str = ADMIN_ID):
+        return {"Authorization": f"Bearer {sign_jwt(user_id)['access_token']}"}
+    return headers
+
+@pytest.fixture
+def query_budget():
+    """
+    Records the queries of each request made during a test, and fails any
+    request over the app's budget, e.g.
+
+        def test_chat_statistics(client, auth, query_budget):
+            client.get("/api/analytics/chat-statistics", headers=auth())
+            query_budget.assert_queries(max_operations=5)
+
+    Set query_budget.strict = False to assert on an endpoint known to be over.
+    """
+    from db.query_budget import QueryRecorder, recorders
+
+    recorder = QueryRecorder()
+    recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        recorders.remove(recorder)
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+import services.image_analysis
+from services.image_analysis import ImageAnalysisPool, ImageTooLargeError, analyze_image
+
+def test_timed_out_image_keeps_its_slot(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(services.image_analysis, "analyze_image", lambda source: release.wait(5))
+    pool = ImageAnalysisPool(workers=1, max_queue=0, timeout=0.05)
+    pool._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool._run(b"image")
+        # The worker is still busy, so the pool is too
+        assert pool.in_flight == 1
+        release.set()
+        for _ in range(100):
+            if pool.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.in_flight == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+def test_decompression_bomb_is_too_large(monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    # analyze_image sets the PIL limit itself, put it back afterwards
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", Image.MAX_IMAGE_PIXELS)
+    monkeypatch.setattr(services.image_analysis, "IMAGE_MAX_PIXELS", 100)
+    image = BytesIO()
+    Image.new("RGB", (20, 20)).save(image, "PNG")
+    # 400 pixels, over twice the limit, so PIL raises DecompressionBombError
+    with pytest.raises(ImageTooLargeError):
+        analyze_image(image.getvalue())
@@ -0,0 +1,13 @@
+from services.keyword_matcher import KeywordMatcher, RuleTable
+
+def test_unicode_case_variants_match_their_rule():
+    matcher = KeywordMatcher([["hi", "hello"], ["sad"], ["good morning"]])
+    # "ſ" (long s) and "İ" match case-insensitively, but lower() gives no keyword
+    assert matcher.match("I am ſad") == [1]
+    assert matcher.match("hİ there") == [0]
+    assert matcher.match("GOOD   Morning, no") == [2]
+    assert matcher.match("I know") == []
+
+def test_emoji_rules_suggest_for_unicode_text():
+    emoji_rules = RuleTable("emoji_rules.json")
+    assert emoji_rules.suggest("I am ſad") == emoji_rules.suggest("I am sad")
@@ -0,0 +1,14 @@
+from services.message_rollups import merge_keywords, rollup_updates
+
+def test_merged_keywords_keep_the_top():
+    stored = {f"word{index}": 10 for index in range(4)}
+    merged = merge_keywords(stored, {"word3": 5, "new": 30, "rare": 1}, limit=3)
+    assert merged == {"new": 30, "word3": 15, "word0": 10}
+
+def test_rollup_keywords_are_replaced_not_incremented():
+    group = {"messages": 1, "positive": 1, "negative": 0, "neutral": 0, "score": 0.5, "keywords": {"great": 1, "party": 1}}
+    stored = {"chat:2026-01-01": {"great": 4, "dinner": 3, "movie": 2}}
+    [update] = rollup_updates({("chat", "2026-01-01"): group}, stored, keywords_per_day=2)
+    document = update._doc
+    assert not any(key.startswith("keywords") for key in document["$inc"])
+    assert document["$set"]["keywords"] == {"great": 5, "dinner": 3}
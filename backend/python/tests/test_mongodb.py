@@ -0,0 +1,14 @@
+import db.mongodb
+from services.metrics import MongoCommandListener
+
+def test_client_accepts_command_listener(monkeypatch):
+    # Nothing listens on port 1; MongoClient connects in the background, so
+    # building it only validates the options, listeners included
+    monkeypatch.setattr(db.mongodb, "MONGO_URI", "mongodb://localhost:1/?serverSelectionTimeoutMS=100")
+    monkeypatch.setattr(db.mongodb, "_client", None)
+    client = db.mongodb.get_client()
+    try:
+        assert any(isinstance(listener, MongoCommandListener) for listener in client.options.event_listeners)
+        assert db.mongodb.get_client() is client
+    finally:
+        client.close()
@@ -0,0 +1,48 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from db.query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, QueryStats, budget_problems
+
+def test_chat_statistics_queries(client, auth, query_budget):
+    response = client.get("/api/analytics/chat-statistics", headers=auth())
+    assert response.status_code == 200
+    # Admin check, two counts and two aggregations
+    query_budget.assert_queries(max_operations=5, path="/api/analytics/chat-statistics")
+
+def test_user_activity_queries(client, auth, query_budget):
+    response = client.get("/api/analytics/user-activity", headers=auth())
+    assert response.status_code == 200
+    # Admin check, three aggregations and the user count
+    query_budget.assert_queries(max_operations=5, path="/api/analytics/user-activity")
+
+def test_call_history_queries(client, database, auth, query_budget):
+    response = client.get("/api/calls/call-history", headers=auth(database.user_ids[0]))
+    assert response.status_code == 200
+    assert len(response.json()["call_history"]) == 5
+    # The page and the total
+    query_budget.assert_queries(max_operations=2, path="/api/calls/call-history")
+
+def test_repeated_query_shape_is_reported():
+    stats = QueryStats()
+    for user_id in range(7):
+        stats.add("users", "find_one", {"_id": user_id}, 1)
+    stats.add("users", "find_one", {"_id": 0}, 1)
+    assert stats.repeated(5) == {"users.find_one {'_id': '?'}": 8}
+    assert stats.duplicates() == {"users.find_one {'_id': 0}": 2}
+    assert budget_problems(stats, max_operations=25, max_repeats=5) == ["8x users.find_one {'_id': '?'}"]
+
+def test_strict_recorder_fails_request_over_budget(database, query_budget):
+    from db.mongodb import get_collection
+
+    app = FastAPI()
+
+    @app.get("/users")
+    async def users():
+        get_collection("users").find_one({"_id": "a"})
+        get_collection("users").find_one({"_id": "b"})
+        return {}
+
+    app.add_middleware(QueryBudgetMiddleware, mode="warn", max_operations=1)
+    with pytest.raises(QueryBudgetExceeded):
+        TestClient(app).get("/users")
+    assert query_budget.last.stats.operations == 2
@@ -0,0 +1,25 @@
+import pytest
+from services.rooms import Room, RoomFullError, ROLE_HOST, ROLE_LISTENER, ROLE_SPEAKER
+
+async def _send(user_ids, message):
+    pass
+
+def test_listen_only_overflow_is_capped():
+    room = Room("call", _send, max_size=2, max_participants=3, overflow_policy="listen_only")
+    assert room.add("host", ROLE_HOST) == ROLE_HOST
+    assert room.add("a") == ROLE_SPEAKER
+    assert room.add("b") == ROLE_LISTENER
+    with pytest.raises(RoomFullError):
+        room.add("c")
+    assert len(room) == 3
+
+def test_room_keeps_exactly_one_host():
+    room = Room("call", _send)
+    room.add("host", ROLE_HOST)
+    room.add("a")
+    assert room.add("b", ROLE_HOST) == ROLE_SPEAKER
+    with pytest.raises(ValueError):
+        room.set_role("host", ROLE_SPEAKER)
+    with pytest.raises(ValueError):
+        room.set_role("a", ROLE_HOST)
+    assert room.host == "host"
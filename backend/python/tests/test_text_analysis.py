@@ -0,0 +1,34 @@
+from services.result_cache import ResultCache
+from services.text_analysis import Lexicon, TextAnalyzer
+
+TEXTS = [
+    "Thanks, the project meeting was great and the report looks amazing",
+    "This deadline is terrible, the report is late again",
+    "Thanks, the project meeting was great and the report looks amazing",
+    "ok",
+    "Café plans: coffee tomorrow, coffee later, coffee always"
+]
+
+def analyzer(namespace: str) -> TextAnalyzer:
+    return TextAnalyzer(Lexicon.from_file(), ResultCache(namespace, disk_path=None))
+
+def test_batch_matches_single_analysis(database):
+    chat_id = str(database["chats"].find_one()["_id"])
+    single, batch = analyzer("single"), analyzer("batch")
+    single.term_stats.build(chat_id)
+    batch.term_stats.build(chat_id)
+    for chat in (None, chat_id):
+        expected = [single.analyze(text, chat) for text in TEXTS]
+        assert batch.analyze_batch(TEXTS, chat) == expected
+    assert expected[0]["keyword_ranking"] == "tfidf"
+    assert expected[3]["keyword_ranking"] == "frequency"
+
+def test_batch_reuses_and_fills_the_cache():
+    text_analyzer = analyzer("shared")
+    first = text_analyzer.analyze(TEXTS[0])
+    results = text_analyzer.analyze_batch(TEXTS)
+    assert results[0] == results[2] == first
+    # Each distinct text was computed once and cached by the batch
+    assert text_analyzer.cache.hits == 1
+    assert text_analyzer.analyze(TEXTS[1]) == results[1]
+    assert text_analyzer.cache.hits == 2
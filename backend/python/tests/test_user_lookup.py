@@ -0,0 +1,22 @@
+import pytest
+from db.mongodb import id_filter
+
+@pytest.mark.parametrize("path", [
+    "/api/analytics/chat-statistics",
+    "/api/ai/cache-stats",
+    "/api/diagnostics/slow-requests",
+    "/api/users/sync"
+])
+def test_admin_with_objectid_is_found(client, auth, path):
+    # The admin is stored with an ObjectId _id, the token carries its string
+    assert client.get(path, headers=auth()).status_code == 200
+
+def test_user_statistics_of_a_node_user(client, database, auth):
+    user_id = database.user_ids[0]
+    response = client.get(f"/api/analytics/user-statistics/{user_id}", headers=auth(user_id))
+    assert response.status_code == 200
+    assert response.json()["user"]["id"] == user_id
+
+def test_id_filter_matches_both_forms(database):
+    assert database["users"].find_one({"_id": id_filter(database.user_ids[0])}) is not None
+    assert id_filter("not-an-objectid") == {"$in": ["not-an-objectid"]}